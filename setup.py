@@ -13,10 +13,13 @@ if sys.version_info < (2, 6):
 class UnitTest(Command):
     description = 'Discover and/or run unit tests.'
     user_options = [
-        ('tests=', 't', 'comma-delimited test sets (default all)')]
+        ('tests=', 't', 'comma-delimited test sets (default all)'),
+        ('backend=', 'b',
+         'hook configuration backend (default interpreter)')]
 
     def initialize_options(self):
         self.tests = None
+        self.backend = None
         if sys.version_info >= (2, 7):
             self.cmd = [sys.executable, '-m', 'unittest']
         else:
@@ -36,7 +39,13 @@ class UnitTest(Command):
                 self.cmd.append(tests)
         if self.verbose > 1: self.cmd.append('-v')
 
-        errno = subprocess.call(self.cmd)
+        # Run the hook scripts with the requested backend.
+        env = None
+        if self.backend:
+            import os
+            env = dict(os.environ, SVNHOOK_BACKEND=self.backend)
+
+        errno = subprocess.call(self.cmd, env=env)
         raise SystemExit(errno)
 
 # Subversion Hook Names
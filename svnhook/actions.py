@@ -11,6 +11,7 @@ import re
 import smtplib
 import sys, subprocess, shlex
 import textwrap
+import time
 
 logger = logging.getLogger()
 
@@ -63,22 +64,22 @@ class ExecuteCmd(Action):
         self.errorlevel = int(
             self.thistag.get('errorLevel', default=1))
 
+        # Get the execution mode. A co-process is started once per
+        # hook run, and sent a request for each execution.
+        self.mode = self.thistag.get('mode', default='process')
+        if self.mode not in ['process', 'coprocess']:
+            raise ValueError('Illegal mode attribute: {0}'
+                             .format(self.mode))
+
     def run(self):
         """Execute a system command line.
 
         Returns: Masked exit code of the action.
         """
-        # Apply tokens to the command line.
-        cmdline = self.expand(self.cmdline)
+        if self.mode == 'coprocess': return self.run_coprocess()
 
-        # Get the command line fields. On Windows, the shell split
-        # function has a nasty habit of decoding escapes
-        # (backslashes). Avoid messing up Windows path delimiters by
-        # escaping them.
-        if sys.platform.startswith('win'):
-            cmd = shlex.split(re.sub(r'\\', r'\\\\', cmdline))
-        else:
-            cmd = shlex.split(cmdline)
+        # Apply tokens to the command line, and get its fields.
+        cmd = self.split(self.expand(self.cmdline))
 
         # Execute the command. If the process fails to start, it'll
         # throw an OSError. Treat that as a non-maskable hook failure.
@@ -97,17 +98,70 @@ class ExecuteCmd(Action):
         p.wait()
 
         # Compare the process exit code to the error level.
-        if p.returncode >= self.errorlevel:
-            errstr = p.stderr.read()
+        return self.check_exit_code(p.returncode, p.stderr)
+
+    def run_coprocess(self):
+        """Send a request to a long-running command. The leading
+        command line fields without tokens start the co-process. The
+        rest, with the tokens applied, make up the request.
+
+        Returns: Masked exit code of the action.
+        """
+        fields = self.split(self.cmdline)
+        count = 0
+        while count < len(fields) and '${' not in fields[count]:
+            count += 1
+        if count == 0:
+            raise ValueError('Co-process command missing: ExecuteCmd')
+
+        # If the process fails to start or to respond, treat that as a
+        # non-maskable hook failure.
+        coprocess = self.context.get_coprocess(fields[:count])
+        request = [self.expand(field) for field in fields[count:]]
+        logger.debug('request={0}, errorlevel={1}'
+                     .format(request, self.errorlevel))
+        returncode, errstr = coprocess.request(request)
+        self.context.count('coprocess_requests')
+
+        # Compare the response exit code to the error level.
+        return self.check_exit_code(returncode, errstr)
+
+    def split(self, cmdline):
+        """Get the fields of a command line. On Windows, the shell
+        split function has a nasty habit of decoding escapes
+        (backslashes). Avoid messing up Windows path delimiters by
+        escaping them.
+
+        Args:
+          cmdline: Command line text.
+
+        Returns: List of command line fields.
+        """
+        if sys.platform.startswith('win'):
+            return shlex.split(re.sub(r'\\', r'\\\\', cmdline))
+        return shlex.split(cmdline)
+
+    def check_exit_code(self, returncode, errstr):
+        """Compare a command exit code to the error level. When it
+        signals a failure, pass the error message on to the client.
+
+        Args:
+          returncode: Exit code of the command.
+          errstr: Error message, or the file to read it from.
+
+        Returns: Masked exit code of the action.
+        """
+        if returncode >= self.errorlevel:
+            if hasattr(errstr, 'read'): errstr = errstr.read()
             logger.error(errstr)
 
             # Output the client message.
             sys.stderr.write(errstr)
 
             # Return the terminal exit code.
-            return p.returncode
+            return returncode
         else:
-            logger.debug('exit code={0}'.format(p.returncode))
+            logger.debug('exit code={0}'.format(returncode))
 
         # Indicate a non-terminal action.
         return 0
@@ -253,6 +307,7 @@ class _SendSmtp(Action):
             content += '{0}\r\n'.format(msgline)
 
         # Construct the SMTP connection.
+        started = time.time()
         server = smtplib.SMTP(host, port, None, self.timeout)
 
         # Send the message. Log warnings for unknown recipients.
@@ -265,6 +320,8 @@ class _SendSmtp(Action):
 
         # Disconnect from the host.
         server.quit()
+        self.context.count('smtp_sends')
+        self.context.count('smtp_send_seconds', time.time() - started)
 
         # Indicate a non-terminal action.
         return 0
@@ -0,0 +1,401 @@
+"""Persistent Hook Cache Classes
+
+Provide repository-local stores for data that can be shared between
+hook runs.
+"""
+__version__ = '3.00'
+__all__     = ['CacheStore', 'FilterStats', 'RevisionCache', 'ScanCache',
+               'TxnCache']
+
+import cPickle as pickle
+import logging
+import os
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger()
+
+class CacheStore(object):
+    """SQLite Cache Store Base Class
+
+    Each derived class keeps its entries in a separate database file
+    within the cache directory. Subversion may run several hooks for
+    the same repository at once, so all access goes through SQLite
+    locking.
+    """
+
+    # Table definition statements. Provided by the derived classes.
+    schema = None
+
+    def __init__(self, cachedir, name):
+        """Open (or create) a cache database.
+
+        Args:
+          cachedir: Path name of the cache directory.
+          name: Base file name of the cache database.
+        """
+        # If needed, create the cache directory.
+        if not os.path.isdir(cachedir): os.makedirs(cachedir)
+
+        # Open the database. Wait a while for concurrent hook runs to
+        # release their locks.
+        self.dbpath = os.path.join(cachedir, name + '.db')
+        self.db = sqlite3.connect(self.dbpath, timeout=10)
+        self.db.text_factory = str
+
+        # Make sure that the cache tables exist.
+        with self.db:
+            self.db.executescript(self.schema)
+
+    def close(self):
+        """Close the cache database."""
+        self.db.close()
+
+class FilterStats(CacheStore):
+    """Filter Condition Statistics
+
+    Keep running totals of how often each kind of filter condition was
+    checked, how often it passed, and how long the checks took. These
+    guide the reordering of nested filters.
+    """
+
+    schema = 'CREATE TABLE IF NOT EXISTS filters ('\
+        'name TEXT PRIMARY KEY, checks INTEGER, passes INTEGER, '\
+        'seconds REAL)'
+
+    def __init__(self, cachedir):
+        super(FilterStats, self).__init__(cachedir, 'filters')
+
+    def get(self):
+        """Get the recorded statistics.
+
+        Returns: Dictionary of [checks, passes, seconds] lists, by
+        filter class name.
+        """
+        try:
+            rows = self.db.execute(
+                'SELECT name, checks, passes, seconds FROM filters'
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning('Filter statistics lookup failed: {0}'
+                           .format(e))
+            return dict()
+        return dict((row[0], list(row[1:])) for row in rows)
+
+    def add(self, stats):
+        """Add to the recorded statistics.
+
+        Args:
+          stats: Dictionary of [checks, passes, seconds] lists, by
+            filter class name.
+        """
+        try:
+            with self.db:
+                for name, (checks, passes, seconds) in stats.items():
+                    self.db.execute(
+                        'INSERT OR IGNORE INTO filters '\
+                            'VALUES (?, 0, 0, 0.0)', (name,))
+                    self.db.execute(
+                        'UPDATE filters SET checks = checks + ?, '\
+                            'passes = passes + ?, '\
+                            'seconds = seconds + ? WHERE name = ?',
+                        (checks, passes, seconds, name))
+        except sqlite3.Error as e:
+            logger.warning('Filter statistics update failed: {0}'
+                           .format(e))
+
+class RevisionCache(CacheStore):
+    """Committed Revision Data Cache
+
+    Hold the repository data gathered for committed revisions, so
+    that later hook runs for the same revision don't ask svnlook
+    again. The data of a revision never changes - except for the
+    revision properties. Those entries are dropped by the
+    post-revprop-change hook, so it must use the same cache
+    directory. The least recently used entries are dropped when the
+    cache is full.
+    """
+
+    schema = 'CREATE TABLE IF NOT EXISTS revisions ('\
+        'revision INTEGER, name TEXT, data BLOB, size INTEGER, '\
+        'used REAL, PRIMARY KEY (revision, name));'\
+        'CREATE INDEX IF NOT EXISTS revisions_used ON revisions (used);'
+
+    # Names of the entries that hold revision property data.
+    revprops = ['author', 'logmsg', 'logs']
+
+    # Maximum number of bytes of cached data.
+    maxbytes = 64 * 1024 * 1024
+
+    def __init__(self, cachedir):
+        super(RevisionCache, self).__init__(cachedir, 'revisions')
+
+    def get(self, revision):
+        """Look up the cached data of a revision.
+
+        Args:
+          revision: Revision number.
+
+        Returns: Dictionary of cached context data.
+        """
+        try:
+            with self.db:
+                rows = self.db.execute(
+                    'SELECT name, data FROM revisions '\
+                        'WHERE revision = ?', (int(revision),)).fetchall()
+                if rows:
+                    self.db.execute(
+                        'UPDATE revisions SET used = ? '\
+                            'WHERE revision = ?',
+                        (time.time(), int(revision)))
+        except sqlite3.Error as e:
+            logger.warning('Revision cache lookup failed: {0}'
+                           .format(e))
+            return dict()
+
+        return dict((name, pickle.loads(str(data)))
+                    for name, data in rows)
+
+    def put(self, revision, data):
+        """Save the data of a revision. Entries that are already
+        cached are kept as they are.
+
+        Args:
+          revision: Revision number.
+          data: Dictionary of cached context data.
+        """
+        now = time.time()
+        try:
+            with self.db:
+                cached = set(name for (name,) in self.db.execute(
+                        'SELECT name FROM revisions '\
+                            'WHERE revision = ?', (int(revision),)))
+                for name, value in data.items():
+                    if name in cached: continue
+                    blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                    self.db.execute(
+                        'INSERT OR IGNORE INTO revisions '\
+                            'VALUES (?, ?, ?, ?, ?)',
+                        (int(revision), name, sqlite3.Binary(blob),
+                         len(blob), now))
+                self.evict()
+        except sqlite3.Error as e:
+            logger.warning('Revision cache update failed: {0}'
+                           .format(e))
+
+    def evict(self):
+        """Drop the least recently used entries, until the cached data
+        fits within the size limit."""
+        total = self.db.execute(
+            'SELECT SUM(size) FROM revisions').fetchone()[0] or 0
+        if total <= self.maxbytes: return
+
+        stale = []
+        for rowid, size in self.db.execute(
+                'SELECT rowid, size FROM revisions ORDER BY used'):
+            if total <= self.maxbytes: break
+            stale.append((rowid,))
+            total -= size
+        self.db.executemany(
+            'DELETE FROM revisions WHERE rowid = ?', stale)
+
+    def drop_revprops(self, revision):
+        """Drop the revision property entries of a revision.
+
+        Args:
+          revision: Revision number.
+        """
+        try:
+            with self.db:
+                self.db.execute(
+                    'DELETE FROM revisions WHERE revision = ? '\
+                        'AND name IN ({0})'.format(
+                        ', '.join('?' * len(self.revprops))),
+                    [int(revision)] + self.revprops)
+        except sqlite3.Error as e:
+            logger.warning('Revision cache update failed: {0}'
+                           .format(e))
+
+class ScanCache(CacheStore):
+    """Content Scan Result Cache
+
+    Remember whether file content matched a regular expression. The
+    entries are keyed by content checksum and expression fingerprint,
+    so identical content is only scanned once - whatever its path or
+    revision. When the cache has grown too large, the least recently
+    used entries are dropped. That's checked when the cache is closed,
+    at most once per eviction period.
+    """
+
+    schema = 'CREATE TABLE IF NOT EXISTS scans ('\
+        'key TEXT PRIMARY KEY, found INTEGER, size INTEGER, '\
+        'used REAL);'\
+        'CREATE INDEX IF NOT EXISTS scans_used ON scans (used);'\
+        'CREATE TABLE IF NOT EXISTS evictions (evicted REAL);'
+
+    # Maximum number of bytes of cached keys.
+    maxbytes = 16 * 1024 * 1024
+
+    # Storage overhead of each entry, in bytes.
+    entrybytes = 32
+
+    # Minimum number of seconds between eviction checks.
+    evictperiod = 60 * 60
+
+    def __init__(self, cachedir):
+        super(ScanCache, self).__init__(cachedir, 'scans')
+        self.added = 0
+
+    def get(self, key):
+        """Look up a scan result.
+
+        Args:
+          key: Content checksum and expression fingerprint.
+
+        Returns: True if the content matched, False if it didn't, or
+        None when the result isn't known.
+        """
+        try:
+            with self.db:
+                row = self.db.execute(
+                    'SELECT found FROM scans WHERE key = ?',
+                    (key,)).fetchone()
+                if row == None: return None
+                self.db.execute(
+                    'UPDATE scans SET used = ? WHERE key = ?',
+                    (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning('Scan cache lookup failed: {0}'.format(e))
+            return None
+
+        return row[0] != 0
+
+    def put(self, key, found):
+        """Save a scan result.
+
+        Args:
+          key: Content checksum and expression fingerprint.
+          found: Content match flag.
+        """
+        try:
+            with self.db:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?)',
+                    (key, int(found), len(key) + self.entrybytes,
+                     time.time()))
+            self.added += 1
+        except sqlite3.Error as e:
+            logger.warning('Scan cache update failed: {0}'.format(e))
+
+    def evict(self):
+        """Drop the least recently used entries, until the cached keys
+        fit within the size limit. Skip the check, if it was made
+        recently.
+        """
+        now = time.time()
+        with self.db:
+            last = self.db.execute(
+                'SELECT MAX(evicted) FROM evictions').fetchone()[0]
+            if last != None and now - last < self.evictperiod: return
+            self.db.execute('DELETE FROM evictions')
+            self.db.execute('INSERT INTO evictions VALUES (?)', (now,))
+
+            total = self.db.execute(
+                'SELECT SUM(size) FROM scans').fetchone()[0] or 0
+            if total <= self.maxbytes: return
+
+            stale = []
+            for rowid, size in self.db.execute(
+                    'SELECT rowid, size FROM scans ORDER BY used'):
+                if total <= self.maxbytes: break
+                stale.append((rowid,))
+                total -= size
+            self.db.executemany(
+                'DELETE FROM scans WHERE rowid = ?', stale)
+
+    def close(self):
+        """Check the cache size, if entries were added. Then close
+        the cache database."""
+        if self.added:
+            try:
+                self.evict()
+            except sqlite3.Error as e:
+                logger.warning('Scan cache eviction failed: {0}'
+                               .format(e))
+        super(ScanCache, self).close()
+
+class TxnCache(CacheStore):
+    """Transaction Context Cache
+
+    Hold the repository data gathered by a pre-commit hook, so that
+    the post-commit hook for the resulting revision can use it instead
+    of asking svnlook again.
+    """
+
+    schema = 'CREATE TABLE IF NOT EXISTS transactions ('\
+        'name TEXT PRIMARY KEY, created REAL, data BLOB)'
+
+    # Seconds to keep entries for transactions that never completed.
+    maxage = 24 * 60 * 60
+
+    def __init__(self, cachedir):
+        super(TxnCache, self).__init__(cachedir, 'transactions')
+
+    def put(self, txnname, data):
+        """Save the context data for a transaction.
+
+        Args:
+          txnname: Name of the transaction.
+          data: Dictionary of cached context data.
+        """
+        now = time.time()
+        blob = sqlite3.Binary(
+            pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO transactions VALUES (?, ?, ?)',
+                (txnname, now, blob))
+
+            # Drop the leftovers of aborted transactions.
+            self.db.execute(
+                'DELETE FROM transactions WHERE created < ?',
+                (now - self.maxage,))
+
+        logger.debug('Cached context for transaction "{0}".'
+                     .format(txnname))
+
+    def pop(self, txnname, revision):
+        """Remove and return the context data for a transaction.
+
+        Args:
+          txnname: Name of the transaction.
+          revision: Number of the revision the transaction became.
+
+        Returns: Dictionary of cached context data, or None when the
+        transaction isn't known or doesn't map to the revision.
+        """
+        with self.db:
+            row = self.db.execute(
+                'SELECT data FROM transactions WHERE name = ?',
+                (txnname,)).fetchone()
+            if row == None: return None
+            self.db.execute(
+                'DELETE FROM transactions WHERE name = ?',
+                (txnname,))
+
+        # FSFS transaction names start with the base revision. The
+        # completed revision must be newer than that.
+        base = re.match(r'(\d+)-', txnname)
+        if base and int(base.group(1)) >= int(revision):
+            logger.warning(
+                'Transaction "{0}" does not map to revision {1}.'\
+                    .format(txnname, revision))
+            return None
+
+        logger.debug('Adopted context of transaction "{0}".'
+                     .format(txnname))
+        return pickle.loads(str(row[0]))
+
+########################### end of file ##############################
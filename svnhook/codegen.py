@@ -0,0 +1,283 @@
+"""Hook Configuration Compiler
+
+Translate a hook configuration into a Python module, in which each
+filter element becomes a function that runs its child actions
+directly. The interpreter looks up and checks the child handlers of
+a filter every time the filter passes. The generated functions only
+construct and run them; the handler classes are bound once, when the
+module is loaded.
+
+The conditions of the simple regular expression filters (user,
+author, log message and path) are generated inline, as conditionals
+around the code of their child actions. Their expressions are
+compiled once, when the module is loaded, so these filters aren't
+constructed at all.
+
+The compiled module is cached as bytecode next to the configuration
+file. The cache is keyed by a hash of the configuration text and of
+the compiler sources, so editing either one replaces it.
+"""
+__version__ = '3.00'
+__all__     = ['Compiler']
+
+from filters import Filter, RegexTag, get_action, get_invariants, \
+    internal_error
+import actions, filters
+
+import hashlib
+import imp
+import logging
+import marshal
+import os
+import re
+import sys
+
+logger = logging.getLogger()
+
+class Compiler(object):
+    """Hook Configuration Compiler"""
+
+    # File name suffix of the bytecode cache.
+    suffix = '.pyc'
+
+    # Hash of the modules that the generated code depends on. Set
+    # when first needed.
+    sourcehash = None
+
+    # Filters with conditions that are generated inline: the regular
+    # expression tag, its flags, the expression for the text to
+    # compare, the comparison method, and the token set to the text
+    # for the child actions.
+    inline = {
+        'FilterUser': ('UserRegex', re.IGNORECASE,
+                       "context.tokens['User']", 'match', None),
+        'FilterAuthor': ('AuthorRegex', re.IGNORECASE,
+                         'context.get_author()', 'search', 'Author'),
+        'FilterLogMsg': ('LogMsgRegex', 0,
+                         'context.get_log_message()', 'search', 'LogMsg'),
+        'FilterPath': ('PathRegex', 0,
+                       "context.tokens['Path']", 'search', None)}
+
+    def __init__(self, cfgfile, roottag):
+        """Prepare to compile a hook configuration.
+
+        Args:
+          cfgfile: Path name of the configuration file.
+          roottag: Root element of the parsed configuration.
+        """
+        self.cfgfile = cfgfile
+        self.roottag = roottag
+        self.cachefile = cfgfile + self.suffix
+
+    def get_hash(self):
+        """Get the cache key of the configuration. Changes to the
+        compiler, or to the filters it relies on, also change the
+        key.
+
+        Returns: Hexadecimal digest string.
+        """
+        digest = hashlib.sha1(self.get_source_hash())
+        with open(self.cfgfile, 'rb') as f: digest.update(f.read())
+        return digest.hexdigest()
+
+    @classmethod
+    def get_source_hash(cls):
+        """Get the hash of the compiler, filter and action sources.
+        Where only the bytecode is installed, that's hashed instead.
+
+        Returns: Hexadecimal digest string.
+        """
+        if cls.sourcehash == None:
+            digest = hashlib.sha1(__version__)
+            for module in [sys.modules[__name__], filters, actions]:
+                path = os.path.splitext(module.__file__)[0] + '.py'
+                if not os.path.isfile(path): path = module.__file__
+                with open(path, 'rb') as f: digest.update(f.read())
+            cls.sourcehash = digest.hexdigest()
+        return cls.sourcehash
+
+    def get_tags(self):
+        """Get the configuration elements in document order.
+
+        Returns: List of elements.
+        """
+        if hasattr(self.roottag, 'iter'):
+            return list(self.roottag.iter())
+        return list(self.roottag.getiterator())
+
+    def get_source(self):
+        """Generate the Python module. Elements are referred to by
+        their position in document order.
+
+        Returns: Module source text.
+        """
+        tags = self.get_tags()
+        self.positions = dict((tag, i) for i, tag in enumerate(tags))
+        self.invariants = get_invariants(self.roottag)
+        self.classes = set()
+        self.regexes = []
+
+        lines = ['# Generated from {0}. Do not edit.'
+                 .format(os.path.basename(self.cfgfile))]
+        functions = []
+
+        for i, tag in enumerate(tags):
+            action = get_action(tag.tag)
+            if i > 0 and not (action and issubclass(action, Filter)):
+                continue
+
+            # Filters that are inlined into their parent's function
+            # don't need one of their own.
+            if i > 0 and self.get_inline(tag): continue
+
+            # Run the child actions in order, until one of them sets
+            # a non-zero exit code.
+            body = self.get_body(tag, 2)
+            functions.append(i)
+            lines += ['', 'def run_{0}(self):'.format(i),
+                      '    # {0}'.format(tag.tag)]
+            if not body:
+                lines.append('    return 0')
+                continue
+            lines += ['    context = self.context', '    try:']
+            lines += body
+            lines += ['    except Exception as e:',
+                      '        return internal_error(e)',
+                      '    return 0']
+
+        # Bind the handler classes, and compile the inlined regular
+        # expressions, once, when the module is loaded.
+        header = ['{0} = get_action({0!r})'.format(name)
+                  for name in sorted(self.classes)]
+        header += ['regex_{0} = RegexTag(tags[{0}], {1})'.format(
+                    position, flags)
+                   for position, flags in sorted(self.regexes)]
+        lines[1:1] = [''] + header
+        lines += ['', 'runners = {{{0}}}'.format(', '.join(
+                    '{0}: run_{0}'.format(i) for i in functions)), '']
+        return '\n'.join(lines)
+
+    def get_inline(self, tag):
+        """Get the inline condition details of a filter element. Only
+        filters with a usable regular expression tag are inlined.
+        Loop-invariant filters are shared instead.
+
+        Args:
+          tag: Filter element.
+
+        Returns: Tuple of the details, as in the inline dictionary,
+        with the regular expression tag first - or None.
+        """
+        if tag.tag not in self.inline or tag in self.invariants:
+            return None
+        details = self.inline[tag.tag]
+
+        # Leave any configuration errors to the filter class.
+        regextag = tag.find(details[0])
+        if regextag == None: return None
+        try:
+            RegexTag(regextag, details[1])
+        except (ValueError, re.error):
+            return None
+        return (regextag,) + details[1:]
+
+    def get_body(self, tag, depth):
+        """Generate the statements that run the child actions of an
+        element. Each one returns from the function, as soon as an
+        action sets a non-zero exit code.
+
+        Args:
+          tag: Parent element.
+          depth: Indentation level of the statements.
+
+        Returns: List of source lines.
+        """
+        indent = '    ' * depth
+        body = []
+        for childtag in list(tag):
+            child = get_action(childtag.tag)
+            if not child: continue
+            position = self.positions[childtag]
+
+            # Check an inlined filter condition, and run its child
+            # actions in place.
+            inline = self.get_inline(childtag)
+            if inline:
+                regextag, flags, text, method, token = inline
+                regexpos = self.positions[regextag]
+                self.regexes.append((regexpos, flags))
+                body += [indent + '# {0}'.format(childtag.tag),
+                         indent + 'text = {0}'.format(text),
+                         indent + 'if regex_{0}.{1}(text):'.format(
+                             regexpos, method)]
+                if token:
+                    body.append(indent + "    context.tokens['{0}']"
+                                ' = text'.format(token))
+                body += self.get_body(childtag, depth + 1) \
+                    or [indent + '    pass']
+                continue
+
+            # Construct and run any other action.
+            self.classes.add(child.__name__)
+            if childtag in self.invariants:
+                call = 'self.construct({0}, tags[{1}])'
+            else:
+                call = '{0}(context, tags[{1}])'
+            call = call.format(child.__name__, position)
+            body += [indent + 'exitcode = {0}.run()'.format(call),
+                     indent + 'if exitcode != 0: return exitcode']
+        return body
+
+    def get_code(self):
+        """Get the compiled module, from the cache if it's current.
+        Otherwise, compile it and try to replace the cache.
+
+        Returns: Module code object.
+        """
+        key = self.get_hash()
+        header = imp.get_magic() + key
+
+        try:
+            with open(self.cachefile, 'rb') as f:
+                if f.read(len(header)) == header:
+                    return marshal.load(f)
+        except (EnvironmentError, EOFError, ValueError, TypeError):
+            pass
+
+        code = compile(self.get_source(), self.cachefile, 'exec')
+
+        # Replace the cache in one step, so that concurrent hook runs
+        # never read a partial file.
+        temppath = '{0}.{1}.tmp'.format(self.cachefile, os.getpid())
+        try:
+            with open(temppath, 'wb') as f:
+                f.write(header)
+                marshal.dump(code, f)
+            try:
+                os.rename(temppath, self.cachefile)
+            except OSError:
+                # Windows won't rename over an existing file.
+                os.remove(self.cachefile)
+                os.rename(temppath, self.cachefile)
+        except EnvironmentError as e:
+            logger.warning('Compiled configuration not cached: {0}'
+                           .format(e))
+            if os.path.isfile(temppath): os.remove(temppath)
+        return code
+
+    def get_runners(self):
+        """Load the compiled module.
+
+        Returns: Dictionary of child action functions, by filter
+        element.
+        """
+        namespace = {'RegexTag': RegexTag,
+                     'get_action': get_action,
+                     'internal_error': internal_error,
+                     'tags': self.get_tags()}
+        exec self.get_code() in namespace
+        tags = namespace['tags']
+        return dict((tags[i], runner)
+                    for i, runner in namespace['runners'].items())
+
+########################### end of file ##############################
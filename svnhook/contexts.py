@@ -2,27 +2,83 @@
 __version__ = '3.00'
 __all__     = ['CtxStandard', 'CtxRevision', 'CtxTransaction', 'Tokens']
 
+from caches import RevisionCache, ScanCache
+from fsfs import FsfsReader
+
+import errno
 import logging
+import multiprocessing
+import os
 import re
 import shlex, subprocess
+import sys, threading, time, Queue
+from array import array
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 logger = logging.getLogger()
 
 class Context(object):
     """Base Class for Hook Context"""
 
+    # Attributes holding cached repository data.
+    cachenames = ['author', 'changes', 'diffs', 'filesizes', 'logmsg',
+                  'properties']
+
+    # Number of leading content bytes checked for binary data.
+    sniffsize = 8192
+
+    # Profiler of the hook run. Set by the hook handler, when
+    # profiling is enabled.
+    profiler = None
+
+    # Filter condition statistics of the hook run. Set by the hook
+    # handler, when filters are reordered.
+    filterstats = None
+
+    # Compiled child action functions, by filter element. Set by the
+    # hook handler, when the compiled backend is used.
+    runners = None
+
+    # Methods that get the run-wide repository data, by kind. The
+    # change list and the differences aren't preloaded. They can be
+    # large, and the filters stream them as they go.
+    preloaders = {'author': 'get_author', 'logmsg': 'get_log_message'}
+
     def __init__(self, tokens):
         """Create a tag context.
 
         Args:
           tokens: Set of base tokens.
         """
-        # Create a deep copy of the tokens.
-        self.tokens = Tokens(tokens)
+        # Layer the context tokens over the given ones, rather than
+        # copying them.
+        if isinstance(tokens, Tokens):
+            self.tokens = tokens.push()
+        else:
+            self.tokens = Tokens(tokens)
 
         # All of the hooks provide this. Simplify access.
         self.repospath = tokens['ReposPath']
 
+        # Directory of the persistent caches. Set by the hook handler,
+        # when caching is configured.
+        self.cachedir = None
+
+        # Loop-invariant filter elements, and their shared instances.
+        # Set by the hook handler.
+        self.invariants = dict()
+
+        # Repository access statistics, by name.
+        self.stats = dict()
+        self.statslock = threading.Lock()
+
         # Transform the repository path into a file protocol URL.
         # This is needed to utilize regular "svn" commands.
         if self.repospath[:1] == '/':
@@ -31,6 +87,24 @@ class Context(object):
             self.reposurl = 'file:///'\
                 + re.sub(r'\\', r'/', self.repospath)
 
+    @contextmanager
+    def token_frame(self, data):
+        """Scope a set of tokens to a block. The given tokens are
+        dropped at its end. Any other tokens set within the block are
+        kept.
+
+        Args:
+          data: Dictionary of frame tokens.
+
+        Yields: Token frame. The frame sees the enclosing tokens, and
+        changes to tokens outside the frame go to them.
+        """
+        frame = self.tokens = self.tokens.push(data, framed=True)
+        try:
+            yield frame
+        finally:
+            self.tokens = frame.parent
+
     def expand(self, text, depth=1):
         """Expand tokens found in a string.
 
@@ -69,37 +143,107 @@ class Context(object):
         # Try another level of expansion.
         return self.expand(text, depth + 1)
 
-    def execute(self, cmd):
-        """Execute a system call.
+    def start(self, cmd):
+        """Start a system call, with piped output.
 
         Args:
           cmd: Command and arguments to execute.
 
-        Returns: Output produced by the command.
+        Returns: Process object of the running command.
         """
         cmd = [str(field) for field in cmd]
         logger.debug('Execute: {0}'.format(cmd))
+        if cmd[0] == 'svnlook': self.count('svnlook_calls')
         try:
-            p = subprocess.Popen(cmd,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE,
-                                 shell=False)
+            return subprocess.Popen(cmd,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    shell=False)
         except Exception as e:
             logger.error(e)
             raise e
 
-        # The process started, wait for it to finish.
-        p.wait()
+    def execute(self, cmd):
+        """Execute a system call. When profiling, the command is
+        timed as a span of its own.
+
+        Args:
+          cmd: Command and arguments to execute.
+
+        Returns: Output produced by the command.
+        """
+        if self.profiler:
+            with self.profiler.span(' '.join(cmd[:2])):
+                return self.communicate(cmd)
+        return self.communicate(cmd)
+
+    def communicate(self, cmd):
+        """Execute a system call, and collect its output.
+
+        Args:
+          cmd: Command and arguments to execute.
+
+        Returns: Output produced by the command.
+        """
+        p = self.start(cmd)
+
+        # The process started, collect its output while waiting for
+        # it to finish. (Large outputs would fill the pipes, if only
+        # waiting.)
+        outstr, errstr = p.communicate()
 
         # Handle errors returned by the command.
         if p.returncode != 0:
-            errstr = p.stderr.read().strip()
-            msg = 'Command failed: {0}: {1}'.format(cmd, errstr)
+            msg = 'Command failed: {0}: {1}'.format(
+                [str(field) for field in cmd], errstr.strip())
             logger.error(msg)
             raise RuntimeError(msg)
 
         # Return the STDOUT content.
-        return p.stdout.read().strip()
+        return outstr.strip()
+
+    def get_coprocess(self, cmd):
+        """Get the co-process for a command. It's started when first
+        needed, and stays up until the context is closed.
+
+        Args:
+          cmd: Command and arguments to start.
+
+        Returns: Co-process object.
+        """
+        if not hasattr(self, 'coprocesses'): self.coprocesses = dict()
+        key = tuple(str(field) for field in cmd)
+        if key not in self.coprocesses:
+            self.coprocesses[key] = Coprocess(key)
+            self.count('coprocess_starts')
+        return self.coprocesses[key]
+
+    def count(self, name, amount=1):
+        """Add to a repository access statistic.
+
+        Args:
+          name: Name of the statistic.
+          amount: Amount to add.
+        """
+        with self.statslock:
+            self.stats[name] = self.stats.get(name, 0) + amount
+
+    def get_cache(self):
+        """Get the repository data cached by this context.
+
+        Returns: Dictionary of cached attribute values.
+        """
+        return dict((name, getattr(self, name))
+                    for name in self.cachenames if hasattr(self, name))
+
+    def set_cache(self, cache):
+        """Adopt repository data cached by another context.
+
+        Args:
+          cache: Dictionary of cached attribute values.
+        """
+        for name, value in cache.items():
+            if name in self.cachenames: setattr(self, name, value)
 
     def get_author(self, options=[]):
         """Get the author of repository changes.
@@ -110,7 +254,9 @@ class Context(object):
         Returns: Output produced by the command.
         """
         # If available, use the cached author.
-        if hasattr(self, 'author'): return self.author
+        if hasattr(self, 'author'):
+            self.count('fetches_avoided')
+            return self.author
 
         # Get the change author.
         self.author = self.execute(
@@ -127,49 +273,562 @@ class Context(object):
 
         Returns: Output produced by the command.
         """
+        # If needed, read the whole change listing. That caches it.
+        if not hasattr(self, 'changes'):
+            for item in Context.iter_changes(self, options): pass
+
+        # Return the cached list.
+        return self.changes
+
+    def iter_changes(self, options=[]):
+        """Iterate over the repository changes.
+
+        Unless the list of changes is already cached, the svnlook
+        output is parsed as it arrives. The list is only cached if
+        the iteration is completed. Stopping early ends the svnlook
+        process.
+
+        Replacements are found as the delete and add lines for a path
+        are read. So, the "replaced" flag of an item may only be set
+        after it's been produced.
+
+        Args:
+          options: Svnlook command options.
+
+        Returns: Generator of change items.
+        """
         # If available, use the cached list of changes.
-        if hasattr(self, 'changes'): return self.changes
+        if hasattr(self, 'changes'):
+            for item in self.changes: yield item
+            return
+
+        # Start the change listing. Include the copy sources.
+        cmd = ['svnlook', 'changed', '--copy-info', self.repospath]\
+            + options
+        p = self.start(cmd)
+
+        changes = []
+        edits = dict()
+        delimidx = None
+        completed = False
+        try:
+            for chgline in p.stdout:
+                chgline = chgline.rstrip('\r\n')
+                if not chgline: continue
+
+                # A copy source line follows the copied path line.
+                # Only produce an item once its source is known.
+                if chgline.startswith(' '):
+                    if changes: changes[-1].set_source(chgline)
+                    continue
+                if changes: yield changes[-1]
+
+                # Use the first change line format for all lines.
+                if delimidx == None:
+                    delimidx = ChangeItem.get_delimidx(chgline)
+                item = ChangeItem(chgline, delimidx)
+                changes.append(item)
+
+                # Only remember the items added and deleted. If a
+                # path is both, it's a replacement.
+                edit = item.flags & (ChangeItem.ADD | ChangeItem.DELETE)
+                if edit:
+                    other = edits.setdefault(item.path, item)
+                    if other.flags & edit == 0:
+                        other.replaced = item.replaced = True
+
+            # Produce the last item.
+            if changes: yield changes[-1]
+
+            # The listing is complete. Check how it ended.
+            errstr = p.stderr.read()
+            p.wait()
+            if p.returncode != 0:
+                msg = 'Command failed: {0}: {1}'.format(
+                    [str(field) for field in cmd], errstr.strip())
+                logger.error(msg)
+                raise RuntimeError(msg)
+            completed = True
+
+        finally:
+            # If the iteration was abandoned, stop the listing.
+            if not completed and p.returncode == None:
+                p.kill()
+                p.wait()
+
+        # Cache the complete list.
+        self.changes = changes
+
+    def get_change_table(self, options=[]):
+        """Get the columnar table of the repository changes. If the
+        list of changes is already cached, the table is built from
+        it. Otherwise, the svnlook output is loaded straight into the
+        table, without making change items.
+
+        Args:
+          options: Svnlook command options.
 
-        # Track the items added and deleted.
-        addpaths = dict()
-        deletepaths = dict()
+        Returns: Table object for the changes.
+        """
+        # If available, use the cached table.
+        if hasattr(self, 'changetable'): return self.changetable
 
-        # Parse the change listing output.
-        self.changes = []
-        for chgline in self.execute(
-            ['svnlook', 'changed', self.repospath]
-            + options).splitlines():
+        if hasattr(self, 'changes'):
+            self.changetable = ChangeTable.from_items(self.changes)
+        else:
+            self.changetable = ChangeTable(self.execute(
+                    ['svnlook', 'changed', '--copy-info',
+                     self.repospath] + options))
 
-            # Construct the change item instance.
-            item = ChangeItem(chgline)
+        # Return the cached table.
+        return self.changetable
 
-            # Add the change item to the list of changes.
-            self.changes.append(item)
+    def get_change_index(self):
+        """Get the path index of the repository changes.
 
-            # Track the added and deleted items.
-            if item.is_add(): addpaths[item.path] = item
-            if item.is_delete(): deletepaths[item.path] = item
+        Returns: Index object for the list of changes.
+        """
+        # If available, use the cached index.
+        if hasattr(self, 'changeindex'): return self.changeindex
 
-            # If the path shows in both lists, it's a replacement.
-            if item.path in addpaths and item.path in deletepaths:
-                addpaths[item.path].replaced = True
-                deletepaths[item.path].replaced = True
+        # Index the list of changes.
+        self.changeindex = ChangeIndex(self.get_changes())
 
-        # Return the cached list.
-        return self.changes
+        # Return the cached index.
+        return self.changeindex
 
-    def get_file_content(self, path, options=[]):
-        """Get the content of a repository file.
+    def get_scan_cache(self):
+        """Get the content scan result cache.
+
+        Returns: Scan cache object, or None when not configured.
+        """
+        if not self.cachedir: return None
+
+        # If needed, open the cache.
+        if not hasattr(self, 'scancache'):
+            self.scancache = ScanCache(self.cachedir)
+        return self.scancache
+
+    def get_diffs(self, options=[]):
+        """Get the content differences of the repository changes.
+
+        The svnlook output is parsed as it arrives. Only the added and
+        removed lines are kept, so memory use follows the size of the
+        differences - not the size of the files.
+
+        Args:
+          options: Svnlook command options.
+
+        Returns: Dictionary of difference items, by path.
+        """
+        # If available, use the cached differences.
+        if hasattr(self, 'diffs'): return self.diffs
+
+        # Start the difference listing. Compare copies to their
+        # sources, rather than listing them as whole new files.
+        cmd = ['svnlook', 'diff', '--diff-copy-from', self.repospath]\
+            + options
+        p = self.start(cmd)
+
+        diffs = dict()
+        item = None
+        header = None
+        completed = False
+        try:
+            for diffline in p.stdout:
+                diffline = diffline.rstrip('\r\n')
+
+                # A section header is confirmed by the separator line
+                # that follows it. Property sections are skipped.
+                if header != None:
+                    if diffline.startswith('====='):
+                        item = diffs.setdefault(header, DiffItem(header))
+                        oldline = newline = None
+                        header = None
+                        continue
+                    header = None
+                match = re.match(r'(Added|Copied|Deleted|Modified): '
+                                 r'(.+?)(?: \(from rev \d+, .+\))?$',
+                                 diffline)
+                if match:
+                    header = match.group(2)
+                    continue
+                if diffline.startswith('Property changes on: '):
+                    item = None
+                    continue
+                if item == None: continue
+
+                # Start counting lines at each hunk.
+                match = re.match(r'@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@',
+                                 diffline)
+                if match:
+                    oldline = int(match.group(1))
+                    newline = int(match.group(2))
+                    continue
+                if newline == None: continue
+
+                # Collect the added and removed lines.
+                if diffline.startswith('+'):
+                    item.added.append((newline, diffline[1:]))
+                    newline += 1
+                elif diffline.startswith('-'):
+                    item.removed.append((oldline, diffline[1:]))
+                    oldline += 1
+                elif diffline.startswith(' '):
+                    oldline += 1
+                    newline += 1
+
+            # The listing is complete. Check how it ended.
+            errstr = p.stderr.read()
+            p.wait()
+            if p.returncode != 0:
+                msg = 'Command failed: {0}: {1}'.format(
+                    [str(field) for field in cmd], errstr.strip())
+                logger.error(msg)
+                raise RuntimeError(msg)
+            completed = True
+
+        finally:
+            # If the parsing failed, stop the listing.
+            if not completed and p.returncode == None:
+                p.kill()
+                p.wait()
+
+        # Cache the differences.
+        self.diffs = diffs
+        return self.diffs
+
+    def get_diff(self, path):
+        """Get the content differences of a changed file.
 
         Args:
             path: Repository path name of file.
 
-        Returns: Content of the repository file.
+        Returns: Difference item, or None if the file content didn't
+        change.
+        """
+        return self.get_diffs().get(path)
+
+    def get_file_content(self, path, options=[], binary=True,
+                         view=False):
+        """Get the content of a repository file.
+
+        Args:
+            path: Repository path name of file.
+            options: Svnlook command options.
+            binary: Flag allowing binary content. When cleared, the
+              leading bytes are checked first. The rest of a binary
+              file isn't read.
+            view: Flag allowing a read-only buffer view of the
+              content, mapped from the repository storage.
+
+        Returns: Content of the repository file, or None for a binary
+        file that wasn't allowed.
         """
+        # Use the result of a background fetch, if one was started.
+        fetch = self.pop_fetch('content', path)
+        if fetch:
+            content = fetch.get()
+            if not binary and self.is_binary(content[:self.sniffsize]):
+                return None
+            return content
+
+        # If allowed, view the stored content in place.
+        if view:
+            content = self.get_content_view(path)
+            if content != None:
+                if not binary \
+                        and self.is_binary(content[:self.sniffsize]):
+                    return None
+                return content
+
         # To limit memory consumption, the file is always retrieved
         # from the repository.
-        return self.execute(
-            ['svnlook', 'cat', self.repospath, path] + options)
+        cmd = ['svnlook', 'cat', self.repospath, path] + options
+        if binary:
+            content = self.execute(cmd)
+            self.count('content_files_read')
+            self.count('content_bytes_read', len(content))
+            return content
+
+        # Check the leading bytes, before reading the rest.
+        p = self.start(cmd)
+        try:
+            content = p.stdout.read(self.sniffsize)
+            self.count('content_files_read')
+            if self.is_binary(content):
+                logger.debug('Binary content: {0}'.format(path))
+                self.count('content_bytes_read', len(content))
+                return None
+            content += p.stdout.read()
+            self.count('content_bytes_read', len(content))
+
+            # The content is complete. Check how the command ended.
+            errstr = p.stderr.read()
+            p.wait()
+            if p.returncode != 0:
+                msg = 'Command failed: {0}: {1}'.format(
+                    [str(field) for field in cmd], errstr.strip())
+                logger.error(msg)
+                raise RuntimeError(msg)
+
+        finally:
+            # If the content wasn't read, stop the command.
+            if p.returncode == None:
+                p.kill()
+                p.wait()
+
+        # Trim the content, like the output of other commands.
+        return content.strip()
+
+    @staticmethod
+    def is_binary(head):
+        """Check the leading bytes of file content for binary data.
+
+        Args:
+            head: Leading part of the file content.
+
+        Returns: True if the content looks binary.
+        """
+        return '\0' in head
+
+    def get_file_size(self, path, options=[]):
+        """Get the size of a repository file, without reading it.
+
+        Args:
+            path: Repository path name of file.
+            options: Svnlook command options.
+
+        Returns: Number of bytes in the file.
+        """
+        # Return previously cached results for the path. Otherwise,
+        # create a path-keyed size cache.
+        if hasattr(self, 'filesizes'):
+            if path in self.filesizes:
+                self.count('fetches_avoided')
+                return self.filesizes[path]
+        else:
+            self.filesizes = dict()
+
+        # Get the file size.
+        self.filesizes[path] = int(self.execute(
+            ['svnlook', 'filesize', self.repospath, path] + options))
+        return self.filesizes[path]
+
+    def get_mime_type(self, path):
+        """Get the MIME type of a repository file, if it's known
+        without asking the repository.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Value of the svn:mime-type property, or None if not
+        set or not cached.
+        """
+        if not hasattr(self, 'properties') \
+                or path not in self.properties:
+            return None
+        return self.properties[path].get('svn:mime-type')
+
+    def get_fsfs(self):
+        """Get the reader of the FSFS repository storage. The storage
+        format is only checked once.
+
+        Returns: FSFS reader, or None when the storage can't be read
+        directly.
+        """
+        if not hasattr(self, 'fsfs'):
+            self.fsfs = FsfsReader(self.repospath)
+        if not self.fsfs.usable: return None
+        return self.fsfs
+
+    def get_node_id(self, path, revision=None, txnname=None):
+        """Get the node revision ID of a changed file. It's read from
+        the changed-path list in the repository storage, so no paths
+        are listed.
+
+        Args:
+            path: Repository path name of file.
+            revision: Revision number of a committed change.
+            txnname: Name of the transaction holding an uncommitted
+              change.
+
+        Returns: Node revision ID, or None when it isn't known.
+        """
+        fsfs = self.get_fsfs()
+        if fsfs == None: return None
+        return fsfs.get_node_id(path, revision, txnname)
+
+    def get_content_key(self, path, txnname=None):
+        """Get a key for the stored content of a file, without reading
+        the content. Files with the same content get the same key.
+
+        Args:
+            path: Repository path name of file.
+            txnname: Name of the transaction holding uncommitted
+              nodes.
+
+        Returns: Checksum of the content, or None when it isn't known.
+        """
+        fsfs = self.get_fsfs()
+        if fsfs == None: return None
+        nodeid = self.get_node_id(path)
+        if nodeid == None: return None
+        return fsfs.get_rep_key(nodeid, txnname)
+
+    def is_unchanged_copy(self, path, txnname=None):
+        """Check whether a copied file still has the content of its
+        copy source, without reading either content.
+
+        Args:
+            path: Repository path name of the copy.
+            txnname: Name of the transaction holding uncommitted
+              nodes.
+
+        Returns: True if the content is the same, False if it isn't,
+        or None when that isn't known.
+        """
+        fsfs = self.get_fsfs()
+        if fsfs == None: return None
+        nodeid = self.get_node_id(path)
+        if nodeid == None: return None
+        return fsfs.is_unchanged_copy(nodeid, txnname)
+
+    def get_content_view(self, path):
+        """Get a read-only view of file content, mapped from a local
+        FSFS revision file. The view is trimmed, like the output of
+        svnlook commands.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Buffer view of the content, or None when the content
+        isn't stored in a mappable form.
+        """
+        # Check the repository storage format once. Stop looking up
+        # files, once it's clear they aren't stored as is.
+        fsfs = self.get_fsfs()
+        if fsfs == None or not fsfs.physical or not fsfs.plain:
+            return None
+
+        # Get the node revision ID of the file.
+        nodeid = self.get_node_id(path)
+        if nodeid == None: return None
+
+        # View the content, if it's stored as is.
+        content = fsfs.get_content(nodeid)
+        if content == None:
+            self.count('content_views_missed')
+            return None
+        self.count('content_files_mapped')
+        self.count('content_bytes_mapped', len(content))
+        return self.trim_view(content)
+
+    @staticmethod
+    def trim_view(view):
+        """Trim the leading and trailing white space of a content view,
+        without copying the content.
+
+        Args:
+            view: Buffer view of the content.
+
+        Returns: Buffer view of the trimmed content.
+        """
+        start, end = 0, len(view)
+        while start < end and view[start].isspace(): start += 1
+        while end > start and view[end - 1].isspace(): end -= 1
+        if start == 0 and end == len(view): return view
+        return buffer(view, start, end - start)
+
+    def get_revision_content(self, path, revision):
+        """Get the content of a file in a committed revision.
+
+        Args:
+            path: Repository path name of file.
+            revision: Revision number.
+
+        Returns: Content of the revision file.
+        """
+        return self.execute(['svnlook', 'cat', self.repospath, path,
+                             '-r', revision])
+
+    def get_listing(self, folder):
+        """Get the existing entries in a repository folder.
+
+        Args:
+          folder: Path name of the repository folder.
+
+        Returns: Map of uppercased existing folder entry names
+        versus original folder entry names.
+        """
+        # If the listing was previously produced, return it.
+        if not hasattr(self, 'listings'): self.listings = dict()
+        if folder in self.listings:
+            self.count('fetches_avoided')
+            return self.listings[folder]
+
+        # This is a new folder. Start with an empty list.
+        listing = self.listings[folder] = dict()
+
+        # Request the parent folder listing.
+        cmd = ['svnlook', 'tree', self.repospath, folder,
+               '--non-recursive']
+        p = self.start(cmd)
+        outstr, errstr = p.communicate()
+
+        # The parent folder may be added, as part of this
+        # revision. Treat the "file not found" error as
+        # returning an empty listing - so we don't ask for it
+        # again.
+        if p.returncode == errno.ENOENT: return listing
+        elif p.returncode != 0:
+            msg = 'Command failed: {0}: {1}'.format(
+                cmd, errstr.strip())
+            logger.error(msg)
+            raise RuntimeError(msg)
+
+        # Parse the folder listing.
+        for line in outstr.splitlines():
+            logger.debug('line = "{0}"'.format(line.rstrip()))
+
+            # Skip blank lines and headers.
+            match = re.match(r'\s((\S+?)/?)$', line.rstrip())
+            if match == None: continue
+
+            # Add the entry to the listing.
+            name, value = match.group(2,1)
+            listing[name.upper()] = value
+
+        return listing
+
+    def get_lock_owner(self, path):
+        """Get the owner of a path lock.
+
+        Args:
+          path: Relative repository path name.
+
+        Returns: User name of the lock owner, or None if the path
+        isn't locked.
+        """
+        # If available, use the cached owner.
+        if not hasattr(self, 'lockowners'): self.lockowners = dict()
+        if path in self.lockowners:
+            self.count('fetches_avoided')
+            return self.lockowners[path]
+
+        # Extract the lock owner name from the lock details.
+        owner = None
+        for line in self.execute(
+            ['svnlook', 'lock', self.repospath, path]).splitlines():
+            logger.debug('line = "{0}"'.format(line.rstrip()))
+            match = re.match(r'Owner:\s+(\S+)', line.rstrip())
+            if match:
+                owner = match.group(1)
+                break
+
+        logger.debug('owner = {0!r}'.format(owner))
+        self.lockowners[path] = owner
+        return owner
 
     def get_log_message(self, options=[]):
         """Get the log message of a repository change.
@@ -180,7 +839,9 @@ class Context(object):
         Returns: Output produced by the command.
         """
         # If available, use the cached log message.
-        if hasattr(self, 'logmsg'): return self.logmsg
+        if hasattr(self, 'logmsg'):
+            self.count('fetches_avoided')
+            return self.logmsg
 
         # Get the change log message.
         self.logmsg = self.execute(
@@ -198,13 +859,19 @@ class Context(object):
 
         Returns: Dictionary of repository path properties.
         """
+        # Use the result of a background fetch, if one was started.
+        fetch = self.pop_fetch('properties', path)
+        if fetch: return fetch.get()
+
         # Return previously cached results for the path. Otherwise,
         # create a path-keyed property cache.
         if hasattr(self, 'properties'):
-            if path in self.properties: return self.properties[path]
+            if path in self.properties:
+                self.count('fetches_avoided')
+                return self.properties[path]
         else:
             self.properties = dict()
-        properties = self.properties[path] = dict()
+        properties = dict()
 
         # Get the list of path property names.
         for name in self.execute(
@@ -219,12 +886,236 @@ class Context(object):
                 ['svnlook', 'propget', self.repospath, name, path]
                 + options)
 
-            # Cache the property.
+            # Collect the property.
             properties[name] = value
 
-        # Pass back the path-specific properties.
+        # Cache and pass back the path-specific properties. (Only
+        # cache complete results. Background fetches may be running.)
+        self.properties[path] = properties
         return properties
 
+    def preload(self, kinds):
+        """Get run-wide repository data before the hook actions start.
+        The svnlook calls run side by side. A single kind of data is
+        left to be fetched when it's first used.
+
+        Args:
+          kinds: Kinds of data to get.
+        """
+        getters = [getattr(self, self.preloaders[kind])
+                   for kind in sorted(kinds) if kind in self.preloaders]
+        if len(getters) < 2: return
+
+        # Failures are left to show up when the data is used.
+        workers = [threading.Thread(target=self.preload_kind,
+                                    args=(getter,))
+                   for getter in getters]
+        for worker in workers: worker.start()
+        for worker in workers: worker.join()
+        self.count('preloads', len(workers))
+
+    def preload_kind(self, getter):
+        """Get one kind of run-wide repository data. The getter caches
+        it.
+
+        Args:
+          getter: Bound method that gets the data.
+        """
+        try:
+            getter()
+        except Exception as e:
+            logger.debug('Preload failed: {0}'.format(e))
+
+    def prefetch(self, changes, kinds, threads, processes=0,
+                 patterns=[], gates=None):
+        """Fetch per-path data for upcoming changes in the background.
+
+        The changes are passed through in their original order. While
+        one is being handled, the data for the next few is fetched by
+        a bounded pool of worker threads. Content scans are done by a
+        pool of worker processes, so they can use several CPUs.
+
+        Args:
+          changes: Iterable of change items.
+          kinds: Data to fetch ('content', 'properties' and/or 'scan').
+          threads: Maximum number of concurrent fetches.
+          processes: Maximum number of concurrent content scans.
+          patterns: Regular expressions to scan for, as (fingerprint,
+            expression, flags) tuples.
+          gates: Conditions for scanning a file, as used by the
+            content filters ('maxbytes', 'skipbinary' and 'fullscan').
+
+        Returns: Generator of the change items.
+        """
+        if not hasattr(self, 'fetches'): self.fetches = dict()
+
+        # Start the worker processes. Without them, the content scans
+        # are done as usual.
+        if 'scan' in kinds and not hasattr(self, 'scanpool'):
+            try:
+                self.scanpool = multiprocessing.Pool(processes)
+            except (ImportError, OSError) as e:
+                logger.warning('Scan processes unavailable: {0}'
+                               .format(e))
+                kinds = [kind for kind in kinds if kind != 'scan']
+
+        # Start the worker threads. The first request sets the size.
+        if [kind for kind in kinds if kind != 'scan'] \
+                and not hasattr(self, 'fetchpool'):
+            self.fetchpool = FetchPool(threads)
+        if 'properties' in kinds and not hasattr(self, 'properties'):
+            self.properties = dict()
+
+        # Keep the queue of fetches a little ahead of the workers.
+        window = deque()
+        ahead = 2 * max(threads, processes)
+        try:
+            for change in changes:
+                self.start_fetches(change, kinds, patterns, gates)
+                window.append(change)
+                if len(window) > ahead:
+                    yield window[0]
+                    self.drop_fetches(window.popleft(), kinds)
+
+            while window:
+                yield window[0]
+                self.drop_fetches(window.popleft(), kinds)
+
+        finally:
+            # Forget the fetches that won't be used.
+            for change in window: self.drop_fetches(change, kinds)
+
+    def start_fetches(self, change, kinds, patterns=[], gates=None):
+        """Start the background fetches for a change.
+
+        Args:
+          change: Change item to fetch data for.
+          kinds: Data to fetch.
+          patterns: Regular expressions for content scans.
+          gates: Conditions for scanning a file.
+        """
+        # Deleted items don't have data to fetch.
+        if change.is_delete(): return
+        path = change.path
+
+        if 'content' in kinds and not path.endswith('/') \
+                and ('content', path) not in self.fetches:
+            self.fetches[('content', path)] = self.fetchpool.submit(
+                self.get_file_content, path)
+
+        if 'properties' in kinds and path not in self.properties \
+                and ('properties', path) not in self.fetches:
+            self.fetches[('properties', path)] = self.fetchpool.submit(
+                self.get_properties, path)
+
+        if 'scan' in kinds and not path.endswith('/') \
+                and ('scan', path) not in self.fetches \
+                and self.is_scanned(change, gates):
+            self.fetches[('scan', path)] = self.scan_file_content(
+                path, patterns, bool(gates and gates['skipbinary']))
+
+    def is_scanned(self, change, gates):
+        """Check a change against the conditions the content filters
+        apply, before scanning its content.
+
+        Args:
+          change: Change item of the file.
+          gates: Conditions for scanning a file.
+
+        Returns: True if a content filter would read the file.
+        """
+        if not gates: return True
+
+        # Property changes leave the content alone.
+        if not gates['fullscan'] and change.flags & ChangeItem.PROPERTY_ONLY:
+            return False
+
+        # Large files aren't read.
+        if gates['maxbytes'] != None \
+                and self.get_file_size(change.path) > gates['maxbytes']:
+            return False
+
+        # Files with a known binary MIME type aren't read.
+        if gates['skipbinary']:
+            mimetype = self.get_mime_type(change.path)
+            if mimetype and not mimetype.startswith('text/'):
+                return False
+
+        return True
+
+    def drop_fetches(self, change, kinds):
+        """Forget the unused background fetches for a change.
+
+        Args:
+          change: Change item the data was fetched for.
+          kinds: Data that was fetched.
+        """
+        for kind in kinds: self.fetches.pop((kind, change.path), None)
+
+    def pop_fetch(self, kind, path):
+        """Claim a background fetch.
+
+        Args:
+          kind: Kind of data fetched.
+          path: Repository path the data was fetched for.
+
+        Returns: Pending fetch result, or None.
+        """
+        # The worker threads do the actual fetching.
+        if not hasattr(self, 'fetches') \
+                or isinstance(threading.current_thread(), FetchWorker):
+            return None
+        return self.fetches.pop((kind, path), None)
+
+    def get_scan(self, path):
+        """Get the result of a background content scan. The scan is
+        kept for the other content filters of the change.
+
+        Args:
+          path: Repository path of the scanned file.
+
+        Returns: Dictionary of scan results, or None.
+        """
+        if not hasattr(self, 'fetches'): return None
+        scan = self.fetches.get(('scan', path))
+        if scan == None: return None
+        return scan.get()
+
+    def scan_file_content(self, path, patterns, skipbinary=False,
+                          options=[]):
+        """Start a content scan in a worker process. The worker reads
+        the content itself, so it isn't copied between processes.
+
+        Args:
+          path: Repository path name of file.
+          patterns: Regular expressions to scan for.
+          skipbinary: Flag to stop reading binary content.
+          options: Svnlook command options.
+
+        Returns: Pending scan result.
+        """
+        return self.scanpool.apply_async(scan_content, (
+                ['svnlook', 'cat', self.repospath, path] + options,
+                patterns, self.sniffsize, skipbinary))
+
+    def close(self):
+        """Release the resources held by the context."""
+        if hasattr(self, 'fetchpool'): self.fetchpool.close()
+        if hasattr(self, 'scanpool'):
+            self.scanpool.terminate()
+            self.scanpool.join()
+        if hasattr(self, 'scancache'): self.scancache.close()
+        if hasattr(self, 'fsfs'): self.fsfs.close()
+        if hasattr(self, 'coprocesses'):
+            for coprocess in self.coprocesses.values():
+                coprocess.close()
+
+        # Report the repository access statistics.
+        if self.stats:
+            logger.debug('Statistics: ' + ', '.join(
+                    '{0}={1}'.format(name, self.stats[name])
+                    for name in sorted(self.stats)))
+
 class CtxStandard(Context):
     """Context for Hooks without Revision or Transaction"""
 
@@ -242,15 +1133,60 @@ class CtxStandard(Context):
         """
         return super(CtxStandard, self).get_changes()
 
-    def get_file_content(self, path):
+    def iter_changes(self):
+        """Iterate over the changes in the last revision.
+
+        Returns: Generator of change objects for the changes.
+        """
+        return super(CtxStandard, self).iter_changes()
+
+    def get_change_table(self):
+        """Get the columnar table of the changes in the last revision.
+
+        Returns: Table object for the changes.
+        """
+        return super(CtxStandard, self).get_change_table()
+
+    def get_diffs(self):
+        """Get the content differences of the last revision.
+
+        Returns: Dictionary of difference items, by path.
+        """
+        return super(CtxStandard, self).get_diffs()
+
+    def get_file_content(self, path, binary=True, view=False):
         """Get the content of a file in the last revision.
 
         Args:
             path: Repository path name of file.
+            binary: Flag allowing binary content.
+            view: Flag allowing a mapped view of the content.
 
-        Returns: Content of the revision file.
+        Returns: Content of the revision file, or None.
         """
-        return super(CtxStandard, self).get_file_content(path)
+        return super(CtxStandard, self).get_file_content(
+            path, binary=binary, view=view)
+
+    def get_file_size(self, path):
+        """Get the size of a file in the last revision.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Number of bytes in the file.
+        """
+        return super(CtxStandard, self).get_file_size(path)
+
+    def get_node_id(self, path):
+        """The changes of the last revision don't cover the paths of
+        the hooks using this context. Don't look them up.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: None
+        """
+        return None
 
     def get_log_message(self):
         """Get the log message of the last revision.
@@ -269,13 +1205,72 @@ class CtxStandard(Context):
         """
         return super(CtxStandard, self).get_properties(path)
 
+    def scan_file_content(self, path, patterns, skipbinary=False):
+        """Start a content scan of a file in the last revision.
+        Args:
+            path: Repository path name of file.
+            patterns: Regular expressions to scan for.
+            skipbinary: Flag to stop reading binary content.
+
+        Returns: Pending scan result.
+        """
+        return super(CtxStandard, self).scan_file_content(
+            path, patterns, skipbinary)
+
 class CtxRevision(Context):
     """Context for Hooks with a Revision"""
 
+    # Attributes holding cached repository data. Formatted log entries
+    # are kept, too.
+    cachenames = Context.cachenames + ['logs']
+
     def __init__(self, tokens):
         super(CtxRevision, self).__init__(tokens)
         self.revision = tokens['Revision']
 
+    def adopt_revision_cache(self):
+        """Adopt the repository data that earlier hook runs cached for
+        the revision. A caching problem only means that the data is
+        fetched again."""
+        if not self.cachedir: return
+        try:
+            cache = RevisionCache(self.cachedir)
+            data = cache.get(self.revision)
+            cache.close()
+        except Exception as e:
+            logger.warning('Unable to read revision cache: {0}'
+                           .format(e))
+            return
+        if data:
+            logger.debug('Adopted cached data of revision {0}: {1}'
+                         .format(self.revision, sorted(data)))
+            self.set_cache(data)
+
+    def share_revision_cache(self):
+        """Add the repository data gathered for the revision to the
+        cache, for later hook runs."""
+        if not self.cachedir: return
+        data = self.get_cache()
+        if not data: return
+        try:
+            cache = RevisionCache(self.cachedir)
+            cache.put(self.revision, data)
+            cache.close()
+        except Exception as e:
+            logger.warning('Unable to update revision cache: {0}'
+                           .format(e))
+
+    def drop_revision_props(self):
+        """Drop the cached revision property data of the revision."""
+        if not self.cachedir: return
+        try:
+            cache = RevisionCache(self.cachedir)
+            cache.drop_revprops(self.revision)
+            cache.close()
+        except Exception as e:
+            logger.warning('Unable to update revision cache: {0}'
+                           .format(e))
+
     def get_author(self):
         """Get the author of the revision.
 
@@ -292,17 +1287,65 @@ class CtxRevision(Context):
         return super(CtxRevision, self).get_changes(
             ['-r', self.revision])
 
-    def get_file_content(self, path):
+    def iter_changes(self):
+        """Iterate over the changes in the revision.
+
+        Returns: Generator of change objects for the changes.
+        """
+        return super(CtxRevision, self).iter_changes(
+            ['-r', self.revision])
+
+    def get_change_table(self):
+        """Get the columnar table of the changes in the revision.
+
+        Returns: Table object for the changes.
+        """
+        return super(CtxRevision, self).get_change_table(
+            ['-r', self.revision])
+
+    def get_diffs(self):
+        """Get the content differences of the revision.
+
+        Returns: Dictionary of difference items, by path.
+        """
+        return super(CtxRevision, self).get_diffs(
+            ['-r', self.revision])
+
+    def get_file_content(self, path, binary=True, view=False):
         """Get the content of a file in the revision.
 
         Args:
             path: Repository path name of file.
+            binary: Flag allowing binary content.
+            view: Flag allowing a mapped view of the content.
 
-        Returns: Content of the revision file.
+        Returns: Content of the revision file, or None.
         """
         return super(CtxRevision, self).get_file_content(
+            path, ['-r', self.revision], binary, view)
+
+    def get_file_size(self, path):
+        """Get the size of a file in the revision.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Number of bytes in the file.
+        """
+        return super(CtxRevision, self).get_file_size(
             path, ['-r', self.revision])
 
+    def get_node_id(self, path):
+        """Get the node revision ID of a file changed by the revision.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Node revision ID, or None.
+        """
+        return super(CtxRevision, self).get_node_id(
+            path, int(self.revision))
+
     def get_log_message(self):
         """Get the log message of the revision.
 
@@ -319,10 +1362,17 @@ class CtxRevision(Context):
 
         Returns: Log information for the revision.
         """
+        # If available, use the cached log entry.
+        if not hasattr(self, 'logs'): self.logs = dict()
+        if verbose in self.logs:
+            self.count('fetches_avoided')
+            return self.logs[verbose]
+
         cmd = ['svn', 'log', self.reposurl,
                '-r', self.revision]
         if verbose: cmd += ['--verbose']
-        return super(CtxRevision, self).execute(cmd)
+        self.logs[verbose] = super(CtxRevision, self).execute(cmd)
+        return self.logs[verbose]
 
     def get_properties(self, path):
         """Get the properties of a repository path.
@@ -335,6 +1385,18 @@ class CtxRevision(Context):
         return super(CtxRevision, self).get_properties(
             path, ['-r', self.revision])
 
+    def scan_file_content(self, path, patterns, skipbinary=False):
+        """Start a content scan of a file in the revision.
+        Args:
+            path: Repository path name of file.
+            patterns: Regular expressions to scan for.
+            skipbinary: Flag to stop reading binary content.
+
+        Returns: Pending scan result.
+        """
+        return super(CtxRevision, self).scan_file_content(
+            path, patterns, skipbinary, ['-r', self.revision])
+
 class CtxTransaction(Context):
     """Context for Hooks with a Transaction"""
 
@@ -358,17 +1420,97 @@ class CtxTransaction(Context):
         return super(CtxTransaction, self).get_changes(
             ['-t', self.transaction])
 
-    def get_file_content(self, path):
+    def iter_changes(self):
+        """Iterate over the changes in the transaction.
+
+        Returns: Generator of change objects for the changes.
+        """
+        return super(CtxTransaction, self).iter_changes(
+            ['-t', self.transaction])
+
+    def get_change_table(self):
+        """Get the columnar table of the changes in the transaction.
+
+        Returns: Table object for the changes.
+        """
+        return super(CtxTransaction, self).get_change_table(
+            ['-t', self.transaction])
+
+    def get_diffs(self):
+        """Get the content differences of the transaction.
+
+        Returns: Dictionary of difference items, by path.
+        """
+        return super(CtxTransaction, self).get_diffs(
+            ['-t', self.transaction])
+
+    def get_file_content(self, path, binary=True, view=False):
         """Get the content of a file in the transaction.
 
         Args:
             path: Repository path name of file.
+            binary: Flag allowing binary content.
+            view: Flag allowing a mapped view of the content.
 
-        Returns: Content of the transaction file.
+        Returns: Content of the transaction file, or None.
         """
         return super(CtxTransaction, self).get_file_content(
+            path, ['-t', self.transaction], binary, view)
+
+    def get_content_view(self, path):
+        """Transaction content is still being written to the
+        proto-revision file. Don't map it.
+
+        Returns: None
+        """
+        return None
+
+    def get_file_size(self, path):
+        """Get the size of a file in the transaction.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Number of bytes in the file.
+        """
+        return super(CtxTransaction, self).get_file_size(
             path, ['-t', self.transaction])
 
+    def get_node_id(self, path):
+        """Get the node revision ID of a file changed by the
+        transaction.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Node revision ID, or None.
+        """
+        return super(CtxTransaction, self).get_node_id(
+            path, txnname=self.transaction)
+
+    def get_content_key(self, path):
+        """Get a key for the stored content of a transaction file.
+
+        Args:
+            path: Repository path name of file.
+
+        Returns: Checksum of the content, or None.
+        """
+        return super(CtxTransaction, self).get_content_key(
+            path, self.transaction)
+
+    def is_unchanged_copy(self, path):
+        """Check whether a copied transaction file still has the
+        content of its copy source.
+
+        Args:
+            path: Repository path name of the copy.
+
+        Returns: True, False, or None when that isn't known.
+        """
+        return super(CtxTransaction, self).is_unchanged_copy(
+            path, self.transaction)
+
     def get_log_message(self):
         """Get the log message of the transaction.
 
@@ -388,25 +1530,642 @@ class CtxTransaction(Context):
         return super(CtxTransaction, self).get_properties(
             path, ['-t', self.transaction])
 
-class Tokens(dict):
-    """Dictionary with Case-Insensitive Keys"""
+    def scan_file_content(self, path, patterns, skipbinary=False):
+        """Start a content scan of a file in the transaction.
+        Args:
+            path: Repository path name of file.
+            patterns: Regular expressions to scan for.
+            skipbinary: Flag to stop reading binary content.
+
+        Returns: Pending scan result.
+        """
+        return super(CtxTransaction, self).scan_file_content(
+            path, patterns, skipbinary, ['-t', self.transaction])
+
+class Tokens(object):
+    """Layered Dictionary with Case-Insensitive Keys
+
+    Each layer holds its own entries and falls back on the layers
+    beneath it for everything else, so adding a layer doesn't copy
+    anything. Changes only go into the top layer, unless it's a frame
+    layer; those only keep changes to their initial entries, and pass
+    the rest down. A lookup costs one dictionary access per layer.
+    """
+
+    # Marker for an entry that's deleted from a layer, but still set
+    # in one beneath it.
+    deleted = object()
 
-    def __init__(self, data=None):
-        super(Tokens, self).__init__()
+    # Shared bottom layer of environment variables.
+    environment = None
+
+    def __init__(self, data=None, parent=None, framed=False):
+        """Create a token layer.
+
+        Args:
+          data: Initial entries of the layer.
+          parent: Layer beneath this one.
+          framed: Flag to keep only changes to the initial entries.
+        """
+        self.entries = dict()
+        self.parent = parent
+        self.framekeys = None
         if data:
             for key, value in data.items(): self[key] = value
-        
+        if framed: self.framekeys = set(self.entries.keys())
+
+    @classmethod
+    def get_environment(cls):
+        """Get the environment variable layer. It's built only once
+        per process.
+
+        Returns: Shared environment token layer.
+        """
+        if cls.environment == None:
+            cls.environment = cls(os.environ)
+        return cls.environment
+
+    def push(self, data=None, framed=False):
+        """Add a layer on top of this one.
+
+        Args:
+          data: Initial entries of the new layer.
+          framed: Flag to keep only changes to the initial entries in
+            the new layer.
+
+        Returns: New token layer.
+        """
+        return Tokens(data, self, framed)
+
+    def is_passed(self, key):
+        """Check whether changes to a token go to the layer beneath.
+
+        Args:
+          key: Token name.
+
+        Returns: True if the token is outside of a frame layer.
+        """
+        return self.framekeys != None\
+            and key.upper() not in self.framekeys
+
     def __setitem__(self, key, value):
-        super(Tokens, self).__setitem__(key.upper(), value)
+        if self.is_passed(key): self.parent[key] = value
+        else: self.entries[key.upper()] = value
 
     def __getitem__(self, key):
-        return super(Tokens, self).__getitem__(key.upper())
+        key = key.upper()
+        layer = self
+        while layer != None:
+            if key in layer.entries:
+                value = layer.entries[key]
+                if value is Tokens.deleted: break
+                return value
+            layer = layer.parent
+        raise KeyError(key)
 
     def __delitem__(self, key):
-        super(Tokens, self).__delitem__(key.upper())
+        if self.is_passed(key):
+            del self.parent[key]
+            return
+        if key not in self: raise KeyError(key.upper())
+        if self.parent != None and key in self.parent:
+            self.entries[key.upper()] = Tokens.deleted
+        else:
+            del self.entries[key.upper()]
 
     def __contains__(self, key):
-        return super(Tokens, self).__contains__(key.upper())
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        """Get the effective entries of all the layers.
+
+        Returns: List of (key, value) tuples.
+        """
+        layers = []
+        layer = self
+        while layer != None:
+            layers.append(layer)
+            layer = layer.parent
+        merged = dict()
+        for layer in reversed(layers): merged.update(layer.entries)
+        return [(key, value) for key, value in merged.items()
+                if value is not Tokens.deleted]
+
+    def keys(self):
+        return [key for key, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.items())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+def scan_content(cmd, patterns, sniffsize, skipbinary=False):
+    """Scan file content in a worker process. The content is trimmed,
+    like the content read by the hook process.
+
+    Args:
+      cmd: Svnlook command that outputs the content.
+      patterns: Regular expressions to scan for, as (fingerprint,
+        expression, flags) tuples.
+      sniffsize: Number of leading bytes checked for binary data.
+      skipbinary: Flag to stop reading binary content, without
+        scanning it.
+
+    Returns: Dictionary of match flags, by fingerprint. The "binary"
+    entry flags binary content.
+    """
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+
+    # Check the leading bytes, before reading the rest.
+    content = p.stdout.read(sniffsize)
+    results = {'binary': Context.is_binary(content)}
+    if skipbinary and results['binary']:
+        p.kill()
+        p.wait()
+        return results
+
+    content += p.stdout.read()
+    errstr = p.stderr.read()
+    p.wait()
+    if p.returncode != 0:
+        raise RuntimeError('Command failed: {0}: {1}'.format(
+                cmd, errstr.strip()))
+    content = content.strip()
+
+    # The compiled expressions are cached by the re module.
+    for fingerprint, pattern, flags in patterns:
+        results[fingerprint] = re.search(pattern, content, flags) != None
+    return results
+
+class Coprocess(object):
+    """Long-Running Command Process
+
+    Start a command once, and send it requests through its standard
+    input. Each request is a line with the number of fields, followed
+    by each field: a line with its length in bytes, and then the field
+    bytes. Each response is a line with the exit code and the length
+    of the error message, separated by a space, followed by the error
+    message bytes. For example:
+
+      request:  "2\n10\ntrunk/a.py1\nA"
+      response: "1 12\nBad content."
+
+    The standard error output of the command is discarded. Closing the
+    standard input tells it to exit.
+    """
+
+    # Seconds to wait for the command to exit, once told to.
+    closewait = 5
+
+    def __init__(self, cmd):
+        """Start the command.
+
+        Args:
+          cmd: Command and arguments to start.
+        """
+        self.cmd = [str(field) for field in cmd]
+        logger.debug('Start co-process: {0}'.format(self.cmd))
+        self.errfile = open(os.devnull, 'w')
+        try:
+            self.process = subprocess.Popen(self.cmd,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=self.errfile,
+                                            shell=False)
+        except Exception as e:
+            self.errfile.close()
+            logger.error(e)
+            raise e
+
+    def request(self, fields):
+        """Send a request, and wait for the response.
+
+        Args:
+          fields: List of request fields.
+
+        Returns: Tuple of the exit code and error message.
+        """
+        fields = [str(field) for field in fields]
+        frame = '{0}\n'.format(len(fields)) + ''.join(
+            '{0}\n{1}'.format(len(field), field) for field in fields)
+        try:
+            self.process.stdin.write(frame)
+            self.process.stdin.flush()
+            header = self.process.stdout.readline()
+            match = re.match(r'(\d+) (\d+)\n$', header)
+            if match:
+                errstr = self.process.stdout.read(int(match.group(2)))
+        except IOError as e:
+            raise RuntimeError('Co-process failed: {0}: {1}'
+                               .format(self.cmd, e))
+
+        # A missing or short response means that the command broke
+        # the protocol, or ended.
+        if not match or len(errstr) < int(match.group(2)):
+            raise RuntimeError('Co-process protocol error: {0}: {1!r}'
+                               .format(self.cmd, header))
+        return int(match.group(1)), errstr
+
+    def close(self):
+        """Tell the command to exit. If it doesn't, kill it."""
+        if self.process.poll() == None:
+            try:
+                self.process.stdin.close()
+            except IOError:
+                pass
+            deadline = time.time() + self.closewait
+            while self.process.poll() == None \
+                    and time.time() < deadline:
+                time.sleep(0.01)
+            if self.process.poll() == None:
+                self.process.kill()
+                self.process.wait()
+        self.errfile.close()
+
+class FetchPool(object):
+    """Background Fetch Thread Pool
+
+    The fetches run svnlook in child processes, so the threads spend
+    their time waiting - not competing for the interpreter.
+    """
+
+    def __init__(self, threads):
+        """Start the worker threads.
+
+        Args:
+          threads: Number of worker threads.
+        """
+        self.queue = Queue.Queue()
+        self.workers = [FetchWorker(self.queue)
+                        for i in range(max(int(threads), 1))]
+        for worker in self.workers: worker.start()
+
+    def submit(self, func, *args):
+        """Queue a fetch.
+
+        Args:
+          func: Function performing the fetch.
+          *args: Function arguments.
+
+        Returns: Pending fetch result.
+        """
+        fetch = FetchResult(func, args)
+        self.queue.put(fetch)
+        return fetch
+
+    def close(self):
+        """Stop the worker threads. Queued fetches that haven't
+        started are cancelled, so only the running ones are waited
+        for.
+        """
+        while True:
+            try:
+                fetch = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            if fetch != None: fetch.cancel()
+        for worker in self.workers: self.queue.put(None)
+        for worker in self.workers: worker.join()
+
+class FetchWorker(threading.Thread):
+    """Background Fetch Worker Thread"""
+
+    def __init__(self, queue):
+        super(FetchWorker, self).__init__()
+        self.daemon = True
+        self.queue = queue
+
+    def run(self):
+        """Perform queued fetches, until told to stop."""
+        while True:
+            fetch = self.queue.get()
+            if fetch == None: break
+            fetch.run()
+
+class FetchResult(object):
+    """Background Fetch Result"""
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.done = threading.Event()
+        self.value = self.error = None
+
+    def run(self):
+        """Perform the fetch. Keep any error for the consumer."""
+        try:
+            self.value = self.func(*self.args)
+        except Exception:
+            self.error = sys.exc_info()
+        self.done.set()
+
+    def cancel(self):
+        """Give up on the fetch, without performing it."""
+        self.error = (RuntimeError, RuntimeError('Fetch cancelled'),
+                      None)
+        self.done.set()
+
+    def get(self):
+        """Wait for the fetch to finish.
+
+        Returns: Result of the fetch function.
+        """
+        self.done.wait()
+        if self.error: raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+class DiffItem(object):
+    """Content Difference Item Class
+
+    Hold the lines added to, and removed from, a changed file. Each
+    line is kept with its line number in the new (added) or old
+    (removed) file content.
+    """
+
+    __slots__ = ['path', 'added', 'removed']
+
+    def __init__(self, path):
+        """Create an empty difference item.
+
+        Args:
+            path: Repository path name of file.
+        """
+        self.path = path
+        self.added = []
+        self.removed = []
+
+class ChangeIndex(object):
+    """Change Path Index Class
+
+    Keep the change paths in sorted order, so that the changes within
+    a folder can be found without looking at all of the changes.
+    """
+
+    def __init__(self, changes):
+        """Index a list of changes.
+
+        Args:
+            changes: List of change items.
+        """
+        self.changes = changes
+
+        # Sort the change positions by path name.
+        self.positions = sorted(
+            xrange(len(changes)), key=lambda i: changes[i].path)
+        self.paths = [changes[i].path for i in self.positions]
+
+    def get_under(self, prefix):
+        """Get the changes with paths that start with a prefix.
+
+        Args:
+            prefix: Leading part of the path names.
+
+        Returns: List of matching changes, in original order.
+        """
+        # Find the range of sorted paths that share the prefix.
+        lo = bisect_left(self.paths, prefix)
+        hi = lo
+        while hi < len(self.paths) \
+                and self.paths[hi].startswith(prefix):
+            hi += 1
+
+        # Put the matching changes back into change list order.
+        return [self.changes[i]
+                for i in sorted(self.positions[lo:hi])]
+
+    def get_top_folders(self):
+        """Get the top-level folders touched by the changes.
+
+        Returns: Sorted list of top-level folder paths.
+        """
+        folders = []
+        i = 0
+        while i < len(self.paths):
+            path = self.paths[i]
+            slash = path.find('/')
+            if slash < 0:
+                i += 1
+                continue
+            folders.append(path[:slash + 1])
+
+            # Skip the other paths in the folder. They sort before
+            # the next character after the slash.
+            i = bisect_left(self.paths, path[:slash] + '0', i + 1)
+        return folders
+
+class ChangeTable(object):
+    """Columnar Change Listing Class
+
+    Hold a change listing as columns, rather than as a list of change
+    items: one buffer with all of the paths, the offset of each path
+    in it, and an array of change type codes. Change type and path
+    prefix conditions are checked over the columns. Only the rows
+    that pass become change items.
+
+    The type conditions are evaluated with NumPy, when it's
+    available. Otherwise, the code array is translated to a byte
+    mask, and the mask is searched.
+    """
+
+    def __init__(self, output=''):
+        """Load the output of a "svnlook changed" command.
+
+        Args:
+            output: Change lines produced by the command.
+        """
+        self.typenames = []
+        self.sources = dict()
+        self.replaced = None
+
+        # Split the change lines from the copy source lines. The
+        # sources are kept by row number.
+        chglines = []
+        for chgline in output.splitlines():
+            if chgline.startswith(' '):
+                if chglines: self.sources[len(chglines) - 1] = chgline
+            elif chgline:
+                chglines.append(chgline)
+
+        # Use the first change line format for all of the lines.
+        if chglines: delimidx = ChangeItem.get_delimidx(chglines[0])
+        else: delimidx = 1
+        self.load([chgline[:delimidx - 1] for chgline in chglines],
+                  [chgline[delimidx:] for chgline in chglines])
+
+    @classmethod
+    def from_items(cls, changes):
+        """Build a table from a list of change items.
+
+        Args:
+            changes: List of change items.
+
+        Returns: Table object for the changes.
+        """
+        table = cls()
+        table.load([change.type for change in changes],
+                   [change.path for change in changes])
+        for row, change in enumerate(changes):
+            if change.source:
+                table.sources[row] = '(from {0}:r{1})'.format(
+                    *change.source)
+        return table
+
+    def load(self, chgtypes, paths):
+        """Fill the columns.
+
+        Args:
+            chgtypes: List of change type strings.
+            paths: List of change paths.
+        """
+        # Each distinct change type gets a one-byte code.
+        codes = dict()
+        for chgtype in set(chgtypes):
+            codes[chgtype] = len(self.typenames)
+            self.typenames.append(chgtype)
+        self.codes = array('B', [codes[chgtype] for chgtype in chgtypes])
+
+        # Each path is preceded and followed by a newline, so that
+        # path prefixes can be found with a plain text search.
+        self.buffer = '\n' + '\n'.join(paths) + '\n'
+        self.offsets = array('l')
+        offset = 1
+        for path in paths:
+            self.offsets.append(offset)
+            offset += len(path) + 1
+        self.offsets.append(offset)
+
+    def __len__(self):
+        """Get the number of rows."""
+        return len(self.codes)
+
+    def get_path(self, row):
+        """Get the path of a row.
+
+        Args:
+            row: Row number.
+
+        Returns: Change path.
+        """
+        return self.buffer[self.offsets[row]:self.offsets[row + 1] - 1]
+
+    def get_type_codes(self, typeregex):
+        """Find the change type codes that satisfy a regular
+        expression. Each distinct change type is only checked once.
+
+        Args:
+            typeregex: Change type RegexTag evaluator.
+
+        Returns: Set of change type codes.
+        """
+        return set(code for code, chgtype in enumerate(self.typenames)
+                   if typeregex.match(chgtype))
+
+    def get_type_rows(self, codes):
+        """Find the rows with one of a set of change type codes.
+
+        Args:
+            codes: Set of change type codes.
+
+        Returns: Ascending list of row numbers.
+        """
+        if not codes: return []
+        if len(codes) == len(self.typenames): return range(len(self))
+
+        if numpy:
+            lookup = numpy.zeros(256, dtype=bool)
+            lookup[list(codes)] = True
+            mask = lookup[numpy.frombuffer(self.codes, dtype=numpy.uint8)]
+            return numpy.flatnonzero(mask).tolist()
+
+        lookup = ''.join(chr(int(code in codes)) for code in range(256))
+        mask = self.codes.tostring().translate(lookup)
+        return [match.start() for match in re.finditer('\x01', mask)]
+
+    def get_prefix_rows(self, prefix):
+        """Find the rows with paths that start with a prefix.
+
+        Args:
+            prefix: Leading part of the path names.
+
+        Returns: Ascending list of row numbers.
+        """
+        rows = []
+        target = '\n' + prefix
+        pos = self.buffer.find(target)
+        while pos >= 0 and pos < len(self.buffer) - 1:
+            rows.append(bisect_left(self.offsets, pos + 1))
+            pos = self.buffer.find(target, pos + 1)
+        return rows
+
+    def select(self, typeregex=None, prefix=None):
+        """Find the rows that satisfy the change type and path prefix
+        conditions.
+
+        Args:
+            typeregex: Change type RegexTag evaluator, or None.
+            prefix: Leading part of the path names, or None.
+
+        Returns: Ascending list of row numbers.
+        """
+        if typeregex:
+            codes = self.get_type_codes(typeregex)
+            if not prefix: return self.get_type_rows(codes)
+            return [row for row in self.get_prefix_rows(prefix)
+                    if self.codes[row] in codes]
+        if prefix: return self.get_prefix_rows(prefix)
+        return range(len(self))
+
+    def get_replaced(self):
+        """Find the replaced rows. A path that's both added and
+        deleted is a replacement.
+
+        Returns: Set of row numbers.
+        """
+        if self.replaced != None: return self.replaced
+
+        # Only the added and deleted rows need to be looked at.
+        edits = dict()
+        replaced = set()
+        typeflags = [ChangeItem.get_flags(chgtype) & (
+                ChangeItem.ADD | ChangeItem.DELETE)
+                     for chgtype in self.typenames]
+        codes = set(code for code, edit in enumerate(typeflags) if edit)
+        for row in self.get_type_rows(codes):
+            edit = typeflags[self.codes[row]]
+            other = edits.setdefault(self.get_path(row), (row, edit))
+            if other[1] & edit == 0:
+                replaced.update([row, other[0]])
+        self.replaced = replaced
+        return replaced
+
+    def get_item(self, row):
+        """Make a change item for a row.
+
+        Args:
+            row: Row number.
+
+        Returns: Change item.
+        """
+        item = ChangeItem.make(self.typenames[self.codes[row]],
+                               self.get_path(row))
+        item.replaced = row in self.get_replaced()
+        if row in self.sources: item.set_source(self.sources[row])
+        return item
 
 class ChangeItem(object):
     """Change Listing Item Class
@@ -414,61 +2173,188 @@ class ChangeItem(object):
     Use the first "svnlook change" line to determine how to separate
     the change flags from the change path. Subsequent change lines are
     parsed using the previously-determined format.
+
+    The change flag columns are decoded once, into a bit mask, so that
+    the change type checks don't need to examine the type string.
     """
 
-    def __init__(self, chgline):
+    # Keep large change lists compact.
+    __slots__ = ['type', 'path', 'flags', 'replaced', 'source']
+
+    # Change flag bits.
+    ADD             = 0x01
+    DELETE          = 0x02
+    UPDATE_CONTENT  = 0x04
+    UPDATE_PROPERTY = 0x08
+    PROPERTY_ONLY   = 0x10
+    COPY            = 0x20
+
+    # Decoded flags, by change type string.
+    typeflags = dict()
+
+    def __init__(self, chgline, delimidx=None):
         """Parse a change line.
 
         Args:
             chgline: Svnlook line to parse.
+            delimidx: Index of the first path character. Determined
+              from the line, when not provided.
         """
-        # If the delimiter index isn't known, figure it out. Scan the
-        # characters of the first change line.
-        if not hasattr(self, 'delimidx'):
-            self.delimidx = state = 0
-            for chgchar in chgline:
+        if delimidx == None: delimidx = self.get_delimidx(chgline)
 
-                # Look for the first non-space character.
-                if state == 0 and chgchar != ' ': state = 1
+        # Parse the change line. There are only a few distinct change
+        # types, so share the type strings and their decoded flags.
+        chgtype = chgline[:delimidx - 1]
+        try:
+            self.type, self.flags = self.typeflags[chgtype]
+        except KeyError:
+            self.type = intern(chgtype)
+            self.flags = self.get_flags(chgtype)
+            self.typeflags[self.type] = (self.type, self.flags)
+        self.path = chgline[delimidx:]
+
+        # Initialize the replaced path flag and copy source.
+        self.replaced = False
+        self.source = None
 
-                # Look for the next space character.
-                elif state == 1 and chgchar == ' ': state = 2
+    @classmethod
+    def make(cls, chgtype, path):
+        """Make a change item from its parts.
+
+        Args:
+            chgtype: Change type string.
+            path: Change path.
 
-                # Look for the first path character.
-                elif state == 2 and chgchar != ' ': break
-                
-                # Increment the delimiter position.
-                self.delimidx += 1
+        Returns: Change item.
+        """
+        item = cls.__new__(cls)
+        try:
+            item.type, item.flags = cls.typeflags[chgtype]
+        except KeyError:
+            item.type = intern(chgtype)
+            item.flags = cls.get_flags(chgtype)
+            cls.typeflags[item.type] = (item.type, item.flags)
+        item.path = path
+        item.replaced = False
+        item.source = None
+        return item
+
+    @classmethod
+    def parse(cls, output):
+        """Parse the complete output of a "svnlook changed" command.
 
-        # Parse the change line.
-        self.type = chgline[:self.delimidx - 1]
-        self.path = chgline[self.delimidx:]
+        Args:
+            output: Change lines produced by the command.
 
-        # Initialize the replaced path flag.
-        self.replaced = False
+        Returns: List of change items.
+        """
+        chglines = output.splitlines()
+        if not chglines: return []
+
+        # Use the first change line format for all of the lines.
+        # Attach the copy source lines to the preceding items.
+        delimidx = cls.get_delimidx(chglines[0])
+        changes = []
+        for chgline in chglines:
+            if chgline.startswith(' '):
+                if changes: changes[-1].set_source(chgline)
+            else:
+                changes.append(cls(chgline, delimidx))
+        return changes
+
+    @staticmethod
+    def get_delimidx(chgline):
+        """Find where the path starts in a change line.
+
+        Args:
+            chgline: Svnlook line to scan.
+
+        Returns: Index of the first path character.
+        """
+        # Scan the characters of the change line.
+        delimidx = state = 0
+        for chgchar in chgline:
+
+            # Look for the first non-space character.
+            if state == 0 and chgchar != ' ': state = 1
+
+            # Look for the next space character.
+            elif state == 1 and chgchar == ' ': state = 2
+
+            # Skip the copy flag column. It's followed by a space.
+            elif state == 2 and chgchar == '+' \
+                    and chgline[delimidx + 1:delimidx + 2] == ' ':
+                state = 3
+
+            # Look for the first path character.
+            elif state >= 2 and chgchar != ' ': break
+
+            # Increment the delimiter position.
+            delimidx += 1
+
+        return delimidx
+
+    @classmethod
+    def get_flags(cls, chgtype):
+        """Decode the flag columns of a change type.
+
+        Args:
+            chgtype: Change type string.
+
+        Returns: Bit mask of change flags.
+        """
+        action = chgtype[:1]
+        propmod = chgtype[1:2]
+
+        flags = 0
+        if action == 'A': flags |= cls.ADD
+        elif action == 'D': flags |= cls.DELETE
+        elif action == 'U': flags |= cls.UPDATE_CONTENT
+        if propmod == 'U':
+            flags |= cls.UPDATE_PROPERTY
+            if action == '_': flags |= cls.PROPERTY_ONLY
+        if chgtype[2:3] == '+': flags |= cls.COPY
+
+        return flags
+
+    def set_source(self, infoline):
+        """Save the copy source of the change.
+
+        Args:
+            infoline: Svnlook copy info line, like "(from path:rN)".
+        """
+        match = re.match(r'\s*\(from (.*):r(\d+)\)$', infoline)
+        if match: self.source = (match.group(1), match.group(2))
 
     def is_add(self):
         """Is the change an add operation?"""
-        return re.match(r'A', self.type) != None
+        return self.flags & self.ADD != 0
 
     def is_delete(self):
         """Is the change a delete operation?"""
-        return re.match(r'D', self.type) != None
+        return self.flags & self.DELETE != 0
 
     def is_update(self):
         """Is the change a content or property update?"""
-        return re.search(r'U', self.type) != None
+        return self.flags & (
+            self.UPDATE_CONTENT | self.UPDATE_PROPERTY) != 0
 
     def is_update_content(self):
         """Is the change a content update?"""
-        return re.match(r'U', self.type) != None
+        return self.flags & self.UPDATE_CONTENT != 0
 
     def is_update_property(self):
         """Is the change a property update?"""
-        return re.match(r'_U', self.type) != None
+        return self.flags & self.PROPERTY_ONLY != 0
+
+    def is_copy(self):
+        """Is the change a copy operation?"""
+        return self.flags & self.COPY != 0
 
     def is_update_all(self):
         """Is the change both a content and property update?"""
-        return re.match(r'UU', self.type) != None
+        return self.flags & (
+            self.UPDATE_CONTENT | self.UPDATE_PROPERTY) == (
+            self.UPDATE_CONTENT | self.UPDATE_PROPERTY)
 
 ########################### end of file ##############################
@@ -6,11 +6,16 @@ __version__ = '3.00'
 __all__     = ['Filter']
 
 import actions
+from contexts import ChangeItem
 
+import hashlib
 import inspect
 import logging
+import multiprocessing
 import re
-import sys, subprocess, shlex, errno
+import sre_constants, sre_parse
+import sys
+import time
 
 logger = logging.getLogger()
 
@@ -23,12 +28,57 @@ class Filter(actions.Action):
     Also used to process root hook actions.
     """
 
+    # Names of the tokens set for each iteration of the child
+    # actions, by filters that iterate.
+    looptokens = []
+
+    # Names of the tokens that the filter condition depends on, if
+    # known. Filters that read no loop tokens are loop-invariant.
+    inputs = None
+
+    # Result of the filter condition, once evaluated. Instances of
+    # loop-invariant filters keep it for every iteration.
+    matched = None
+
+    # Kinds of run-wide repository data that the filter uses.
+    requires = []
+
+    # Names of the tokens that the filter sets for its child actions.
+    outputs = []
+
+    # Estimated seconds to check the filter condition. Only set for
+    # filters that run their child actions once, or not at all. These
+    # may be reordered.
+    cost = None
+
+    @classmethod
+    def get_requires(cls, filtertag):
+        """Get the kinds of run-wide repository data that a filter
+        element uses.
+
+        Args:
+          filtertag: Element of the filter.
+
+        Returns: List of data kinds.
+        """
+        return cls.requires
+
     def run(self):
         """Execute child actions, until one of them sets a non-zero
         exit code.
 
         Returns: Exit code of the filter.
         """
+        # When gathering filter statistics, note that the condition
+        # passed.
+        if self.context.filterstats != None: self.checked = time.time()
+
+        # If the configuration was compiled, run the function
+        # generated for this element.
+        if self.context.runners:
+            runner = self.context.runners.get(self.thistag)
+            if runner: return runner(self)
+
         # Get the child element iterator.
         if hasattr(self.thistag, 'iterfind'):
             childiter = self.thistag.iterfind(r'./*')
@@ -42,26 +92,27 @@ class Filter(actions.Action):
 
             # Look for an action handler class that matches the
             # child tag name.
-            action = None
-            for module in actionmodules:
-                try:
-                    action = getattr(module, childtag.tag)
-                    break
-                except AttributeError:
-                    continue
+            action = get_action(childtag.tag)
 
             # Ignore non-action (parameter) tags.
             if not action: continue
 
-            # Construct and run the child action.
+            # Construct and run the child action. When profiling,
+            # time it by its path in the configuration.
             logger.debug('Running "{0}"...'.format(childtag.tag))
+            profiler = self.context.profiler
             try:
-                exitcode = action(self.context, childtag).run()
+                if profiler:
+                    with profiler.span(
+                            profiler.get_name(self.thistag, childtag)):
+                        exitcode = self.construct(action, childtag).run()
+                elif self.context.filterstats != None \
+                        and getattr(action, 'cost', None) != None:
+                    exitcode = self.check(action, childtag)
+                else:
+                    exitcode = self.construct(action, childtag).run()
             except Exception as e:
-                logger.exception(e)
-                sys.stderr.write('Internal hook error.'
-                                 + ' Please notify administrator.')
-                return -1
+                return internal_error(e)
 
             # If the child action generated a non-zero exit code, stop
             # processing child actions.
@@ -71,6 +122,53 @@ class Filter(actions.Action):
         # Return the current exit code.
         return exitcode
 
+    def construct(self, action, childtag):
+        """Construct a child action. A loop-invariant filter is only
+        constructed once per run, and then reused.
+
+        Args:
+          action: Action handler class.
+          childtag: Element of the child action.
+
+        Returns: Action handler instance.
+        """
+        invariants = self.context.invariants
+        if childtag not in invariants:
+            return action(self.context, childtag)
+
+        instance = invariants[childtag]
+        if instance == None:
+            instance = invariants[childtag] \
+                = action(self.context, childtag)
+        else:
+            self.context.count('filters_reused')
+        return instance
+
+    def check(self, action, childtag):
+        """Run a child filter, and record how long its condition took
+        and whether it passed.
+
+        Args:
+          action: Filter handler class.
+          childtag: Element of the child filter.
+
+        Returns: Exit code of the child filter.
+        """
+        started = time.time()
+        instance = self.construct(action, childtag)
+        instance.checked = None
+        exitcode = instance.run()
+
+        passed = instance.checked != None
+        if passed: elapsed = instance.checked - started
+        else: elapsed = time.time() - started
+        stats = self.context.filterstats.setdefault(
+            action.__name__, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += int(passed)
+        stats[2] += elapsed
+        return exitcode
+
 class FilterAddNameCase(Filter):
     """Added Entries Name Case Filter Class
 
@@ -82,71 +180,11 @@ class FilterAddNameCase(Filter):
     Output Tokens: ParentFolder, AddedName, ExistingName
     """
 
-    def __init__(self, *args, **kwargs):
-        # Construct the base instance.
-        super(FilterAddNameCase, self).__init__(*args, **kwargs)
-
-        # Initialize the repository listing cache.
-        self.listings = dict();
-
-    def get_listing(self, folder):
-        """Get the existing entries in a repository folder.
-
-        Args:
-          folder: Path name of the repository folder.
-
-        Returns: Map of uppercased existing folder entry names
-        versus original folder entry names.
-        """
-        # If the listing was previously produced, return it.
-        if folder in self.listings: return self.listings[folder]
-
-        # This is a new folder. Start with an empty list.
-        listing = self.listings[folder] = dict()
+    inputs = []
+    outputs = ['ParentFolder', 'AddedName', 'ExistingName']
+    cost = 0.05
 
-        # Request the parent folder listing.
-        cmdline = 'svnlook tree "{0}" "{1}" --non-recursive'\
-            .format(self.context.repospath, folder)
-        logger.debug('Execute: ' + cmdline)
-        try:
-            p = subprocess.Popen(
-                shlex.split(cmdline),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=False)
-
-        # If unable to execute, complain.
-        except Exception as e:
-            logger.error(e)
-            raise e
-
-        # The process started, wait for it to finish.
-        p.wait()
-
-        # The parent folder may be added, as part of this
-        # revision. Treat the "file not found" error as
-        # returning an empty listing - so we don't ask for it
-        # again.
-        if p.returncode == errno.ENOENT: return listing
-        elif p.returncode != 0:
-            errstr = p.stderr.read().strip()
-            msg = 'Command failed: {0}: {1}'.format(cmdline, errstr)
-            logger.error(msg)
-            raise RuntimeError(msg)
-
-        # Parse the folder listing.
-        for line in p.stdout.readlines():
-            logger.debug('line = "{0}"'.format(line.rstrip()))
-
-            # Skip blank lines and headers.
-            match = re.match(r'\s((\S+?)/?)$', line.rstrip())
-            if match == None: continue
-
-            # Add the entry to the listing.
-            name, value = match.group(2,1)
-            listing[name.upper()] = value
-
-        return listing
+    requires = ['changes']
 
     def run(self):
         """Look for a name case conflict.
@@ -169,7 +207,7 @@ class FilterAddNameCase(Filter):
                     .format(folder, typedname, name))
 
             # Skip entries not in the case-insensitive listing.
-            listing = self.get_listing(folder)
+            listing = self.context.get_listing(folder)
             if name.upper() not in listing: continue
 
             # Add tokens for the conflict details.
@@ -196,6 +234,11 @@ class FilterAuthor(Filter):
     Output Tokens: Author
     """
 
+    inputs = []
+    requires = ['author']
+    outputs = ['Author']
+    cost = 0.01
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -208,21 +251,22 @@ class FilterAuthor(Filter):
             raise ValueError('Required tag missing: AuthorRegex')
         self.regex = RegexTag(regextag, re.IGNORECASE)
 
-        # Get the author of the transaction or revision. This will
-        # cache the author name in the "Author" token.
-        self.author = self.context.get_author()
-        logger.debug('author = "{0}"'.format(self.author))
-
     def run(self):
         """If author conditions match, run child actions.
 
         Returns: Exit code produced by filter and child actions.
         """
+        # Get the author of the transaction or revision. The context
+        # caches it.
+        author = self.context.get_author()
+        logger.debug('author = "{0}"'.format(author))
+
         # If the author doesn't match, don't do anything.
-        if not self.regex.search(self.author): return 0
+        if self.matched == None: self.matched = self.regex.search(author)
+        if not self.matched: return 0
 
         # Execute the child actions.
-        self.context.tokens['Author'] = self.author
+        self.context.tokens['Author'] = author
         return super(FilterAuthor, self).run()
 
 class FilterBreakUnlock(Filter):
@@ -233,6 +277,9 @@ class FilterBreakUnlock(Filter):
     Input Tokens: BreakUnlock
     """
 
+    inputs = ['BreakUnlock']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -270,6 +317,9 @@ class FilterCapabilities(Filter):
     Input Tags: CapabilitiesRegex
     """
 
+    inputs = ['Capabilities']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -293,7 +343,9 @@ class FilterCapabilities(Filter):
         Returns: Exit code produced by filter and child actions.
         """
         # If the capabilities don't match, do nothing.
-        if not self.regex.search(self.capabilities): return 0
+        if self.matched == None:
+            self.matched = self.regex.search(self.capabilities)
+        if not self.matched: return 0
 
         # Perform the child actions.
         return super(FilterCapabilities, self).run()
@@ -307,6 +359,9 @@ class FilterChgType(Filter):
     Input Tags: ChgTypeRegex
     """
 
+    inputs = ['ChgType']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -343,6 +398,9 @@ class FilterComment(Filter):
     Input Tags: CommentRegex
     """
 
+    inputs = ['Comment']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -377,9 +435,12 @@ class FilterCommitList(Filter):
 
     Input Tokens: ReposPath, Transaction, Revision
     Input Tags: PathRegex, ChgTypeRegex
-    Output Tokens: Path, ChgType
+    Output Tokens: Path, ChgType, CopyFromPath, CopyFromRev
     """
 
+    looptokens = ['Path', 'ChgType', 'CopyFromPath', 'CopyFromRev']
+    requires = ['changes']
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -390,6 +451,10 @@ class FilterCommitList(Filter):
         self.matchfirst = self.get_boolean('matchFirst')
         logger.debug('matchFirst = {0}'.format(self.matchfirst))
 
+        # Save the "use the columnar change table" flag.
+        self.columnar = self.get_boolean('columnar')
+        logger.debug('columnar = {0}'.format(self.columnar))
+
         # Construct a regular expression tag evaluator for the path
         # names.
         pathregextag = self.thistag.find('PathRegex')
@@ -411,15 +476,152 @@ class FilterCommitList(Filter):
             raise ValueError(
                 'Required tag missing: PathRegex or ChgTypeRegex')
 
+        # Get the number of concurrent background fetches to use for
+        # the per-path data of the child filters.
+        self.prefetch = int(self.thistag.get('prefetch', default=0))
+        logger.debug('prefetch = {0}'.format(self.prefetch))
+
+        # Get the number of worker processes to use for the content
+        # scans of the child filters.
+        self.scanprocesses = int(
+            self.thistag.get('scanProcesses', default=0))
+        logger.debug('scanProcesses = {0}'.format(self.scanprocesses))
+
+        # Determine which per-path data the child filters need. When
+        # scanning in worker processes, collect the content regular
+        # expressions.
+        self.fetchkinds = []
+        self.scanpatterns = []
+        self.scangates = None
+        if self.prefetch > 0 or self.scanprocesses > 0:
+            if hasattr(self.thistag, 'iter'):
+                descendants = self.thistag.iter()
+            else:
+                descendants = self.thistag.getiterator()
+            for element in descendants:
+                if element.tag == 'FilterFileContent':
+                    if self.scanprocesses > 0:
+                        kind = 'scan'
+                        self.add_scan_pattern(element)
+                    else:
+                        kind = 'content'
+                elif element.tag == 'FilterPropList':
+                    kind = 'properties'
+                else: continue
+                if kind not in self.fetchkinds \
+                        and (kind == 'scan' or self.prefetch > 0):
+                    self.fetchkinds.append(kind)
+
+    @classmethod
+    def get_requires(cls, filtertag):
+        """Get the kinds of run-wide repository data that a commit
+        list element uses.
+
+        Args:
+          filtertag: Element of the filter.
+
+        Returns: List of data kinds.
+        """
+        if re.match(r'(1|true|yes)$', filtertag.get('columnar', '0'),
+                    re.IGNORECASE):
+            return ['changetable']
+        return cls.requires
+
+    def add_scan_pattern(self, filtertag):
+        """Add the regular expression of a content filter to the list
+        sent to the scan processes. Combine its gates with those of
+        the other content filters: a file is only scanned if one of
+        the filters would read it.
+
+        Args:
+          filtertag: Element instance for the content filter.
+        """
+        maxbytes = filtertag.get('maxBytes')
+        if maxbytes != None: maxbytes = int(maxbytes)
+        gates = dict(
+            (name, re.match(r'(1|true|yes)$', filtertag.get(attr, '0'),
+                            re.IGNORECASE) != None)
+            for name, attr in [('skipbinary', 'skipBinary'),
+                               ('fullscan', 'fullScan')])
+        gates['maxbytes'] = maxbytes
+        if self.scangates != None:
+            if self.scangates['maxbytes'] == None or maxbytes == None:
+                gates['maxbytes'] = None
+            else:
+                gates['maxbytes'] = max(maxbytes,
+                                        self.scangates['maxbytes'])
+            gates['skipbinary'] &= self.scangates['skipbinary']
+            gates['fullscan'] |= self.scangates['fullscan']
+        self.scangates = gates
+
+        regextag = filtertag.find('ContentRegex')
+        if regextag == None or regextag.text == None: return
+        regex = RegexTag(regextag)
+        pattern = (regex.fingerprint, regextag.text, regex.regex.flags)
+        if pattern not in self.scanpatterns:
+            self.scanpatterns.append(pattern)
+
     def run(self):
         """Filter actions based on changes.
 
         Returns: Exit code produced by filter and child actions.
         """
-        # Get the dictionary of changes.
-        changes = self.context.get_changes()
+        # When the path regex starts with a literal folder prefix,
+        # only look at the changes under that prefix.
+        prefix = None
+        if self.pathregex and self.pathregex.sense:
+            prefix = self.pathregex.prefix
+
+        # Pick out the matching changes. With the columnar table, the
+        # change type and prefix are checked over whole columns.
+        # Otherwise, go through the changes as they're listed.
+        # Stopping early won't wait for the rest of the list.
+        if self.columnar:
+            matches = self.get_table_matches(prefix)
+        else:
+            if prefix:
+                changes = self.context.get_change_index().get_under(
+                    prefix)
+            else:
+                changes = self.context.iter_changes()
+            matches = self.get_matches(changes)
+
+        # If the child filters need per-path data, fetch it ahead of
+        # time.
+        if self.fetchkinds:
+            matches = self.context.prefetch(
+                matches, self.fetchkinds, self.prefetch,
+                self.scanprocesses, self.scanpatterns, self.scangates)
+
+        # Handle the matching changes, in order.
+        for change in matches:
+
+            # Save the triggering change details.
+            if change.source: source = change.source
+            else: source = ('', '')
+            frame = {'Path': change.path, 'ChgType': change.type,
+                     'CopyFromPath': source[0],
+                     'CopyFromRev': source[1]}
+
+            # Execute the child actions. If they produce a non-zero
+            # exit code, or if only looking for the first match, stop
+            # checking.
+            with self.context.token_frame(frame):
+                exitcode = super(FilterCommitList, self).run()
+            if exitcode or self.matchfirst: return exitcode
+
+        # Either nothing matched, or the child actions were
+        # successful.
+        return 0
+
+    def get_matches(self, changes):
+        """Compare the changes to the regular expressions.
+
+        Args:
+          changes: Iterable of change items.
 
-        # Compare the changes to the regular expressions.
+        Returns: Generator of the matching change items.
+        """
         for change in changes:
             logger.debug('path = "{0}"'.format(change.path))
             logger.debug('chgtype = "{0}"'.format(change.type))
@@ -434,14 +636,98 @@ class FilterCommitList(Filter):
                     and not self.typeregex.match(change.type):
                 continue
 
-            # Save the triggering change details.
-            self.context.tokens['Path'] = change.path
-            self.context.tokens['ChgType'] = change.type
+            yield change
+
+    def get_table_matches(self, prefix):
+        """Compare the columnar changes to the regular expressions.
+        Only the rows that pass become change items.
+
+        Args:
+          prefix: Required leading part of the paths, or None.
+
+        Returns: Generator of the matching change items.
+        """
+        table = self.context.get_change_table()
+        for row in table.select(self.typeregex, prefix):
+
+            # Check for a change path mismatch.
+            if self.pathregex \
+                    and not self.pathregex.search(table.get_path(row)):
+                continue
+
+            yield table.get_item(row)
+
+class FilterDiffContent(Filter):
+    """Diff Content Filter Class
+
+    Check for content in the lines a change added to (or removed from)
+    an included file. Only the differences are examined, so the cost
+    follows the size of the change - not the size of the file.
+
+    Input Tokens: ReposPath, Transaction, Revision, Path
+    Input Tags: ContentRegex
+    Output Tokens: LineNumber, MatchText (whole line, if not a match)
+    """
+
+    looptokens = ['LineNumber', 'MatchText']
+    requires = ['diffs']
+
+    def __init__(self, *args, **kwargs):
+        """Get the filter execution parameters."""
+
+        # Construct the base instance.
+        super(FilterDiffContent, self).__init__(*args, **kwargs)
+
+        # Get the regular expression tag evaluator.
+        regextag = self.thistag.find('ContentRegex')
+        if regextag == None:
+            raise ValueError('Required tag missing: ContentRegex')
+        self.regex = RegexTag(regextag)
+
+        # Get the kind of lines to examine.
+        self.lines = self.thistag.get('lines', default='added')
+        if self.lines not in ['added', 'removed']:
+            raise ValueError('Illegal lines attribute: {0}'
+                             .format(self.lines))
+        logger.debug('lines = {0}'.format(self.lines))
+
+        # Save the "stop on first match" flag.
+        self.matchfirst = self.get_boolean('matchFirst')
+        logger.debug('matchFirst = {0}'.format(self.matchfirst))
+
+        # Get the current path. (This may point to a folder.)
+        self.path = self.context.tokens['Path']
+        logger.debug('path = "{0}"'.format(self.path))
+
+    def run(self):
+        """Filter actions based on changed file lines.
+
+        Returns: Exit code produced by filter and child actions.
+        """
+        # Silently ignore folder paths.
+        if re.search(r'/$', self.path): return 0
+
+        # Get the added or removed lines of the file.
+        diff = self.context.get_diff(self.path)
+        if diff == None: lines = []
+        elif self.lines == 'added': lines = diff.added
+        else: lines = diff.removed
+
+        # Act on each matching line. With a false sense, act on each
+        # line that doesn't match.
+        for lineno, text in lines:
+            match = self.regex.regex.search(text)
+            if (match != None) != self.regex.sense: continue
+
+            # Save the triggering line details.
+            if match: text = match.group(0)
+            frame = {'LineNumber': str(lineno), 'MatchText': text}
 
             # Execute the child actions. If they produce a non-zero
             # exit code, or if only looking for the first match, stop
             # checking.
-            exitcode = super(FilterCommitList, self).run()
+            with self.context.token_frame(frame):
+                exitcode = super(FilterDiffContent, self).run()
             if exitcode or self.matchfirst: return exitcode
 
         # Either nothing matched, or the child actions were
@@ -451,11 +737,19 @@ class FilterCommitList(Filter):
 class FilterFileContent(Filter):
     """File Content Filter Class
 
-    Check for content in an included file.
+    Check for content in an included file. Unless a full scan is
+    requested, content that a change didn't touch is skipped: property
+    changes, and copies identical to their source. Files larger than
+    maxBytes, and binary files when skipBinary is set, are skipped
+    without reading all of their content.
 
-    Input Tokens: ReposPath, Transaction, Revision, Path
+    Input Tokens: ReposPath, Transaction, Revision, Path, ChgType,
+      CopyFromPath, CopyFromRev
     """
 
+    inputs = ['Path', 'ChgType', 'CopyFromPath', 'CopyFromRev']
+    cost = 0.5
+
     def __init__(self, *args, **kwargs):
         """Get the filter execution parameters."""
 
@@ -471,7 +765,24 @@ class FilterFileContent(Filter):
         # Get the current path. (This may point to a folder.)
         self.path = self.context.tokens['Path']
         logger.debug('path = "{0}"'.format(self.path))
-        
+
+        # Get the "scan unchanged content" flag.
+        self.fullscan = self.get_boolean('fullScan')
+        logger.debug('fullScan = {0}'.format(self.fullscan))
+
+        # Get the largest file size to scan.
+        try:
+            self.maxbytes = self.thistag.attrib['maxBytes']
+        except KeyError:
+            self.maxbytes = None
+        else:
+            self.maxbytes = int(self.maxbytes)
+        logger.debug('maxBytes = {0}'.format(self.maxbytes))
+
+        # Get the "ignore binary files" flag.
+        self.skipbinary = self.get_boolean('skipBinary')
+        logger.debug('skipBinary = {0}'.format(self.skipbinary))
+
     def run(self):
         """Filter actions based on file content.
 
@@ -480,15 +791,209 @@ class FilterFileContent(Filter):
         # Silently ignore folder paths.
         if re.search(r'/$', self.path): return 0
 
-        # Get the indicated file content.
-        content = self.context.get_file_content(self.path)
+        # Get the change flags, when known.
+        if 'ChgType' in self.context.tokens:
+            flags = ChangeItem.get_flags(self.context.tokens['ChgType'])
+        else:
+            flags = 0
+
+        # Deleted files have no content.
+        if flags & ChangeItem.DELETE: return 0
+
+        # Skip property changes. The content is the same.
+        if not self.fullscan and flags & ChangeItem.PROPERTY_ONLY:
+            logger.debug('Skipped unchanged content.')
+            return 0
+
+        # Skip files that are too large, without reading them.
+        if self.maxbytes != None \
+                and self.context.get_file_size(self.path) > self.maxbytes:
+            logger.debug('Skipped large file.')
+            return 0
+
+        # Skip files Subversion treats as binary. Only use the MIME
+        # type when the properties are already known.
+        if self.skipbinary:
+            mimetype = self.context.get_mime_type(self.path)
+            if mimetype and not mimetype.startswith('text/'):
+                logger.debug('Skipped binary MIME type.')
+                return 0
+
+        # Skip copies that are identical to their source. Compare
+        # the stored content checksums, when they're known.
+        copy = not self.fullscan and flags & ChangeItem.COPY
+        unchanged = None
+        if copy: unchanged = self.context.is_unchanged_copy(self.path)
+        if unchanged:
+            logger.debug('Skipped unchanged copy content.')
+            return 0
+
+        # Use the result of a background scan, if one was made.
+        # Copies that weren't compared yet still need their content,
+        # for the source comparison.
+        scan = self.context.get_scan(self.path)
+        if scan != None and self.skipbinary and scan['binary']:
+            logger.debug('Skipped binary content.')
+            return 0
+        if scan != None and self.regex.fingerprint in scan \
+                and (not copy or unchanged == False):
+            if scan[self.regex.fingerprint] != self.regex.sense:
+                return 0
+            return super(FilterFileContent, self).run()
+
+        # Use the cached result for the stored content, if there is
+        # one. Its key comes from the repository storage, so the
+        # content isn't read.
+        cache = self.context.get_scan_cache()
+        key = None
+        if cache and (not copy or unchanged == False):
+            key = self.context.get_content_key(self.path)
+        if key:
+            binary = None
+            if self.skipbinary: binary = cache.get(key + 'binary')
+            if binary:
+                logger.debug('Skipped binary content.')
+                return 0
+            found = cache.get(key + self.regex.fingerprint)
+            if found != None and (binary == False or not self.skipbinary):
+                logger.debug('Using cached content scan result.')
+                if found != self.regex.sense: return 0
+                return super(FilterFileContent, self).run()
+
+        # Get the indicated file content. Binary content may be
+        # rejected after reading its leading bytes. The content may
+        # be a view of the repository storage.
+        content = self.context.get_file_content(
+            self.path, binary=not self.skipbinary, view=True)
+        if key and self.skipbinary:
+            cache.put(key + 'binary', content == None)
+        if content == None:
+            logger.debug('Skipped binary content.')
+            return 0
+
+        # Otherwise, compare copies to their source content.
+        if copy and unchanged == None and self.is_source(content):
+            logger.debug('Skipped unchanged copy content.')
+            return 0
 
         # If the content doesn't match, do nothing.
-        if not self.regex.search(content): return 0
+        if not self.search(content, key): return 0
 
         # Perform the child actions.
         return super(FilterFileContent, self).run()
 
+    def is_source(self, content):
+        """Compare file content to the content of its copy source.
+        This reads the source content, so it's only used when the
+        stored content checksums aren't known.
+
+        Args:
+          content: File content of the copy.
+
+        Returns: True if the content is the same as the source.
+        """
+        tokens = self.context.tokens
+        if 'CopyFromPath' not in tokens or 'CopyFromRev' not in tokens:
+            return False
+        srcpath = tokens['CopyFromPath']
+        srcrev = tokens['CopyFromRev']
+        if not srcpath or not srcrev: return False
+
+        # Compare as buffers. The content may be a view.
+        return buffer(self.context.get_revision_content(
+                srcpath, srcrev)) == buffer(content)
+
+    def search(self, content, key=None):
+        """Compare file content to the regular expression. When the
+        same content was scanned before, use the cached result.
+
+        Args:
+          content: File content to be evaluated.
+          key: Stored content key, when known. It was already looked
+            up.
+
+        Returns: Boolean result of the comparison.
+        """
+        cache = self.context.get_scan_cache()
+        if not cache: return self.regex.search(content)
+
+        # Look for a previous result for the content checksum and
+        # regular expression.
+        found = None
+        if not key:
+            key = hashlib.sha1(content).hexdigest()
+            found = cache.get(key + self.regex.fingerprint)
+        if found == None:
+            found = self.regex.evaluate('search', content)
+            if found == None: return False
+            cache.put(key + self.regex.fingerprint, found)
+        else:
+            logger.debug('Using cached content scan result.')
+
+        # Apply the comparison sense.
+        return found == self.regex.sense
+
+class FilterFileSize(Filter):
+    """File Size Filter Class
+
+    Check the size of an included file, without reading its content.
+    The child actions run when the size is within the minBytes and
+    maxBytes limits.
+
+    Input Tokens: ReposPath, Transaction, Revision, Path
+    Output Tokens: FileSize
+    """
+
+    inputs = ['Path', 'ChgType']
+    outputs = ['FileSize']
+    cost = 0.05
+
+    def __init__(self, *args, **kwargs):
+        """Get the filter execution parameters."""
+
+        # Construct the base instance.
+        super(FilterFileSize, self).__init__(*args, **kwargs)
+
+        # Get the size limits. Require at least one.
+        self.minbytes = self.thistag.get('minBytes')
+        self.maxbytes = self.thistag.get('maxBytes')
+        if self.minbytes == None and self.maxbytes == None:
+            raise ValueError(
+                'Required attribute missing: minBytes or maxBytes')
+        if self.minbytes != None: self.minbytes = int(self.minbytes)
+        if self.maxbytes != None: self.maxbytes = int(self.maxbytes)
+        logger.debug('minBytes = {0}, maxBytes = {1}'.format(
+                self.minbytes, self.maxbytes))
+
+        # Get the current path. (This may point to a folder.)
+        self.path = self.context.tokens['Path']
+        logger.debug('path = "{0}"'.format(self.path))
+
+    def run(self):
+        """Filter actions based on file size.
+
+        Returns: Exit code produced by filter and child actions.
+        """
+        # Silently ignore folder paths. Deleted files have no size.
+        if re.search(r'/$', self.path): return 0
+        if 'ChgType' in self.context.tokens and ChangeItem.get_flags(
+            self.context.tokens['ChgType']) & ChangeItem.DELETE:
+            return 0
+
+        # Get the file size.
+        size = self.context.get_file_size(self.path)
+        logger.debug('size = {0}'.format(size))
+
+        # If the size isn't within the limits, do nothing.
+        if self.minbytes != None and size < self.minbytes: return 0
+        if self.maxbytes != None and size > self.maxbytes: return 0
+
+        # Save the file size.
+        self.context.tokens['FileSize'] = str(size)
+
+        # Perform the child actions.
+        return super(FilterFileSize, self).run()
+
 class FilterLockOwner(Filter):
     """Lock Owner Filter Class
 
@@ -498,6 +1003,10 @@ class FilterLockOwner(Filter):
     Output Tokens: Owner
     """
 
+    inputs = ['Path', 'User']
+    outputs = ['Owner']
+    cost = 0.05
+
     def __init__(self, *args, **kwargs):
         """Get the filter execution parameters."""
 
@@ -509,68 +1018,27 @@ class FilterLockOwner(Filter):
         logger.debug('sense = {0}'.format(self.sense))
 
         # Get the lock location.
-        self.repospath = self.context.tokens['ReposPath']
         self.path = self.context.tokens['Path']
 
         # Get the current user.
         self.user = self.context.tokens['User']
 
-        # Request the path lock details. Since this is a low-volume
-        # hook, there's no need to cache the result.
-        cmd = ['svnlook', 'lock', self.repospath, self.path]
-        logger.debug('Execute: {0}'.format(cmd))
-        try:
-            p = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=False)
-
-        # If unable to execute, complain.
-        except Exception as e:
-            logger.error(e)
-            raise e
-
-        # The process started, wait for it to finish.
-        p.wait()
-
-        # Handle a command failure.
-        if p.returncode != 0:
-            errstr = p.stderr.read().strip()
-            msg = 'Command failed: {0}: {1}'.format(cmd, errstr)
-            logger.error(msg)
-            raise RuntimeError(msg)
-
-        # Extract the lock owner name.
-        self.owner = None
-        for line in p.stdout.readlines():
-            logger.debug('line = "{0}"'.format(line.rstrip()))
-            
-            # Skip the other lines.
-            owner = re.match(r'Owner:\s+(\S+)', line.rstrip())
-            if not owner: continue
-
-            # Save the lock owner and stop looking.
-            self.owner = owner.group(1)
-            logger.debug('owner = "{0}"'.format(self.owner))
-            return
-
-        # Log that it's a new lock.
-        logger.debug('owner = None')
-
     def run(self):
         """Filter actions based on lock ownership.
 
         Returns: Exit code produced by filter and child actions.
         """
+        # Get the lock owner. The context caches it.
+        owner = self.context.get_lock_owner(self.path)
+
         # Determine if this filter doesn't apply.
-        if (self.owner == None \
-                or (self.sense and self.user != self.owner) \
-                or ((not self.sense) and self.user == self.owner)):
+        if (owner == None \
+                or (self.sense and self.user != owner) \
+                or ((not self.sense) and self.user == owner)):
             return 0
 
         # Perform the child actions.
-        self.context.tokens['Owner'] = self.owner
+        self.context.tokens['Owner'] = owner
         return super(FilterLockOwner, self).run()
 
 class FilterLockToken(Filter):
@@ -582,6 +1050,9 @@ class FilterLockToken(Filter):
     Input Tags: LockTokenRegex
     """
 
+    inputs = ['LockToken']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -619,6 +1090,11 @@ class FilterLogMsg(Filter):
     Output Tokens: LogMsg
     """
 
+    inputs = []
+    requires = ['logmsg']
+    outputs = ['LogMsg']
+    cost = 0.01
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -631,20 +1107,21 @@ class FilterLogMsg(Filter):
             raise ValueError('Required tag missing: LogMsgRegex')
         self.regex = RegexTag(regextag)
 
-        # Get the current log message.
-        self.logmsg = self.context.get_log_message()
-        logger.debug('logmsg = "{0}"'.format(self.logmsg))
-
     def run(self):
         """Filter actions based on log message.
 
         Returns: Exit code produced by filter and child actions.
         """
+        # Get the current log message. The context caches it.
+        logmsg = self.context.get_log_message()
+        logger.debug('logmsg = "{0}"'.format(logmsg))
+
         # If the log message doesn't match, don't do anything.
-        if not self.regex.search(self.logmsg): return 0
+        if self.matched == None: self.matched = self.regex.search(logmsg)
+        if not self.matched: return 0
 
         # Execute the child actions.
-        self.context.tokens['LogMsg'] = self.logmsg
+        self.context.tokens['LogMsg'] = logmsg
         return super(FilterLogMsg, self).run()
 
 class FilterPath(Filter):
@@ -656,6 +1133,9 @@ class FilterPath(Filter):
     Input Tags: PathRegex
     """
 
+    inputs = ['Path']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -678,7 +1158,7 @@ class FilterPath(Filter):
         Returns: Exit code produced by filter and child actions.
         """
         # If the path name doesn't match, do nothing.
-        if not self.regex.search(self.path): return
+        if not self.regex.search(self.path): return 0
 
         # Execute the child actions.
         return super(FilterPath, self).run()
@@ -693,6 +1173,8 @@ class FilterPathList(Filter):
     Output Tokens: Path
     """
 
+    looptokens = ['Path']
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -725,8 +1207,8 @@ class FilterPathList(Filter):
             if not self.regex.search(path): return
 
             # Execute the child actions.
-            self.context.tokens['Path'] = path
-            exitcode = super(FilterPathList, self).run()
+            with self.context.token_frame({'Path': path}):
+                exitcode = super(FilterPathList, self).run()
 
             # If only looking for the first, or an error is reported,
             # bail out early.
@@ -745,6 +1227,8 @@ class FilterPropList(Filter):
     Output Tokens: PropName, PropValue
     """
 
+    looptokens = ['PropName', 'PropValue']
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -795,9 +1279,9 @@ class FilterPropList(Filter):
                     and not self.valueregex.search(value): continue
 
             # Execute the child actions.
-            self.context.tokens['PropName'] = name
-            self.context.tokens['PropValue'] = value
-            exitcode = super(FilterPropList, self).run()
+            frame = {'PropName': name, 'PropValue': value}
+            with self.context.token_frame(frame):
+                exitcode = super(FilterPropList, self).run()
 
             # If only looking for the first, or an error is reported,
             # bail out early.
@@ -815,6 +1299,9 @@ class FilterRevProp(Filter):
     Input Tags: PropNameRegex, PropValueRegex
     """
 
+    inputs = ['RevPropName', 'RevPropValue']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -869,6 +1356,9 @@ class FilterStealLock(Filter):
     Input Tokens: StealLock
     """
 
+    inputs = ['StealLock']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -906,6 +1396,9 @@ class FilterUser(Filter):
     Input Tags: UserRegex
     """
 
+    inputs = ['User']
+    cost = 0.00001
+
     def __init__(self, *args, **kwargs):
         """Read parameters from filter configuration."""
 
@@ -928,7 +1421,8 @@ class FilterUser(Filter):
         Returns: Exit code produced by filter and child actions.
         """
         # If the user name doesn't match, do nothing.
-        if not self.regex.match(self.user): return 0
+        if self.matched == None: self.matched = self.regex.match(self.user)
+        if not self.matched: return 0
 
         # Execute the child actions.
         return super(FilterUser, self).run()
@@ -940,6 +1434,10 @@ class RegexTag(object):
     hook configuration XML tag.
     """
 
+    # Expressions already checked for excessive backtracking, as
+    # (pattern, flags) tuples.
+    linted = set()
+
     def __init__(self, regextag, *args):
         """Construct instance from regular expression tag.
 
@@ -952,14 +1450,225 @@ class RegexTag(object):
                 'Required tag content missing: {0}'\
                     .format(regextag.tag))
 
-        # Compile the regular expression.
+        # Compile the regular expression, and warn if it may take
+        # exponential time.
         self.regex = re.compile(regextag.text, *args)
+        self.lint(regextag.tag, self.regex)
+
+        # Get the literal text any match must start with.
+        self.prefix = self.get_prefix(regextag.text, *args)
+
+        # Recognize expressions that only compare literal text. These
+        # are evaluated without the regular expression.
+        self.literals = self.get_literals(regextag.text, *args)
+        self.ignorecase = bool(self.regex.flags & re.IGNORECASE)
+        if self.literals: self.literalset = frozenset(self.literals[2])
+
+        # Identify the expression and its flags, for cached results.
+        self.fingerprint = hashlib.sha1('{0!r}:{1}'.format(
+                regextag.text, self.regex.flags)).hexdigest()
 
         # Determine the true/false sense to apply to the result.
         self.sense = (re.match(r'(1|true|yes)$',
                               regextag.get('sense', default='1'),
                               re.IGNORECASE) != None)
 
+        # Get the maximum number of evaluation seconds, and what to do
+        # when they run out.
+        try:
+            self.seconds = regextag.get('seconds')
+            if self.seconds != None: self.seconds = float(self.seconds)
+        except ValueError:
+            raise ValueError('Illegal seconds attribute: {0}'
+                             .format(regextag.get('seconds')))
+        self.ontimeout = regextag.get('onTimeout', default='reject')
+        if self.ontimeout not in ['reject', 'accept', 'log']:
+            raise ValueError('Illegal onTimeout attribute: {0}'
+                             .format(self.ontimeout))
+
+    @staticmethod
+    def get_prefix(pattern, flags=0):
+        """Get the literal prefix of an anchored regular expression.
+
+        Args:
+          pattern: Regular expression text.
+          flags: Regular expression flags.
+
+        Returns: Literal text that starts all matches, or None.
+        """
+        # Only handle simple, start-anchored, expressions.
+        if flags & (re.IGNORECASE | re.MULTILINE | re.VERBOSE) \
+                or pattern[:1] != '^' or '|' in pattern \
+                or '(?' in pattern:
+            return None
+
+        # Collect the literal characters after the anchor.
+        prefix = ''
+        index = 1
+        while index < len(pattern):
+            char = pattern[index]
+
+            # Accept escaped punctuation. Stop on character classes,
+            # back references and the like.
+            if char == '\\':
+                char = pattern[index + 1:index + 2]
+                if char == '' or char.isalnum(): break
+                prefix += char
+                index += 2
+                continue
+
+            # Stop on the first special character. A quantifier
+            # applies to the preceding literal, so drop that one.
+            if char in '.^$*+?{}[]()':
+                if char in '*+?{': prefix = prefix[:-1]
+                break
+
+            prefix += char
+            index += 1
+
+        return prefix or None
+
+    @staticmethod
+    def get_literals(pattern, flags=0):
+        """Break down an expression that only compares literal text:
+        a literal, or a group of literal alternatives, with optional
+        start and end anchors.
+
+        Args:
+          pattern: Regular expression text.
+          flags: Regular expression flags.
+
+        Returns: Tuple of the start anchor flag, end anchor flag and
+        tuple of literals - or None, for any other expression.
+        """
+        if flags & ~re.IGNORECASE: return None
+
+        # Leave control characters, such as a line break taken from
+        # the tag text, to the regular expression.
+        if re.search(r'[\x00-\x1f\x7f]', pattern): return None
+
+        # Strip the anchors. An escaped dollar sign is a literal.
+        start = pattern[:1] == '^'
+        if start: pattern = pattern[1:]
+        end = re.search(r'(?<!\\)(\\\\)*\$\Z', pattern) != None
+        if end: pattern = pattern[:-1]
+
+        # Split up a group of alternatives.
+        group = re.match(r'\((?:\?:)?([^()]*)\)\Z', pattern)
+        if group:
+            if '\\|' in group.group(1): return None
+            alternatives = group.group(1).split('|')
+        else:
+            alternatives = [pattern]
+
+        # Accept literal characters, and escaped punctuation.
+        literals = []
+        for alternative in alternatives:
+            literal = ''
+            index = 0
+            while index < len(alternative):
+                char = alternative[index]
+                if char == '\\':
+                    char = alternative[index + 1:index + 2]
+                    if char == '' or char.isalnum(): return None
+                    index += 1
+                elif char in '.^$*+?{}[]()|':
+                    return None
+                literal += char
+                index += 1
+            if flags & re.IGNORECASE: literal = literal.lower()
+            literals.append(literal)
+
+        return (start, end, tuple(literals))
+
+    def compare(self, text, anchored):
+        """Compare text to the literals of the expression.
+
+        Args:
+          text: Text to be evaluated.
+          anchored: Flag indicating that a match must start at the
+            beginning of the text.
+
+        Returns: True if the expression would match, or None if the
+        regular expression is needed.
+        """
+        # Case-insensitive comparisons only fold ASCII letters.
+        if not isinstance(text, str): return None
+        if self.ignorecase: text = text.lower()
+
+        start, end, literals = self.literals
+        anchored = anchored or start
+
+        # An end anchor also matches before a trailing newline.
+        if end:
+            if anchored:
+                return text in self.literalset or (
+                    text[-1:] == '\n' and text[:-1] in self.literalset)
+            return text.endswith(literals) or (
+                text[-1:] == '\n' and text[:-1].endswith(literals))
+
+        if anchored: return text.startswith(literals)
+        return any(literal in text for literal in literals)
+
+    @classmethod
+    def lint(cls, name, regex):
+        """Warn about a regular expression that may take exponential
+        time. Each expression is only checked once per run.
+
+        Args:
+          name: Tag name of the expression.
+          regex: Compiled regular expression.
+        """
+        key = (regex.pattern, regex.flags)
+        if key in cls.linted: return
+        cls.linted.add(key)
+        if cls.is_risky(regex.pattern, regex.flags):
+            logger.warning('{0} may backtrack excessively: "{1}"'
+                           .format(name, regex.pattern))
+
+    @staticmethod
+    def is_risky(pattern, flags=0):
+        """Check for nested unbounded repeats, such as "(a+)+". These
+        can take exponential time to fail a match.
+
+        Args:
+          pattern: Regular expression text.
+          flags: Regular expression flags.
+
+        Returns: True if the expression is at risk.
+        """
+        try:
+            return has_nested_repeat(sre_parse.parse(pattern, flags))
+        except sre_constants.error:
+            return False
+
+    def evaluate(self, method, text):
+        """Apply the regular expression to text. With a time limit,
+        the expression is evaluated by a worker process that's killed
+        when the time runs out.
+
+        Args:
+          method: Name of the compiled expression method to use.
+          text: Text to be evaluated.
+
+        Returns: True if the expression found a match, False if it
+        didn't, or None if it ran out of time.
+        """
+        if self.seconds == None:
+            return getattr(self.regex, method)(text) != None
+
+        try:
+            return RegexWorker.evaluate(self.regex, method, text,
+                                        self.seconds)
+        except multiprocessing.TimeoutError:
+            msg = 'Regular expression timed out: "{0}"'\
+                .format(self.regex.pattern)
+            if self.ontimeout == 'reject':
+                logger.error(msg)
+                raise RuntimeError(msg)
+            if self.ontimeout == 'log': logger.warning(msg)
+            return None
+
     def match(self, text):
         """Compare start of the text to the regular expression.
 
@@ -968,10 +1677,14 @@ class RegexTag(object):
 
         Returns: Boolean result of the comparison.
         """
-        if self.sense:
-            return (self.regex.match(text) != None)
-        else:
-            return (self.regex.match(text) == None)
+        if self.literals:
+            found = self.compare(text, True)
+            if found != None: return found == self.sense
+
+        # If the expression ran out of time, the comparison fails.
+        found = self.evaluate('match', text)
+        if found == None: return False
+        return found == self.sense
 
     def search(self, text):
         """Compare all of the text to the regular expression.
@@ -981,9 +1694,264 @@ class RegexTag(object):
 
         Returns: Boolean result of the comparison.
         """
-        if self.sense:
-            return (self.regex.search(text) != None)
-        else:
-            return (self.regex.search(text) == None)
+        # Avoid the regular expression, when the required prefix
+        # isn't there.
+        if self.prefix and text[:len(self.prefix)] != self.prefix:
+            return not self.sense
+
+        if self.literals:
+            found = self.compare(text, False)
+            if found != None: return found == self.sense
+
+        # If the expression ran out of time, the comparison fails.
+        found = self.evaluate('search', text)
+        if found == None: return False
+        return found == self.sense
+
+class RegexWorker(object):
+    """Regular Expression Worker Process
+
+    Evaluate regular expressions in a separate process, so that a run
+    away evaluation can be stopped. The regular expression engine
+    can't be interrupted from within the process that runs it.
+    """
+
+    # Shared process pool. Created when first needed.
+    pool = None
+
+    @classmethod
+    def evaluate(cls, regex, method, text, seconds):
+        """Apply a regular expression to text, in the worker process.
+
+        Args:
+          regex: Compiled regular expression.
+          method: Name of the compiled expression method to use.
+          text: Text to be evaluated.
+          seconds: Maximum seconds to wait for the result.
+
+        Returns: True if the expression found a match.
+
+        Raises:
+          multiprocessing.TimeoutError: The time ran out. The worker
+            process is killed.
+        """
+        if cls.pool == None: cls.pool = multiprocessing.Pool(1)
+
+        # Content views can't be passed to another process.
+        if not isinstance(text, basestring): text = str(text)
+
+        result = cls.pool.apply_async(
+            evaluate_regex,
+            (regex.pattern, regex.flags, method, text))
+        try:
+            return result.get(seconds)
+        except multiprocessing.TimeoutError:
+            cls.pool.terminate()
+            cls.pool.join()
+            cls.pool = None
+            raise
+
+def evaluate_regex(pattern, flags, method, text):
+    """Apply a regular expression to text. Runs in a worker process.
+
+    Args:
+      pattern: Regular expression text.
+      flags: Regular expression flags.
+      method: Name of the compiled expression method to use.
+      text: Text to be evaluated.
+
+    Returns: True if the expression found a match.
+    """
+    return getattr(re.compile(pattern, flags), method)(text) != None
+
+def has_nested_repeat(parsed, repeated=False):
+    """Look for an unbounded repeat within another one.
+
+    Args:
+      parsed: Parsed regular expression, from sre_parse.
+      repeated: Flag indicating that the expression is already inside
+        an unbounded repeat.
+
+    Returns: True if a nested unbounded repeat is found.
+    """
+    for op, av in parsed:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            unbounded = av[1] == sre_constants.MAXREPEAT
+            if unbounded and repeated: return True
+            if has_nested_repeat(av[2], repeated or unbounded):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if has_nested_repeat(av[-1], repeated): return True
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                if has_nested_repeat(branch, repeated): return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if has_nested_repeat(av[1], repeated): return True
+    return False
+
+def get_action(name):
+    """Find the action handler class for a tag name.
+
+    Args:
+      name: Tag name.
+
+    Returns: Action handler class, or None for a parameter tag.
+    """
+    for module in actionmodules:
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            continue
+    return None
+
+def internal_error(e):
+    """Report an unexpected child action failure.
+
+    Args:
+      e: Exception raised by the child action.
+
+    Returns: Exit code for the failure.
+    """
+    logger.exception(e)
+    sys.stderr.write('Internal hook error.'
+                     + ' Please notify administrator.')
+    return -1
+
+def get_invariants(roottag, looptokens=frozenset(), invariants=None):
+    """Find the loop-invariant filters of a hook configuration. These
+    are filters, within iterating filters, whose conditions don't
+    depend on any of the tokens that change between iterations.
+
+    Args:
+      roottag: Element to search below.
+      looptokens: Uppercased names of the tokens that change between
+        iterations of enclosing filters.
+      invariants: Dictionary to add the invariant elements to.
+
+    Returns: Dictionary with a key for each invariant element.
+    """
+    if invariants == None: invariants = dict()
+
+    for childtag in list(roottag):
+        action = get_action(childtag.tag)
+        if not action: continue
+
+        # Check the filter inputs against the loop tokens.
+        if looptokens and getattr(action, 'inputs', None) != None \
+                and not looptokens.intersection(
+                    name.upper() for name in action.inputs):
+            invariants[childtag] = None
+
+        # An iterating filter adds its own loop tokens, and any set
+        # by the actions it runs.
+        innertokens = looptokens
+        if getattr(action, 'looptokens', None):
+            if hasattr(childtag, 'iter'):
+                settags = childtag.iter('SetToken')
+            else:
+                settags = childtag.getiterator('SetToken')
+            innertokens = looptokens.union(
+                [name.upper() for name in action.looptokens]
+                + [tag.get('name', '').upper() for tag in settags])
+        get_invariants(childtag, innertokens, invariants)
+
+    return invariants
+
+def get_requirements(roottag):
+    """Find the kinds of run-wide repository data that a hook
+    configuration always uses. Only the top-level filters are checked.
+    Nested filters only run if the filters above them pass, so their
+    data is left to be fetched when it's first used.
+
+    Args:
+      roottag: Element of the hook configuration.
+
+    Returns: Set of data kinds.
+    """
+    kinds = set()
+    for tag in list(roottag):
+        action = get_action(tag.tag)
+        if action and issubclass(action, Filter):
+            kinds.update(action.get_requires(tag))
+    return kinds
+
+def reorder_filters(roottag, stats=dict()):
+    """Reorder chains of nested filters, so that the cheapest and most
+    selective conditions are checked first. A chain is a run of
+    filters that each run their child actions once, and where each
+    one's only child action is the next. Changing the order of such
+    filters doesn't change the result, unless one of them uses a token
+    that another sets. Those chains are left alone.
+
+    The filters are ranked by their cost, divided by the chance that
+    they reject. Recorded statistics replace the estimates, once there
+    are enough of them.
+
+    Args:
+      roottag: Element to reorder below. It's changed in place.
+      stats: Dictionary of recorded [checks, passes, seconds] lists,
+        by filter class name.
+    """
+    for index, childtag in enumerate(list(roottag)):
+
+        # Follow the chain of nested filters.
+        links = []
+        linktag = childtag
+        while linktag != None:
+            action = get_action(linktag.tag)
+            if not action or getattr(action, 'cost', None) == None: break
+            links.append((linktag, action))
+            inner = [tag for tag in linktag if get_action(tag.tag)]
+            if len(inner) == 1: linktag = inner[0]
+            else: linktag = None
+
+        # Only reorder filters that don't feed each other tokens.
+        inputs = set()
+        outputs = set()
+        for linktag, action in links:
+            inputs.update(name.upper() for name in action.inputs)
+            outputs.update(name.upper() for name in action.outputs)
+        if len(links) < 2 or inputs & outputs:
+            reorder_filters(childtag, stats)
+            continue
+
+        # Separate the filter parameters from the innermost actions.
+        lasttag = links[-1][0]
+        body = [tag for tag in lasttag if get_action(tag.tag)]
+        for linktag, action in links:
+            params = [tag for tag in linktag if not get_action(tag.tag)]
+            del linktag[:]
+            linktag.extend(params)
+
+        # Nest the filters in rank order.
+        links.sort(key=lambda link: get_rank(link[1], stats))
+        for outer, inner in zip(links, links[1:]):
+            outer[0].append(inner[0])
+        links[-1][0].extend(body)
+        roottag.remove(childtag)
+        roottag.insert(index, links[0][0])
+        logger.debug('Filter order: {0}'.format(
+                ', '.join(link[0].tag for link in links)))
+
+        for tag in body: reorder_filters(tag, stats)
+
+def get_rank(action, stats):
+    """Rank a filter for reordering. Lower ranks go first.
+
+    Args:
+      action: Filter handler class.
+      stats: Dictionary of recorded [checks, passes, seconds] lists,
+        by filter class name.
+
+    Returns: Expected cost of the filter, per rejection.
+    """
+    checks, passes, seconds = stats.get(action.__name__, (0, 0, 0.0))
+    if checks >= 20:
+        cost = seconds / checks
+        passrate = float(passes) / checks
+    else:
+        cost = action.cost
+        passrate = 0.5
+    return cost / max(1.0 - passrate, 0.01)
 
 ########################### end of file ##############################
@@ -0,0 +1,331 @@
+"""FSFS Repository Content Access
+
+Provide direct, memory-mapped, access to file content stored in the
+revision files of a local FSFS repository. Only plain (non-deltified)
+representations in physically addressed, unpacked, revision files
+are handled. Anything else is left to svnlook.
+
+The node revision headers also identify the stored representation
+of the content, whatever its form, without reading the content. The
+node revisions of changed paths are found in the changed-path lists
+of the revision and transaction files, so nothing is listed.
+"""
+__version__ = '3.00'
+__all__     = ['FsfsReader']
+
+import logging
+import mmap
+import os
+import re
+
+logger = logging.getLogger()
+
+class FsfsReader(object):
+    """FSFS Revision File Reader
+
+    Map the revision files of a repository into memory, and provide
+    buffer views of plain file representations. The views share the
+    mapped pages, so the content isn't copied.
+    """
+
+    # Number of unmappable representations, without any mappable
+    # ones, that stop further attempts.
+    maxmisses = 8
+
+    def __init__(self, repospath):
+        """Examine the repository storage format.
+
+        Args:
+          repospath: Path name of the local repository.
+        """
+        self.dbpath = os.path.join(repospath, 'db')
+        self.maps = dict()
+        self.changes = dict()
+        self.hits = self.misses = 0
+        self.plain = True
+
+        # Only FSFS repositories have revision files.
+        self.usable = False
+        try:
+            with open(os.path.join(self.dbpath, 'fs-type')) as f:
+                if f.read().strip() != 'fsfs': return
+            with open(os.path.join(self.dbpath, 'format')) as f:
+                lines = f.read().splitlines()
+        except IOError:
+            return
+
+        # Get the revision file layout. Logical addressing uses item
+        # numbers instead of file offsets, so revision files can't be
+        # read. Transaction nodes are kept in files of their own,
+        # either way.
+        self.shardsize = None
+        self.physical = True
+        for line in lines[1:]:
+            fields = line.split()
+            if fields[:2] == ['layout', 'sharded']:
+                self.shardsize = int(fields[2])
+            elif fields[:2] == ['addressing', 'logical']:
+                self.physical = False
+        self.usable = True
+
+    def get_node_id(self, path, revision=None, txnname=None):
+        """Get the node revision ID of a changed path.
+
+        Args:
+          path: Repository path name, without the leading slash.
+          revision: Revision number of a committed change.
+          txnname: Name of the transaction holding an uncommitted
+            change.
+
+        Returns: Node revision ID, or None when the path isn't
+        listed as added or modified.
+        """
+        if not self.usable: return None
+        key = (revision, txnname)
+        if key not in self.changes:
+            self.changes[key] = self.get_changes(revision, txnname)
+        return self.changes[key].get(path)
+
+    def get_changes(self, revision=None, txnname=None):
+        """Read the changed-path list of a revision or transaction.
+
+        Args:
+          revision: Revision number.
+          txnname: Name of the transaction.
+
+        Returns: Dictionary of node revision IDs, by path. Deleted
+        paths aren't included.
+        """
+        if txnname:
+            # Transactions keep their changes in a file of their own.
+            changespath = os.path.join(self.dbpath, 'transactions',
+                                       txnname + '.txn', 'changes')
+            try:
+                with open(changespath, 'rb') as f: data = f.read()
+            except EnvironmentError:
+                return dict()
+        else:
+            # The last line of a revision file holds the offsets of
+            # the root node and the changed-path list.
+            if revision == None or not self.physical: return dict()
+            revfile = self.get_map(revision)
+            if revfile == None: return dict()
+            end = len(revfile) - 1
+            start = revfile.rfind('\n', 0, end) + 1
+            match = re.match(r'\d+ (\d+)$', revfile[start:end])
+            if not match or int(match.group(1)) > start:
+                return dict()
+            data = revfile[int(match.group(1)):start]
+
+        # Each change is followed by its copy source line, which may
+        # be empty. Later changes of a transaction path replace the
+        # earlier ones, and deletions drop the changes below them.
+        changes = dict()
+        for line in data.split('\n')[::2]:
+            match = re.match(
+                r'(\S+) ([a-z]+)\S* (?:(?:true|false) )+/(.*)$', line)
+            if not match: continue
+            path = match.group(3)
+            if match.group(2) in ('delete', 'reset'):
+                for key in changes.keys():
+                    if key == path or key.startswith(path + '/'):
+                        del changes[key]
+            else:
+                changes[path] = match.group(1)
+        return changes
+
+    def get_content(self, nodeid):
+        """Get a view of the content of a file node.
+
+        Args:
+          nodeid: Node revision ID, as shown by "svnlook tree
+            --show-ids".
+
+        Returns: Buffer view of the file content, or None when the
+        content isn't stored as a plain representation.
+        """
+        if not self.usable or not self.physical or not self.plain:
+            return None
+
+        # Most repositories deltify all file content. Stop trying,
+        # once that's apparent.
+        content = self.get_plain(nodeid)
+        if content != None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if self.hits == 0 and self.misses >= self.maxmisses:
+                logger.debug('No plain representations found.')
+                self.plain = False
+        return content
+
+    def get_rep_key(self, nodeid, txnname=None):
+        """Get a key for the content of a file node. Nodes with the
+        same content representation get the same key.
+
+        Args:
+          nodeid: Node revision ID, as shown by "svnlook tree
+            --show-ids".
+          txnname: Name of the transaction holding uncommitted nodes.
+
+        Returns: SHA-1 (or MD5) checksum of the content, as stored in
+        the node revision, or None when it isn't known.
+        """
+        if not self.usable: return None
+        header = self.get_node(nodeid, txnname)
+        if header == None or 'text' not in header: return None
+        return self.get_text_key(header['text'])
+
+    def is_unchanged_copy(self, nodeid, txnname=None):
+        """Check whether a copied file node still has the content of
+        its copy source. The predecessor of a copy is its source.
+
+        Args:
+          nodeid: Node revision ID of the copy.
+          txnname: Name of the transaction holding uncommitted nodes.
+
+        Returns: True if the content is the same, False if it isn't,
+        or None when that isn't known.
+        """
+        if not self.usable: return None
+        header = self.get_node(nodeid, txnname)
+        if header == None or 'copyfrom' not in header \
+                or 'pred' not in header or 'text' not in header:
+            return None
+        source = self.get_node(header['pred'], txnname)
+        if source == None or 'text' not in source: return None
+
+        # Compare the content checksums.
+        key = self.get_text_key(header['text'])
+        if key == None: return None
+        return key == self.get_text_key(source['text'])
+
+    @staticmethod
+    def get_text_key(text):
+        """Get the checksum key of a text representation.
+
+        Args:
+          text: Value of the "text" node revision header field: the
+            revision, offset, size, expanded size, MD5 and (since
+            Subversion 1.6) SHA-1 of the representation.
+
+        Returns: Checksum key, or None.
+        """
+        fields = text.split()
+        if len(fields) >= 6: return fields[5]
+        if len(fields) == 5: return 'md5-' + fields[4]
+        return None
+
+    def get_node(self, nodeid, txnname=None):
+        """Read the header of a committed or transaction node
+        revision.
+
+        Args:
+          nodeid: Node revision ID.
+          txnname: Name of the transaction holding uncommitted nodes.
+
+        Returns: Dictionary of header fields, or None.
+        """
+        # Committed node IDs locate the header in a revision file.
+        match = re.search(r'\.r(\d+)/(\d+)$', nodeid)
+        if match:
+            if not self.physical: return None
+            return self.get_header(int(match.group(1)),
+                                   int(match.group(2)))
+
+        # Uncommitted node revisions are kept in files of their own,
+        # named by node and copy ID.
+        match = re.match(r'([^.]+\.[^.]+)\.t', nodeid)
+        if not match or not txnname: return None
+        nodepath = os.path.join(self.dbpath, 'transactions',
+                                txnname + '.txn', 'node.' + match.group(1))
+        try:
+            with open(nodepath, 'rb') as f:
+                lines = f.read().split('\n\n', 1)[0].splitlines()
+        except EnvironmentError:
+            return None
+        return dict(line.partition(': ')[::2] for line in lines)
+
+    def get_plain(self, nodeid):
+        """Get a view of a plain file representation.
+
+        Args:
+          nodeid: Node revision ID.
+
+        Returns: Buffer view of the file content, or None.
+        """
+        # Only committed node revisions are in the revision files.
+        header = self.get_node(nodeid)
+        if header == None or 'text' not in header: return None
+
+        # Locate the text representation.
+        fields = header['text'].split()
+        revfile = self.get_map(int(fields[0]))
+        if revfile == None: return None
+        offset, size = int(fields[1]), int(fields[2])
+
+        # Only plain representations hold the content as is.
+        if revfile[offset:offset + 6] != 'PLAIN\n' \
+                or offset + 6 + size > len(revfile):
+            return None
+        return buffer(revfile, offset + 6, size)
+
+    def get_header(self, revision, offset):
+        """Read a node revision header.
+
+        Args:
+          revision: Revision number of the node revision.
+          offset: Offset of the header in the revision file.
+
+        Returns: Dictionary of header fields, or None.
+        """
+        revfile = self.get_map(revision)
+        if revfile == None: return None
+
+        # The header ends with an empty line.
+        header = dict()
+        while offset < len(revfile):
+            end = revfile.find('\n', offset)
+            if end <= offset: break
+            name, sep, value = revfile[offset:end].partition(': ')
+            header[name] = value
+            offset = end + 1
+        return header
+
+    def get_map(self, revision):
+        """Map a revision file into memory.
+
+        Args:
+          revision: Revision number.
+
+        Returns: Memory map of the revision file, or None if the
+        revision file isn't available.
+        """
+        if revision in self.maps: return self.maps[revision]
+
+        # Find the revision file. Packed shards aren't supported.
+        if self.shardsize:
+            revpath = os.path.join(self.dbpath, 'revs',
+                                   str(revision // self.shardsize),
+                                   str(revision))
+        else:
+            revpath = os.path.join(self.dbpath, 'revs', str(revision))
+
+        try:
+            with open(revpath, 'rb') as f:
+                revmap = mmap.mmap(f.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError) as e:
+            logger.debug('Revision file not mapped: {0}'.format(e))
+            revmap = None
+
+        self.maps[revision] = revmap
+        return revmap
+
+    def close(self):
+        """Unmap the revision files."""
+        for revmap in self.maps.values():
+            if revmap != None: revmap.close()
+        self.maps.clear()
+
+########################### end of file ##############################
@@ -10,14 +10,20 @@ __all__       = ['StartCommit', 'PreCommit', 'PostCommit',
                  'PreLock', 'PostLock',
                  'PreUnlock', 'PostUnlock']
 
-from filters import Filter
+from filters import Filter, get_invariants, get_requirements, \
+    reorder_filters
 from contexts import *
+from caches import FilterStats, TxnCache
+from codegen import Compiler
+from metrics import Metrics
+from profiler import Profiler
 
 import argparse
 import logging
 import logging.config
 import os, sys
 import re
+import time
 import yaml
 
 from xml.etree.ElementTree import ElementTree
@@ -33,14 +39,26 @@ logger = logging.getLogger()
 class SvnHook(object):
     """Hook Handler Base Class"""
 
-    def __init__(self, context, cfgfile):
+    # Name of the hook, as reported in the metrics.
+    hookname = None
+
+    def __init__(self, context, cfgfile, profile=None, metrics=None,
+                 backend=None):
         """Construct a new object of the class.
 
         Arguments:
         context -- Contextual information for hook processing.
         cfgfile -- Path name of hook configuration file.
+        profile -- Path name of profile output file. Defaults to the
+                   SVNHOOK_PROFILE environment variable.
+        metrics -- Metrics target. Defaults to the SVNHOOK_METRICS
+                   environment variable.
+        backend -- "interpreter" or "compiled". Defaults to the
+                   SVNHOOK_BACKEND environment variable, and then to
+                   "interpreter".
 
         """
+        self.started = time.time()
         if context == None:
             raise ValueError('Required argument missing: context')
         if cfgfile == None:
@@ -82,15 +100,122 @@ class SvnHook(object):
         # Hang onto the context for use in the actions.
         self.context = context
 
+        # Profile the hook run, if requested.
+        if profile == None: profile = os.environ.get('SVNHOOK_PROFILE')
+        if profile:
+            self.context.profiler = Profiler(profile)
+
+        # Collect metrics, if requested.
+        if metrics == None: metrics = os.environ.get('SVNHOOK_METRICS')
+        if metrics: self.metrics = Metrics(metrics)
+        else: self.metrics = None
+
+        # Choose how to run the configuration.
+        if backend == None:
+            backend = os.environ.get('SVNHOOK_BACKEND', 'interpreter')
+        if backend not in ['interpreter', 'compiled']:
+            raise ValueError('Unknown backend: ' + backend)
+        self.backend = backend
+        self.cfgfile = cfgfile
+
     def run(self):
         """Execute top-level hook actions and set exit code."""
         # Construct a generic action list to perform the root hook
         # actions.
-        exit(Filter(self.context, self.cfg.getroot()).run())
+        profiler = self.context.profiler
+        root = self.cfg.getroot()
+
+        # If requested, check the cheaper filter conditions first.
+        reorder = re.match(r'(1|true|yes)$',
+                           root.get('reorderFilters', '0'),
+                           re.IGNORECASE) != None
+        if reorder:
+            reorder_filters(root, self.get_filter_stats())
+            self.context.filterstats = dict()
+
+        # Share the filters that don't change between iterations.
+        self.context.invariants = get_invariants(root)
+
+        # If requested, run the compiled configuration. Profiling
+        # and reordering rely on the interpreter.
+        if self.backend == 'compiled' and not profiler and not reorder:
+            self.context.runners = Compiler(
+                self.cfgfile, root).get_runners()
+
+        # Get the repository data that the configuration needs.
+        self.context.preload(get_requirements(root))
+        if profiler:
+            with profiler.span(root.tag):
+                exitcode = Filter(self.context, root).run()
+        else:
+            exitcode = Filter(self.context, root).run()
+        self.context.close()
+
+        # Let the hook handler wrap up, before exiting.
+        self.finish(exitcode)
+        if reorder: self.add_filter_stats()
+        if profiler: profiler.write()
+        if self.metrics: self.report(exitcode)
+        exit(exitcode)
+
+    def get_filter_stats(self):
+        """Get the recorded filter condition statistics.
+
+        Returns: Dictionary of [checks, passes, seconds] lists, by
+        filter class name. Empty when caching isn't configured.
+        """
+        if not self.context.cachedir: return dict()
+        try:
+            cache = FilterStats(self.context.cachedir)
+            stats = cache.get()
+            cache.close()
+        except Exception as e:
+            logger.warning('Unable to read filter statistics: {0}'
+                           .format(e))
+            stats = dict()
+        return stats
+
+    def add_filter_stats(self):
+        """Record the filter condition statistics of the hook run."""
+        if not self.context.cachedir or not self.context.filterstats:
+            return
+        try:
+            cache = FilterStats(self.context.cachedir)
+            cache.add(self.context.filterstats)
+            cache.close()
+        except Exception as e:
+            logger.warning('Unable to record filter statistics: {0}'
+                           .format(e))
+
+    def report(self, exitcode):
+        """Write the metrics of the hook run.
+
+        Args:
+          exitcode: Exit code produced by the hook actions.
+        """
+        labels = [('hook', self.hookname)]
+        self.metrics.observe('hook_duration', labels,
+                             time.time() - self.started)
+        self.metrics.add('hook_runs', labels + [('exitcode', exitcode)])
+
+        # Include the repository access statistics.
+        for name, amount in sorted(self.context.stats.items()):
+            self.metrics.add(name, labels, amount)
+        self.metrics.write()
+
+    def finish(self, exitcode):
+        """Handle the completion of the hook actions.
+
+        Args:
+          exitcode: Exit code produced by the hook actions.
+        """
+        pass
 
 class StartCommit(SvnHook):
     """Start-Commit Hook Handler"""
 
+    hookname = 'start-commit'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -100,6 +225,16 @@ class StartCommit(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
@@ -114,18 +249,22 @@ class StartCommit(SvnHook):
 
         # Construct the hook context. Initialize the tokens with
         # the available environment variables and the hook arguments.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath']    = args.repospath
         tokens['User']         = args.user
         tokens['Capabilities'] = args.capabilities
         context = CtxStandard(tokens)
 
         # Perform parent initialization.
-        super(StartCommit, self).__init__(context, args.cfgfile)
+        super(StartCommit, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
 
 class PreCommit(SvnHook):
     """Pre-Commit Hook Handler"""
 
+    hookname = 'pre-commit'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -135,11 +274,24 @@ class PreCommit(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
         cmdline.add_argument(
             'txnname', help='Name of the pending transaction')
+        cmdline.add_argument(
+            '--cachedir',
+            help='Directory of the persistent hook caches')
 
         # Parse the command line.
         args = cmdline.parse_args()
@@ -154,18 +306,42 @@ class PreCommit(SvnHook):
                 intotoken = True
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath']   = args.repospath
         tokens['Transaction'] = args.txnname
         tokens['LockTokens']  = locktokens
         context = CtxTransaction(tokens)
+        context.cachedir = args.cachedir
 
         # Perform parent initialization.
-        super(PreCommit, self).__init__(context, args.cfgfile)
+        super(PreCommit, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
+
+    def finish(self, exitcode):
+        """Share the gathered repository data with post-commit.
+
+        Args:
+          exitcode: Exit code produced by the hook actions.
+        """
+        # Only a successful pre-commit leads to a revision.
+        if exitcode != 0 or not self.context.cachedir: return
+
+        # A caching problem must not block the commit.
+        try:
+            cache = TxnCache(self.context.cachedir)
+            cache.put(self.context.transaction,
+                      self.context.get_cache())
+            cache.close()
+        except Exception as e:
+            logger.warning('Unable to cache transaction context: {0}'
+                           .format(e))
 
 class PostCommit(SvnHook):
     """Post-Commit Hook Handler"""
 
+    hookname = 'post-commit'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -175,28 +351,73 @@ class PostCommit(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
         cmdline.add_argument(
             'revision', type=int,
             help='Number of the completed revision')
+        cmdline.add_argument(
+            'txnname', nargs='?',
+            help='Name of the completed transaction (Subversion 1.8+)')
+        cmdline.add_argument(
+            '--cachedir',
+            help='Directory of the persistent hook caches')
 
         # Parse the command line.
         args = cmdline.parse_args()
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath'] = args.repospath
         tokens['Revision']  = args.revision
         context = CtxRevision(tokens)
+        context.cachedir = args.cachedir
 
         # Perform parent initialization.
-        super(PostCommit, self).__init__(context, args.cfgfile)
+        super(PostCommit, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
+
+        # Use the data cached for the revision by earlier hook runs.
+        context.adopt_revision_cache()
+
+        # If the pre-commit hook shared its data for the transaction,
+        # use it instead of asking svnlook again.
+        if args.cachedir and args.txnname:
+            try:
+                cache = TxnCache(args.cachedir)
+                data = cache.pop(args.txnname, args.revision)
+                cache.close()
+            except Exception as e:
+                logger.warning('Unable to read transaction cache: {0}'
+                               .format(e))
+                data = None
+            if data: context.set_cache(data)
+
+    def finish(self, exitcode):
+        """Share the gathered repository data with later hook runs.
+
+        Args:
+          exitcode: Exit code produced by the hook actions.
+        """
+        self.context.share_revision_cache()
 
 class PreRevPropChange(SvnHook):
     """Pre-RevProp-Change Hook Handler"""
 
+    hookname = 'pre-revprop-change'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -206,6 +427,16 @@ class PreRevPropChange(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
@@ -219,12 +450,15 @@ class PreRevPropChange(SvnHook):
         cmdline.add_argument(
             'action', choices=['A', 'M', 'D'],
             help='Type of change (A=add, M=modify, D=delete)')
+        cmdline.add_argument(
+            '--cachedir',
+            help='Directory of the persistent hook caches')
 
         # Parse the command line.
         args = cmdline.parse_args()
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath']    = args.repospath
         tokens['Revision']     = args.revision
         tokens['User']         = args.user
@@ -232,13 +466,29 @@ class PreRevPropChange(SvnHook):
         tokens['ChgType']      = args.action
         tokens['RevPropValue'] = sys.stdin.read()
         context = CtxRevision(tokens)
+        context.cachedir = args.cachedir
 
         # Perform parent initialization.
-        super(PreRevPropChange, self).__init__(context, args.cfgfile)
+        super(PreRevPropChange, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
+
+        # Use the data cached for the revision by earlier hook runs.
+        context.adopt_revision_cache()
+
+    def finish(self, exitcode):
+        """Share the gathered repository data with later hook runs.
+
+        Args:
+          exitcode: Exit code produced by the hook actions.
+        """
+        self.context.share_revision_cache()
 
 class PostRevPropChange(SvnHook):
     """Post-RevProp-Change Hook Handler"""
 
+    hookname = 'post-revprop-change'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -248,6 +498,16 @@ class PostRevPropChange(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
@@ -261,12 +521,15 @@ class PostRevPropChange(SvnHook):
         cmdline.add_argument(
             'action', choices=['A', 'M', 'D'],
             help='Type of change (A=add, M=modify, D=delete)')
+        cmdline.add_argument(
+            '--cachedir',
+            help='Directory of the persistent hook caches')
 
         # Parse the command line.
         args = cmdline.parse_args()
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath']    = args.repospath
         tokens['Revision']     = args.revision
         tokens['User']         = args.user
@@ -274,13 +537,31 @@ class PostRevPropChange(SvnHook):
         tokens['ChgType']      = args.action
         tokens['RevPropValue'] = sys.stdin.read()
         context = CtxRevision(tokens)
+        context.cachedir = args.cachedir
 
         # Perform parent initialization.
-        super(PostRevPropChange, self).__init__(context, args.cfgfile)
+        super(PostRevPropChange, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
+
+        # The revision properties changed. Drop their cached data,
+        # before using the rest.
+        context.drop_revision_props()
+        context.adopt_revision_cache()
+
+    def finish(self, exitcode):
+        """Share the gathered repository data with later hook runs.
+
+        Args:
+          exitcode: Exit code produced by the hook actions.
+        """
+        self.context.share_revision_cache()
 
 class PreLock(SvnHook):
     """Pre-Lock Hook Handler"""
 
+    hookname = 'pre-lock'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -290,6 +571,16 @@ class PreLock(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
@@ -307,7 +598,7 @@ class PreLock(SvnHook):
         args = cmdline.parse_args()
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath'] = args.repospath
         tokens['Path']      = args.path
         tokens['User']      = args.user
@@ -316,11 +607,15 @@ class PreLock(SvnHook):
         context = CtxStandard(tokens)
 
         # Perform parent initialization.
-        super(PreLock, self).__init__(context, args.cfgfile)
+        super(PreLock, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
 
 class PostLock(SvnHook):
     """Post-Lock Hook Handler"""
 
+    hookname = 'post-lock'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -330,6 +625,16 @@ class PostLock(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
@@ -340,7 +645,7 @@ class PostLock(SvnHook):
         args = cmdline.parse_args()
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath'] = args.repospath
         tokens['User']      = args.user
         tokens['Paths']     = [
@@ -348,11 +653,15 @@ class PostLock(SvnHook):
         context = CtxStandard(tokens)
 
         # Perform parent initialization.
-        super(PostLock, self).__init__(context, args.cfgfile)
+        super(PostLock, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
 
 class PreUnlock(SvnHook):
     """Pre-Unlock Hook Handler"""
 
+    hookname = 'pre-unlock'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -362,6 +671,16 @@ class PreUnlock(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
@@ -379,7 +698,7 @@ class PreUnlock(SvnHook):
         args = cmdline.parse_args()
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath']   = args.repospath
         tokens['Path']        = args.path
         tokens['User']        = args.user
@@ -388,11 +707,15 @@ class PreUnlock(SvnHook):
         context = CtxStandard(tokens)
 
         # Perform parent initialization.
-        super(PreUnlock, self).__init__(context, args.cfgfile)
+        super(PreUnlock, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
 
 class PostUnlock(SvnHook):
     """Post-Unlock Hook Handler"""
 
+    hookname = 'post-unlock'
+
     def __init__(self):
 
         # Define how to process the command line.
@@ -402,6 +725,16 @@ class PostUnlock(SvnHook):
         cmdline.add_argument(
             '--cfgfile', required=True,
             help='Path name of the hook configuration file')
+        cmdline.add_argument(
+            '--profile',
+            help='Path name of the profile output file')
+        cmdline.add_argument(
+            '--metrics',
+            help='Path name of the metrics text file, or "unix:"'
+            ' and the path name of the StatsD socket')
+        cmdline.add_argument(
+            '--backend', choices=['interpreter', 'compiled'],
+            help='How to run the hook configuration')
 
         cmdline.add_argument(
             'repospath', help='Path name of the repository root')
@@ -412,7 +745,7 @@ class PostUnlock(SvnHook):
         args = cmdline.parse_args()
 
         # Construct the hook context.
-        tokens = Tokens(os.environ)
+        tokens = Tokens.get_environment().push()
         tokens['ReposPath'] = args.repospath
         tokens['User']      = args.user
         tokens['Paths']     = [
@@ -420,6 +753,8 @@ class PostUnlock(SvnHook):
         context = CtxStandard(tokens)
 
         # Perform parent initialization.
-        super(PostUnlock, self).__init__(context, args.cfgfile)
+        super(PostUnlock, self).__init__(
+            context, args.cfgfile, args.profile, args.metrics,
+            args.backend)
 
 ########################### end of file ##############################
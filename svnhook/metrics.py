@@ -0,0 +1,277 @@
+"""Hook Metrics Exporter
+
+Collect counters and timings for a hook run, and hand them to a
+monitoring system when the run ends. Two targets are supported:
+
+  unix:<path>  StatsD lines, sent to a local Unix datagram socket.
+  <path>       Prometheus text file, for the node exporter's textfile
+               collector. Counts from earlier runs are carried
+               forward, so the file holds running totals.
+
+Metrics are only written once per run. Writes never wait: a busy
+file or a full socket causes the metrics to be dropped.
+"""
+__version__ = '3.00'
+__all__     = ['Metrics']
+
+import logging
+import os
+import re
+import socket
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger()
+
+class Metrics(object):
+    """Hook Metrics Collector"""
+
+    # Upper bounds (in seconds) of the timing histogram buckets.
+    buckets = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    # Largest StatsD datagram sent.
+    maxdatagram = 8192
+
+    # Attempts to lock the text file, and the pause between them.
+    lockattempts = 10
+    lockpause = 0.005
+
+    def __init__(self, target):
+        """Start collecting metrics.
+
+        Args:
+          target: Path name of the Prometheus text file, or
+            "unix:" and the path name of the StatsD socket.
+        """
+        self.target = target
+        self.counts = []
+        self.timings = []
+
+    def add(self, name, labels, amount=1):
+        """Add to a counter.
+
+        Args:
+          name: Counter name.
+          labels: List of (name, value) label pairs.
+          amount: Amount to add.
+        """
+        self.counts.append((name, labels, amount))
+
+    def observe(self, name, labels, seconds):
+        """Record a timing.
+
+        Args:
+          name: Timing name.
+          labels: List of (name, value) label pairs.
+          seconds: Elapsed time.
+        """
+        self.timings.append((name, labels, seconds))
+
+    def write(self):
+        """Send the metrics to the target. Failures are logged, but
+        don't affect the hook result."""
+        try:
+            if self.target.startswith('unix:'):
+                self.send_statsd(self.target[5:])
+            else:
+                self.write_textfile(self.target)
+        except Exception as e:
+            logger.warning('Metrics not written: {0}'.format(e))
+
+    def get_statsd(self):
+        """Format the metrics as StatsD lines. Label values become
+        parts of the metric names.
+
+        Returns: List of StatsD lines.
+        """
+        lines = []
+        for name, labels, amount in self.counts:
+            lines.append('{0}:{1}|c'.format(
+                    self.get_statsd_name(name, labels),
+                    format_value(amount)))
+        for name, labels, seconds in self.timings:
+            lines.append('{0}:{1}|ms'.format(
+                    self.get_statsd_name(name, labels),
+                    format_value(round(seconds * 1000, 3))))
+        return lines
+
+    @staticmethod
+    def get_statsd_name(name, labels):
+        """Get the dotted StatsD name of a metric.
+
+        Args:
+          name: Metric name.
+          labels: List of (name, value) label pairs.
+
+        Returns: StatsD metric name.
+        """
+        parts = ['svnhook', name] + [re.sub(r'[^\w-]', '_', str(value))
+                                     for label, value in labels]
+        return '.'.join(parts)
+
+    def send_statsd(self, sockpath):
+        """Send the metrics to a StatsD Unix datagram socket, in as
+        few datagrams as possible.
+
+        Args:
+          sockpath: Path name of the socket.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            batch = ''
+            for line in self.get_statsd():
+                if batch and len(batch) + len(line) >= self.maxdatagram:
+                    sock.sendto(batch, sockpath)
+                    batch = ''
+                batch += line + '\n'
+            if batch: sock.sendto(batch, sockpath)
+        finally:
+            sock.close()
+
+    def get_samples(self):
+        """Convert the metrics to Prometheus samples. Counters get a
+        "_total" suffix. Timings become histograms of seconds.
+
+        Returns: List of (family, type, sample, value) tuples.
+        """
+        samples = []
+        for name, labels, amount in self.counts:
+            family = 'svnhook_{0}_total'.format(name)
+            samples.append((family, 'counter',
+                            family + format_labels(labels), amount))
+
+        for name, labels, seconds in self.timings:
+            family = 'svnhook_{0}_seconds'.format(name)
+            for bound in self.buckets + [None]:
+                if bound == None: le = '+Inf'
+                else: le = format_value(bound)
+                samples.append((family, 'histogram', family + '_bucket'
+                                + format_labels(labels + [('le', le)]),
+                                int(bound == None or seconds <= bound)))
+            samples.append((family, 'histogram',
+                            family + '_sum' + format_labels(labels),
+                            seconds))
+            samples.append((family, 'histogram',
+                            family + '_count' + format_labels(labels),
+                            1))
+        return samples
+
+    def write_textfile(self, path):
+        """Add the metrics to the totals in a Prometheus text file.
+        The file is replaced in one step, so the collector never sees
+        a partial file.
+
+        Args:
+          path: Path name of the text file.
+        """
+        # Keep other hook runs from updating the file at the same
+        # time. If they hold it for too long, give up.
+        lockfile = open(path + '.lock', 'a')
+        try:
+            if fcntl and not self.lock(lockfile):
+                logger.warning('Metrics dropped: {0} is busy'
+                               .format(path))
+                return
+
+            # Read the running totals. Skip any lines that can't be
+            # parsed, rather than losing the whole file.
+            types = dict()
+            totals = dict()
+            if os.path.isfile(path):
+                with open(path) as f:
+                    for line in f:
+                        if line.startswith('# TYPE '):
+                            fields = line.split()
+                            if len(fields) == 4:
+                                types[fields[2]] = fields[3]
+                        elif line.strip() and line[0] != '#':
+                            sample, sep, value = \
+                                line.rstrip().rpartition(' ')
+                            if not re.match(r'\w+(\{.*\})?$', sample):
+                                continue
+                            try:
+                                totals[sample] = float(value)
+                            except ValueError:
+                                continue
+
+            # Add this run to the totals.
+            families = dict()
+            for family, kind, sample, value in self.get_samples():
+                types[family] = kind
+                totals[sample] = totals.get(sample, 0) + value
+
+            # Group the samples by metric family.
+            for sample in totals:
+                name = re.match(r'\w+', sample).group(0)
+                family = re.sub(r'_(bucket|sum|count)$', '', name)
+                if family not in types: family = name
+                families.setdefault(family, []).append(sample)
+
+            lines = []
+            for family in sorted(families):
+                if family in types:
+                    lines.append('# TYPE {0} {1}\n'
+                                 .format(family, types[family]))
+                for sample in sorted(families[family]):
+                    lines.append('{0} {1}\n'.format(
+                            sample, format_value(totals[sample])))
+
+            # Replace the file.
+            temppath = '{0}.{1}.tmp'.format(path, os.getpid())
+            with open(temppath, 'w') as f: f.writelines(lines)
+            try:
+                os.rename(temppath, path)
+            except OSError:
+                # Windows won't rename over an existing file.
+                os.remove(path)
+                os.rename(temppath, path)
+        finally:
+            lockfile.close()
+
+    def lock(self, lockfile):
+        """Lock the text file, without waiting long.
+
+        Args:
+          lockfile: Open lock file.
+
+        Returns: True if the lock was obtained.
+        """
+        for attempt in range(self.lockattempts):
+            try:
+                fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except IOError:
+                time.sleep(self.lockpause)
+        return False
+
+def format_labels(labels):
+    """Format Prometheus sample labels.
+
+    Args:
+      labels: List of (name, value) label pairs.
+
+    Returns: Label string, or an empty string.
+    """
+    if not labels: return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, str(value).replace('\\', r'\\')
+                           .replace('"', r'\"'))
+        for name, value in labels) + '}'
+
+def format_value(value):
+    """Format a metric value. Whole numbers lose their decimals.
+
+    Args:
+      value: Numeric value.
+
+    Returns: Value string.
+    """
+    if value == int(value): return str(int(value))
+    return repr(float(value))
+
+########################### end of file ##############################
@@ -0,0 +1,141 @@
+"""Hook Run Profiler
+
+Time the configuration elements of a hook run, along with the
+commands they execute, and write the timings as collapsed stacks.
+Each stack frame is one step of the element's path in the hook
+configuration, so a stack such as
+
+  Actions;FilterCommitList[3];FilterFileContent;svnlook cat 1520
+
+gives the time, in microseconds, spent in that element itself. The
+output can be fed straight to flame graph tools. Runs append to the
+output file, so the timings of many runs add up.
+"""
+__version__ = '3.00'
+__all__     = ['Profiler']
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+class Profiler(object):
+    """Hook Run Profiler
+
+    Accumulate the elapsed time of nested spans. Spans are tracked
+    separately for each thread. Spans started by background threads
+    are rooted in a "(background)" frame.
+    """
+
+    def __init__(self, outpath):
+        """Start profiling.
+
+        Args:
+          outpath: Path name of the collapsed stack output file.
+        """
+        self.outpath = outpath
+        self.times = dict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.names = dict()
+
+    def get_stack(self):
+        """Get the span stack of the current thread.
+
+        Returns: List of frame names.
+        """
+        if not hasattr(self.local, 'stack'):
+            if threading.current_thread().name == 'MainThread':
+                self.local.stack = []
+            else:
+                self.local.stack = ['(background)']
+        return self.local.stack
+
+    @contextmanager
+    def span(self, name):
+        """Time a block as a frame on the current stack.
+
+        Args:
+          name: Frame name.
+        """
+        stack = self.get_stack()
+        stack.append(name.replace(';', ':'))
+        key = tuple(stack)
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            stack.pop()
+            with self.lock:
+                self.times[key] = self.times.get(key, 0.0) + elapsed
+
+    def get_name(self, parent, child):
+        """Get the path step of a configuration element. Elements
+        that share their tag with a sibling are numbered, as in
+        XPath.
+
+        Args:
+          parent: Parent element.
+          child: Child element.
+
+        Returns: Frame name.
+        """
+        if parent not in self.names:
+            counts = dict()
+            for element in list(parent):
+                counts[element.tag] = counts.get(element.tag, 0) + 1
+            names = self.names[parent] = dict()
+            positions = dict()
+            for element in list(parent):
+                tag = element.tag
+                positions[tag] = positions.get(tag, 0) + 1
+                if counts[tag] > 1:
+                    names[element] = '{0}[{1}]'.format(
+                        tag, positions[tag])
+                else:
+                    names[element] = tag
+        return self.names[parent][child]
+
+    def get_collapsed(self):
+        """Get the self time of each stack.
+
+        Returns: List of collapsed stack lines.
+        """
+        with self.lock:
+            times = self.times.copy()
+
+        # Take the time of the nested spans out of each span.
+        selftimes = times.copy()
+        for key, elapsed in times.items():
+            if len(key) > 1 and key[:-1] in selftimes:
+                selftimes[key[:-1]] -= elapsed
+
+        lines = []
+        for key in sorted(selftimes):
+            micros = int(selftimes[key] * 1000000)
+            if micros > 0:
+                lines.append('{0} {1}\n'.format(';'.join(key), micros))
+        return lines
+
+    def write(self):
+        """Append the collapsed stacks to the output file. Failures
+        are logged, but don't affect the hook result."""
+        data = ''.join(self.get_collapsed())
+        if not data: return
+        try:
+            # Write all of the lines at once, so that concurrent hook
+            # runs don't interleave them.
+            fd = os.open(self.outpath,
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0666)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        except EnvironmentError as e:
+            logger.warning('Profile not written: {0}'.format(e))
+
+########################### end of file ##############################
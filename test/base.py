@@ -86,6 +86,15 @@ class HookTestCase(unit_test.TestCase):
         # Create the standard repository log file directory.
         os.mkdir(os.path.join(self.repopath, 'logs'))
 
+        # Pass the requested configuration backend on to the hook
+        # scripts that Subversion runs.
+        backend = os.environ.get('SVNHOOK_BACKEND')
+        if backend:
+            with open(os.path.join(
+                    self.repopath, 'conf', 'hooks-env'), 'w') as f:
+                f.write('[default]\nSVNHOOK_BACKEND = {0}\n'
+                        .format(backend))
+
         # Check for repository initialization data directory.
         repodata = os.path.join(datadir, repoid)
         if os.path.isdir(repodata):
@@ -155,6 +164,25 @@ class HookTestCase(unit_test.TestCase):
             if raw: f.write(content)
             else: f.write(dedent(content))
 
+    def addHookArgs(self, hookname, *args):
+        """Add command line arguments to a pre-loaded hook script.
+
+        Args:
+            hookname: Base name of the pre-loaded hook script.
+            args: Arguments to insert ahead of the configuration file
+              option. Unix argument references ("$3") are converted
+              for Windows (BAT) hook scripts.
+        """
+        if hookname not in self.hooks:
+            raise KeyError('Hook script not found: ' + hookname)
+        if sys.platform.startswith('win'):
+            args = [re.sub(r'\$(\d)', r'%\1', arg) for arg in args]
+        hookpath = self.hooks[hookname]
+        with open(hookpath) as f: script = f.read()
+        script = script.replace(
+            ' --cfgfile=', ' ' + ' '.join(args) + ' --cfgfile=')
+        with open(hookpath, 'w') as f: f.write(script)
+
     def getHookLog(self, hookname):
         """Get the log file path name for a hook script.
 
@@ -182,6 +210,7 @@ class HookTestCase(unit_test.TestCase):
 
         Args:
             hookname: Base name of the pre-loaded hook script.
+            env: Dictionary of extra environment variables.
 
         Returns: Subprocess object produced by hook script execution.
         """
@@ -189,11 +218,18 @@ class HookTestCase(unit_test.TestCase):
             raise KeyError('Hook script not found: ' + hookname)
         cmd = [self.hooks[hookname]] + map(str, args)
 
+        # Add any extra environment variables.
+        env = None
+        if 'env' in kwargs:
+            env = dict(os.environ)
+            env.update(kwargs['env'])
+
         # Start the hook script process.
         p = subprocess.Popen(cmd,
                              stdin=subprocess.PIPE,
                              stdout=subprocess.PIPE,
                              stderr=subprocess.PIPE,
+                             env=env,
                              shell=False)
 
         # Pass back the running process object.
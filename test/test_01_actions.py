@@ -3,7 +3,9 @@
 # Test Basic Non-Filter Actions
 ######################################################################
 import os, re, sys, unittest
-import subprocess
+import hashlib, imp, subprocess
+import xml.etree.ElementTree as ET
+from textwrap import dedent
 
 # Prefer local modules.
 mylib = os.path.normpath(os.path.join(
@@ -11,6 +13,7 @@ mylib = os.path.normpath(os.path.join(
 if os.path.isdir(mylib): sys.path.insert(0, mylib)
 
 from test.base import HookTestCase
+from svnhook.codegen import Compiler
 
 # Test Hook and Configuration File
 testhook = 'start-commit'
@@ -213,6 +216,240 @@ class TestActions(HookTestCase):
             p.returncode == 0,
             'Exit code is not correct: {0}'.format(p.returncode))
 
+    def test_09_compiled(self):
+        """Run a compiled configuration."""
+        errmsg = 'Compiled error.'
+
+        # Define the hook configuration.
+        self.writeConf(testconf, '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex>.</UserRegex>
+              <SendError exitCode="2">{0}</SendError>
+              <SendError>Not reached.</SendError>
+            </FilterUser>
+          </Actions>
+          '''.format(errmsg))
+
+        # Call the script twice, with the compiled backend. The
+        # second call uses the cached bytecode.
+        backend = os.environ.get('SVNHOOK_BACKEND')
+        os.environ['SVNHOOK_BACKEND'] = 'compiled'
+        try:
+            for attempt in range(2):
+                p = self.callHook(testhook,
+                                  self.repopath, self.username, '')
+                (stdoutdata, stderrdata) = p.communicate()
+                p.wait()
+
+                # Check for the expected exit code and error.
+                self.assertEqual(
+                    p.returncode, 2,
+                    'Exit code is not correct: {0}'
+                    .format(p.returncode))
+                self.assertEqual(
+                    stderrdata, errmsg,
+                    'Error output not correct: "{0}"'
+                    .format(stderrdata))
+        finally:
+            if backend == None: del os.environ['SVNHOOK_BACKEND']
+            else: os.environ['SVNHOOK_BACKEND'] = backend
+
+        # Verify that the bytecode was cached.
+        self.assertTrue(
+            os.path.isfile(os.path.join(
+                    self.repopath, 'conf', testconf + '.pyc')),
+            'Compiled configuration not cached')
+
+    def test_10_executecmd_coprocess(self):
+        """Execute a command as a co-process."""
+        errmsg = 'Not allowed: {0}'.format(self.username)
+
+        # Write a co-process that rejects every request.
+        script = os.path.join(self.repopath, 'validator.py')
+        with open(script, 'w') as f:
+            f.write(dedent('''\
+              import sys
+              while True:
+                  line = sys.stdin.readline()
+                  if not line: break
+                  fields = [sys.stdin.read(int(sys.stdin.readline()))
+                            for i in range(int(line))]
+                  msg = 'Not allowed: ' + fields[0]
+                  sys.stdout.write('3 {0}\\n{1}'.format(len(msg), msg))
+                  sys.stdout.flush()
+              '''))
+
+        # Define the hook configuration.
+        cmdline = '{0} {1} ${{User}}'.format(sys.executable, script)
+        self.writeConf(testconf, '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <ExecuteCmd mode="coprocess"
+                        errorLevel="2"><![CDATA[{0}]]></ExecuteCmd>
+          </Actions>
+          '''.format(cmdline))
+
+        # Call the script that uses the configuration.
+        p = self.callHook(testhook,
+                          self.repopath, self.username, '')
+        (stdoutdata, stderrdata) = p.communicate()
+
+        # Check for the co-process exit code.
+        self.assertEqual(
+            p.returncode, 3,
+            'Exit code is not correct: {0}'.format(p.returncode))
+
+        # Verify the co-process error is returned.
+        self.assertEqual(
+            stderrdata, errmsg,
+            'Error output not correct: "{0}"'.format(stderrdata))
+
+    def test_11_settoken_environment(self):
+        """Shadow environment token."""
+        # Define the hook configuration.
+        self.writeConf(testconf, '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <SetToken name="weather">sunny</SetToken>
+            <SendError>I feel ${Mood}, but it's ${WEATHER}.</SendError>
+          </Actions>
+          ''')
+
+        # Call the script with an environment variable.
+        p = self.callHook(testhook,
+                          self.repopath, self.username, '',
+                          env={'MOOD': 'joy', 'WEATHER': 'rainy'})
+        (stdoutdata, stderrdata) = p.communicate()
+        p.wait()
+
+        # Verify the environment tokens are used, unless shadowed.
+        self.assertEqual(
+            stderrdata, "I feel joy, but it's sunny.",
+            'Error output not correct: "{0}"'.format(stderrdata))
+
+    def test_12_profile(self):
+        """Profile configuration elements."""
+        profile = os.path.join(
+            os.path.dirname(self.repopath), 'profile.txt')
+
+        # Define the hook configuration.
+        cmdline = '{0} -c "import time; time.sleep(0.01)"'.format(
+            sys.executable)
+        self.writeConf(testconf, '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <SetToken name="happy">joy</SetToken>
+            <FilterUser>
+              <UserRegex>.</UserRegex>
+              <ExecuteCmd><![CDATA[{0}]]></ExecuteCmd>
+            </FilterUser>
+            <SetToken name="sad">gloom</SetToken>
+          </Actions>
+          '''.format(cmdline))
+
+        # Call the script with profiling turned on.
+        p = self.callHook(testhook,
+                          self.repopath, self.username, '',
+                          env={'SVNHOOK_PROFILE': profile})
+        (stdoutdata, stderrdata) = p.communicate()
+        p.wait()
+
+        # Check for the default exit code.
+        self.assertEqual(
+            p.returncode, 0,
+            'Exit code is not correct: {0}'.format(p.returncode))
+
+        # Verify the collapsed stack of the command.
+        with open(profile) as f: stacks = f.read()
+        self.assertRegexpMatches(
+            stacks, r'(?m)^Actions;FilterUser;ExecuteCmd \d+$',
+            'Command stack not found in profile')
+
+        # Verify the format of every stack.
+        for line in stacks.splitlines():
+            self.assertRegexpMatches(
+                line, r'^Actions(;\w+(\[\d+\])?)* \d+$',
+                'Invalid collapsed stack: "{0}"'.format(line))
+
+    def test_13_compiled_key(self):
+        """Key compiled configuration on compiler sources."""
+        # Define the hook configuration.
+        self.writeConf(testconf, '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex>.</UserRegex>
+              <SendError>Compiled error.</SendError>
+            </FilterUser>
+          </Actions>
+          ''')
+
+        # Call the script with the compiled backend.
+        p = self.callHook(testhook,
+                          self.repopath, self.username, '',
+                          env={'SVNHOOK_BACKEND': 'compiled'})
+        p.communicate()
+
+        # Verify that the cache key covers the compiler sources, as
+        # well as the configuration.
+        cfgfile = os.path.join(self.repopath, 'conf', testconf)
+        with open(cfgfile, 'rb') as f:
+            key = hashlib.sha1(
+                Compiler.get_source_hash() + f.read()).hexdigest()
+        with open(cfgfile + '.pyc', 'rb') as f:
+            header = f.read(len(imp.get_magic()) + len(key))
+        self.assertEqual(
+            header, imp.get_magic() + key,
+            'Compiled configuration not keyed on compiler sources')
+
+    def test_14_compiled_inline(self):
+        """Inline filter conditions in both backends."""
+        # Define the hook configuration.
+        self.writeConf(testconf, '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex sense="false">^nobody$</UserRegex>
+              <FilterUser>
+                <UserRegex>^other$</UserRegex>
+                <SendError>Not reached.</SendError>
+              </FilterUser>
+              <FilterUser>
+                <UserRegex>^(USER|other)$</UserRegex>
+                <SendError exitCode="3">Inline ${User}.</SendError>
+                <SendError>Not reached.</SendError>
+              </FilterUser>
+            </FilterUser>
+          </Actions>
+          ''')
+
+        # Call the script with each backend, and check for the same
+        # exit code and error.
+        for backend in ['interpreter', 'compiled']:
+            p = self.callHook(testhook,
+                              self.repopath, self.username, '',
+                              env={'SVNHOOK_BACKEND': backend})
+            (stdoutdata, stderrdata) = p.communicate()
+            self.assertEqual(
+                p.returncode, 3,
+                'Exit code is not correct ({0}): {1}'
+                .format(backend, p.returncode))
+            self.assertEqual(
+                stderrdata, 'Inline user.',
+                'Error output not correct ({0}): "{1}"'
+                .format(backend, stderrdata))
+
+        # Verify that the user filters aren't constructed by the
+        # compiled code.
+        cfgfile = os.path.join(self.repopath, 'conf', testconf)
+        source = Compiler(cfgfile, ET.parse(cfgfile).getroot())\
+            .get_source()
+        self.assertNotRegexpMatches(
+            source, r'FilterUser\(',
+            'User filter not inlined')
+
 # Allow manual execution of tests.
 if __name__=='__main__':
     suite = unittest.TestLoader()\
@@ -106,6 +106,62 @@ class TestActions(SmtpTestCase):
         # Check that the message body is correct.
         self.assertBodyRegexp(message, r'(?m)^Initial import$')
 
+    def test_03_changed_log(self):
+        """Send the changed log message of a cached revision."""
+        # Define the hook configurations. Both hooks share the
+        # revision cache.
+        subjects = {'post-commit': 'commit @ {0}',
+                    'post-revprop-change': 'log change @ {0}'}
+        for hook, subject in subjects.items():
+            subjects[hook] = subject.format(time.asctime())
+            self.writeConf(hook + '.xml', '''\
+              <?xml version="1.0"?>
+              <Actions>
+                <SendLogSmtp port="{0}" verbose="no">
+                  <FromAddress>source@mydomain.com</FromAddress>
+                  <ToAddress>gal1@yourdomain.com</ToAddress>
+                  <Subject>{1}</Subject>
+                </SendLogSmtp>
+              </Actions>
+              '''.format(self.smtpport, subjects[hook]))
+            self.addHookArgs(hook, '--cachedir=cache')
+
+        # Call the post-commit script, which caches the log entry.
+        p = self.callHook(testhook, self.repopath, '1')
+        p.wait()
+
+        # Change the log message, without running the hooks. Then
+        # call the post-revprop-change script for the change.
+        self.writeConf('newlog.txt', 'Corrected import', raw=True)
+        subprocess.check_call(
+            ['svnadmin', 'setlog', '--bypass-hooks', self.repopath,
+             '-r', '1',
+             os.path.join(self.repopath, 'conf', 'newlog.txt')])
+        p = self.callHook('post-revprop-change', self.repopath, '1',
+                          self.username, 'svn:log', 'M')
+        p.communicate('Initial import')
+
+        # Check for the default exit code.
+        self.assertEqual(
+            p.returncode, 0,
+            'Exit code not correct: {0}'.format(p.returncode))
+
+        # Check that both messages were sent, with the log message of
+        # the time.
+        try:
+            message = self.getMessage(subject=subjects['post-commit'])
+        except KeyError:
+            self.fail('Message with subject not found: '
+                      + subjects['post-commit'])
+        self.assertBodyRegexp(message, r'(?m)^Initial import$')
+        try:
+            message = self.getMessage(
+                subject=subjects['post-revprop-change'])
+        except KeyError:
+            self.fail('Message with subject not found: '
+                      + subjects['post-revprop-change'])
+        self.assertBodyRegexp(message, r'(?m)^Corrected import$')
+
 # Allow manual execution of tests.
 if __name__=='__main__':
     suite = unittest.TestLoader()\
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+######################################################################
+# Test FSFS Repository Content Access
+######################################################################
+import os, sys, tempfile, unittest
+
+# Prefer local modules.
+mylib = os.path.normpath(os.path.join(
+        os.path.dirname(__file__), '..'))
+if os.path.isdir(mylib): sys.path.insert(0, mylib)
+
+from test.base import rmtree
+from svnhook.contexts import CtxRevision, Tokens
+from svnhook.fsfs import FsfsReader
+
+# Content checksums used by the node revisions.
+md5 = '0123456789abcdef0123456789abcdef'
+sha1 = '0123456789abcdef0123456789abcdef01234567'
+sha1b = '76543210fedcba9876543210fedcba9876543210'
+
+class TestFsfsReader(unittest.TestCase):
+    """FSFS Reader Tests"""
+
+    def setUp(self):
+        """Build the storage of a small repository: revision 3 holds
+        a plain file representation, and transaction 3-1 holds an
+        unchanged and a changed copy of the file. Both list their
+        changed paths.
+        """
+        self.repospath = tempfile.mkdtemp()
+        self.dbpath = os.path.join(self.repospath, 'db')
+        os.makedirs(os.path.join(self.dbpath, 'revs', '0'))
+        os.makedirs(os.path.join(self.dbpath, 'transactions',
+                                 '3-1.txn'))
+        self.writeDb('fs-type', 'fsfs\n')
+        self.writeDb('format', '6\nlayout sharded 1000\n')
+
+        # Write the revision file.
+        data = '\nBoo.\n\n'
+        rev = 'PLAIN\n' + data + 'ENDREP\n'
+        self.offset = len(rev)
+        rev += 'id: 2.0.r3/{0}\ntype: file\n'\
+            'text: 3 0 {1} {1} {2} {3} 3/_1\n'\
+            'cpath: /fileA1.txt\n\n'.format(
+            self.offset, len(data), md5, sha1)
+        self.nodeid = '2.0.r3/{0}'.format(self.offset)
+        changes = len(rev)
+        rev += '{0} add-file true false /fileA1.txt\n\n'\
+            '0.0.r2/9 delete-file false false /fileB1.txt\n\n'\
+            '\n{1} {2}\n'.format(self.nodeid, self.offset, changes)
+        self.writeDb(os.path.join('revs', '0', '3'), rev)
+
+        # Write the transaction node revisions.
+        self.writeDb(
+            os.path.join('transactions', '3-1.txn', 'node._1.0'),
+            'id: _1.0.t3-1\ntype: file\npred: {0}\n'\
+                'text: 3 0 7 7 {1} {2} 3/_1\n'\
+                'copyfrom: 3 /fileA1.txt\n\n'.format(
+                self.nodeid, md5, sha1))
+        self.writeDb(
+            os.path.join('transactions', '3-1.txn', 'node._2.0'),
+            'id: _2.0.t3-1\ntype: file\npred: {0}\n'\
+                'text: -1 0 9 9 {1} {2} 3-1/_3\n'\
+                'copyfrom: 3 /fileA1.txt\n\n'.format(
+                self.nodeid, md5, sha1b))
+        self.writeDb(
+            os.path.join('transactions', '3-1.txn', 'changes'),
+            '_1.0.t3-1 add-file true false /fileA2.txt\n3 /fileA1.txt\n'
+            '_2.0.t3-1 add-file true false /dirA/fileA3.txt\n'
+            '3 /fileA1.txt\n'
+            '_0.0.t3-1 delete-dir false false /dirA\n\n'
+            '_2.0.t3-1 add-file true false /fileA3.txt\n'
+            '3 /fileA1.txt\n')
+
+    def tearDown(self):
+        rmtree(self.repospath)
+
+    def writeDb(self, filename, content):
+        """Write a repository storage file.
+
+        Args:
+            filename: Path name within the "db" directory.
+            content: Content to store in the file.
+        """
+        with open(os.path.join(self.dbpath, filename), 'wb') as f:
+            f.write(content)
+
+    def test_01_rep_keys(self):
+        """Stored checksums of committed and uncommitted nodes"""
+        reader = FsfsReader(self.repospath)
+        self.assertEqual(reader.get_rep_key(self.nodeid), sha1)
+        self.assertEqual(reader.get_rep_key('_2.0.t3-1', '3-1'), sha1b)
+        self.assertEqual(reader.get_rep_key('_9.0.t3-1', '3-1'), None)
+        self.assertEqual(
+            reader.get_text_key('3 0 7 7 {0}'.format(md5)), 'md5-' + md5)
+        reader.close()
+
+    def test_02_logical_addressing(self):
+        """Only transaction nodes with logical addressing"""
+        self.writeDb('format',
+                     '7\nlayout sharded 1000\naddressing logical\n')
+        reader = FsfsReader(self.repospath)
+        self.assertEqual(reader.get_content(self.nodeid), None)
+        self.assertEqual(reader.get_rep_key(self.nodeid), None)
+        self.assertEqual(reader.get_rep_key('_2.0.t3-1', '3-1'), sha1b)
+        reader.close()
+
+    def test_03_changed_node_ids(self):
+        """Node IDs from the changed-path lists"""
+        reader = FsfsReader(self.repospath)
+        self.assertEqual(reader.get_node_id('fileA1.txt', 3), self.nodeid)
+        self.assertEqual(reader.get_node_id('fileB1.txt', 3), None)
+        self.assertEqual(reader.get_node_id('fileA1.txt', 2), None)
+        self.assertEqual(
+            reader.get_node_id('fileA2.txt', txnname='3-1'), '_1.0.t3-1')
+        self.assertEqual(
+            reader.get_node_id('dirA/fileA3.txt', txnname='3-1'), None)
+        self.assertEqual(
+            reader.get_node_id('fileA3.txt', txnname='3-1'), '_2.0.t3-1')
+        reader.close()
+
+    def test_04_unchanged_copy(self):
+        """Copies compared to their source"""
+        reader = FsfsReader(self.repospath)
+        self.assertEqual(
+            reader.is_unchanged_copy('_1.0.t3-1', '3-1'), True)
+        self.assertEqual(
+            reader.is_unchanged_copy('_2.0.t3-1', '3-1'), False)
+        self.assertEqual(reader.is_unchanged_copy(self.nodeid), None)
+        reader.close()
+
+    def test_05_plain_content(self):
+        """View of plain content"""
+        reader = FsfsReader(self.repospath)
+        self.assertTrue(reader.usable)
+        self.assertEqual(str(reader.get_content(self.nodeid)),
+                         '\nBoo.\n\n')
+        reader.close()
+
+    def test_06_trimmed_view(self):
+        """Content view trimmed like svnlook output"""
+        context = CtxRevision(Tokens(
+                {'ReposPath': self.repospath, 'Revision': 3}))
+        content = context.get_content_view('fileA1.txt')
+        self.assertTrue(isinstance(content, buffer))
+        self.assertEqual(str(content), 'Boo.')
+        self.assertEqual(context.get_content_view('fileB1.txt'), None)
+        context.close()
+
+# Allow manual execution of tests.
+if __name__=='__main__':
+    for tclass in [TestFsfsReader]:
+        suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
+        unittest.TextTestRunner(verbosity=2).run(suite)
+
+########################### end of file ##############################
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+######################################################################
+# Test Hook Metrics Formatting
+######################################################################
+import os, sys, tempfile, unittest
+
+# Prefer local modules.
+mylib = os.path.normpath(os.path.join(
+        os.path.dirname(__file__), '..'))
+if os.path.isdir(mylib): sys.path.insert(0, mylib)
+
+from test.base import rmtree
+from svnhook.metrics import Metrics, format_labels, format_value
+
+class TestMetrics(unittest.TestCase):
+    """Hook Metrics Tests"""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, 'svnhook.prom')
+
+    def tearDown(self):
+        rmtree(self.workdir)
+
+    def getMetrics(self, runs=1, seconds=0.3):
+        """Get the metrics of a hook run.
+
+        Args:
+            runs: Number of runs to count.
+            seconds: Duration of the run.
+
+        Returns: Metrics object.
+        """
+        metrics = Metrics(self.path)
+        labels = [('hook', 'pre-commit')]
+        metrics.add('hook_runs', labels + [('exitcode', 0)], runs)
+        metrics.observe('hook_duration', labels, seconds)
+        return metrics
+
+    def readTextfile(self):
+        """Read the Prometheus text file.
+
+        Returns: List of lines in the file.
+        """
+        with open(self.path) as f: return f.read().splitlines()
+
+    def test_01_format_labels(self):
+        """Label quoting"""
+        self.assertEqual(format_labels([]), '')
+        self.assertEqual(
+            format_labels([('hook', 'pre-commit'), ('path', 'a"b\\c')]),
+            '{hook="pre-commit",path="a\\"b\\\\c"}')
+
+    def test_02_format_value(self):
+        """Whole and fractional values"""
+        self.assertEqual(format_value(3.0), '3')
+        self.assertEqual(format_value(2), '2')
+        self.assertEqual(format_value(0.25), '0.25')
+
+    def test_03_samples(self):
+        """Counter and histogram samples"""
+        samples = dict((sample, value) for family, kind, sample, value
+                       in self.getMetrics().get_samples())
+        self.assertEqual(samples[
+                'svnhook_hook_runs_total'
+                '{hook="pre-commit",exitcode="0"}'], 1)
+        self.assertEqual(samples[
+                'svnhook_hook_duration_seconds_bucket'
+                '{hook="pre-commit",le="0.25"}'], 0)
+        self.assertEqual(samples[
+                'svnhook_hook_duration_seconds_bucket'
+                '{hook="pre-commit",le="0.5"}'], 1)
+        self.assertEqual(samples[
+                'svnhook_hook_duration_seconds_bucket'
+                '{hook="pre-commit",le="+Inf"}'], 1)
+        self.assertEqual(samples[
+                'svnhook_hook_duration_seconds_sum'
+                '{hook="pre-commit"}'], 0.3)
+        self.assertEqual(samples[
+                'svnhook_hook_duration_seconds_count'
+                '{hook="pre-commit"}'], 1)
+
+    def test_04_statsd(self):
+        """StatsD lines"""
+        self.assertEqual(self.getMetrics().get_statsd(), [
+                'svnhook.hook_runs.pre-commit.0:1|c',
+                'svnhook.hook_duration.pre-commit:300|ms'])
+
+    def test_05_textfile_totals(self):
+        """Running totals in the text file"""
+        self.getMetrics().write()
+        self.getMetrics(runs=2, seconds=1.5).write()
+        lines = self.readTextfile()
+        self.assertIn('# TYPE svnhook_hook_runs_total counter', lines)
+        self.assertIn('# TYPE svnhook_hook_duration_seconds histogram',
+                      lines)
+        self.assertIn('svnhook_hook_runs_total'
+                      '{hook="pre-commit",exitcode="0"} 3', lines)
+        self.assertIn('svnhook_hook_duration_seconds_bucket'
+                      '{hook="pre-commit",le="0.5"} 1', lines)
+        self.assertIn('svnhook_hook_duration_seconds_count'
+                      '{hook="pre-commit"} 2', lines)
+        self.assertEqual(lines.count(
+                '# TYPE svnhook_hook_runs_total counter'), 1)
+
+    def test_06_textfile_unparsable(self):
+        """Unparsable text file lines skipped"""
+        with open(self.path, 'w') as f:
+            f.write('# TYPE broken\n'
+                    'svnhook_hook_runs_total'
+                    '{hook="pre-commit",exitcode="0"} 4\n'
+                    'svnhook_hook_runs_total{hook="x"} many\n'
+                    '{hook="x"} 2\n'
+                    'garbage\n')
+        self.getMetrics().write()
+        lines = self.readTextfile()
+        self.assertIn('svnhook_hook_runs_total'
+                      '{hook="pre-commit",exitcode="0"} 5', lines)
+        for line in lines:
+            self.assertNotRegexpMatches(
+                line, r'broken|many|garbage|^\{',
+                'Unparsable line kept: "{0}"'.format(line))
+
+    def test_07_write_failure(self):
+        """Failures don't reach the hook"""
+        metrics = self.getMetrics()
+        metrics.get_samples = lambda: 1 / 0
+        metrics.write()
+        metrics = Metrics(os.path.join(self.workdir, 'none', 'x.prom'))
+        metrics.write()
+        self.assertFalse(os.path.exists(self.path))
+
+# Allow manual execution of tests.
+if __name__=='__main__':
+    for tclass in [TestMetrics]:
+        suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
+        unittest.TextTestRunner(verbosity=2).run(suite)
+
+########################### end of file ##############################
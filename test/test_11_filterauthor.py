@@ -106,6 +106,78 @@ class TestFilterAuthor1(HookTestCase):
         self.assertRegexpMatches(
             errstr, r'Commits not allowed by ReadOnly')
 
+    def test_05_preload(self):
+        """Preloaded top-level filter data."""
+        # Define the hook configuration. The author and log message
+        # are fetched side by side. The change list isn't preloaded.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterLogMsg>
+              <LogMsgRegex>^WIP</LogMsgRegex>
+              <SendError>Work in progress.</SendError>
+            </FilterLogMsg>
+            <FilterAuthor>
+              <AuthorRegex>ReadOnly</AuthorRegex>
+              <SendError>Commits not allowed by ReadOnly</SendError>
+            </FilterAuthor>
+            <FilterCommitList>
+              <PathRegex>\.tmp$</PathRegex>
+              <SendError>No temporary files.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Apply a working copy change.
+        self.addWcFile('fileA.txt')
+
+        # Commit the change as an allowed author.
+        p = self.commitWc('Fixed it.')
+
+        # Check for success.
+        self.assertEqual(
+            p.returncode, 0,
+            'Exit code not zero: {0}'.format(p.returncode))
+
+        # Check that only the author and log message were preloaded.
+        self.assertLogRegexp(
+            'pre-commit', r'Statistics: .*preloads=2',
+            'Author and log message not preloaded')
+
+    def test_06_gated_author(self):
+        """Author not fetched behind a mismatch."""
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterLogMsg>
+              <LogMsgRegex>^WIP</LogMsgRegex>
+              <FilterAuthor>
+                <AuthorRegex>ReadOnly</AuthorRegex>
+                <SendError>Commits not allowed by ReadOnly</SendError>
+              </FilterAuthor>
+            </FilterLogMsg>
+          </Actions>
+          ''')
+
+        # Apply a working copy change.
+        self.addWcFile('fileA.txt')
+
+        # Commit the change as the blocked author, but without the
+        # blocked log message.
+        p = self.commitWc('Fixed it.', username='ReadOnly')
+
+        # Check for success.
+        self.assertEqual(
+            p.returncode, 0,
+            'Exit code not zero: {0}'.format(p.returncode))
+
+        # Check that the author wasn't fetched.
+        with open(self.getHookLog('pre-commit')) as f:
+            self.assertNotRegexpMatches(
+                f.read(), r"Execute: \['svnlook', 'author'",
+                'Author fetched for a skipped filter')
+
 class TestFilterAuthor2(SmtpTestCase):
     """Post-Commit Tests"""
 
@@ -10,6 +10,7 @@ mylib = os.path.normpath(os.path.join(
 if os.path.isdir(mylib): sys.path.insert(0, mylib)
 
 from test.base import HookTestCase, SmtpTestCase
+from svnhook.contexts import ChangeIndex, ChangeItem
 
 class TestFilterCommitList(HookTestCase):
     """Pre-Commit (Non-SMTP) Tests"""
@@ -274,6 +275,330 @@ class TestFilterCommitList(HookTestCase):
             p.stderr.read(), r'(?s)^\s*$',
             'Unexpected error message returned')
 
+    def test_12_prefix_match(self):
+        """Anchored folder prefix match"""
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>^folderA2/.+\.txt$</PathRegex>
+              <SendError>${Path} not allowed.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add working copy changes in and out of the folder.
+        self.addWcFolder('folderA1')
+        self.addWcFile('folderA1/fileA1.txt')
+        self.addWcFolder('folderA2')
+        self.addWcFile('folderA2/fileA2.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the proper error is indicated.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'folderA2/fileA2\.txt not allowed',
+            'Expected error message not returned')
+
+    def test_13_prefix_mismatch(self):
+        """Anchored folder prefix mismatch"""
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>^folderA2/.+\.txt$</PathRegex>
+              <SendError>${Path} not allowed.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add working copy changes outside of the folder.
+        self.addWcFolder('folderA1')
+        self.addWcFile('folderA1/fileA2.txt')
+        self.addWcFile('folderA2.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error isn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that an error message isn't returned.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'(?s)^\s*$',
+            'Unexpected error message returned')
+
+    def test_14_columnar_match(self):
+        """Columnar change type and prefix match"""
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList columnar="true">
+              <ChgTypeRegex>^A</ChgTypeRegex>
+              <PathRegex>^folderA2/.+\.txt$</PathRegex>
+              <SendError>${ChgType} ${Path} not allowed.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add working copy changes in and out of the folder.
+        self.addWcFolder('folderA1')
+        self.addWcFile('folderA1/fileA1.txt')
+        self.addWcFolder('folderA2')
+        self.addWcFile('folderA2/fileA2.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the proper error is indicated.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'A +folderA2/fileA2\.txt not allowed',
+            'Expected error message not returned')
+
+    def test_16_first_line_copy(self):
+        """Copy as the first change line"""
+        # Commit the copy source.
+        self.addWcFile('fileA1.txt')
+        p = self.commitWc()
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <ChgTypeRegex>^A \+$</ChgTypeRegex>
+              <PathRegex>^fileA2\.txt$</PathRegex>
+              <SendError>Copied ${Path} from ${CopyFromPath}.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Copy the file. It's the only change, so the first change
+        # line has the copy flag.
+        self.cpWcItem('fileA1.txt', 'fileA2.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the path was separated from the copy flag.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Copied fileA2\.txt from /?fileA1\.txt\.',
+            'Expected error message not returned')
+
+    def test_17_abandoned_listing(self):
+        """Full change list after an early stop"""
+        # Define the hook configuration. The first filter stops at
+        # its first match. The second one must still see every
+        # change.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList matchFirst="true">
+              <PathRegex>fileA</PathRegex>
+            </FilterCommitList>
+            <FilterCommitList>
+              <PathRegex>fileA3\.txt$</PathRegex>
+              <SendError>Found ${Path}.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add working copy changes.
+        self.addWcFile('fileA1.txt')
+        self.addWcFile('fileA2.txt')
+        self.addWcFile('fileA3.txt')
+
+        # Attempt to commit the changes.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the second filter found its change.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Found fileA3\.txt\.',
+            'Expected error message not returned')
+
+    def test_18_loop_token_scope(self):
+        """Tokens set within the loop outlive it"""
+        # Define the hook configuration. The change tokens are only
+        # set within the loop, but the flag token must remain, and
+        # the change type token must be left unexpanded.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>fileA2\.txt$</PathRegex>
+              <SetToken name="Flagged">yes</SetToken>
+            </FilterCommitList>
+            <SendError>Flagged ${Flagged}, type "${ChgType}".</SendError>
+          </Actions>
+          ''')
+
+        # Add working copy changes.
+        self.addWcFile('fileA1.txt')
+        self.addWcFile('fileA2.txt')
+
+        # Attempt to commit the changes.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that only the loop token was dropped.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Flagged yes, type "\$\{ChgType\}"\.',
+            'Expected error message not returned')
+
+    def test_19_invariant_reuse(self):
+        """Loop-invariant filter constructed once"""
+        # Define the hook configuration. The log message filter
+        # doesn't depend on the path, so it's only constructed for
+        # the first change, and reused for the rest.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>fileA</PathRegex>
+              <FilterLogMsg>
+                <LogMsgRegex>^Fixed</LogMsgRegex>
+                <FilterPath>
+                  <PathRegex>fileA3\.txt$</PathRegex>
+                  <SendError>Fixed ${Path}.</SendError>
+                </FilterPath>
+              </FilterLogMsg>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add working copy changes.
+        self.addWcFile('fileA1.txt')
+        self.addWcFile('fileA2.txt')
+        self.addWcFile('fileA3.txt')
+
+        # Attempt to commit the changes.
+        p = self.commitWc('Fixed it.')
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the reused filter still matched the last change.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Fixed /?fileA3\.txt\.',
+            'Expected error message not returned')
+
+        # Verify that the filter was reused.
+        self.assertLogRegexp(
+            'pre-commit', r'Statistics: .*filters_reused=2',
+            'Invariant filter not reused')
+
+class TestChangeItem(unittest.TestCase):
+    """Change Line Parsing Tests"""
+
+    def test_01_first_line_copy(self):
+        """Copy flag on the first change line"""
+        changes = ChangeItem.parse(
+            'A + trunk/b.txt\n'
+            '    (from trunk/a.txt:r4)\n'
+            'U   trunk/c.txt\n')
+        self.assertEqual(
+            [(item.type, item.path) for item in changes],
+            [('A +', 'trunk/b.txt'), ('U  ', 'trunk/c.txt')])
+        self.assertEqual(changes[0].source, ('trunk/a.txt', '4'))
+        self.assertEqual(changes[1].source, None)
+
+    def test_02_flags(self):
+        """Change flag bits"""
+        checks = [
+            ('A  ', ChangeItem.ADD),
+            ('A +', ChangeItem.ADD | ChangeItem.COPY),
+            ('D  ', ChangeItem.DELETE),
+            ('U  ', ChangeItem.UPDATE_CONTENT),
+            ('UU ', ChangeItem.UPDATE_CONTENT
+                    | ChangeItem.UPDATE_PROPERTY),
+            ('_U ', ChangeItem.UPDATE_PROPERTY
+                    | ChangeItem.PROPERTY_ONLY)]
+        for chgtype, flags in checks:
+            item = ChangeItem(chgtype + ' trunk/a.txt', 4)
+            self.assertEqual(item.flags, flags, chgtype)
+
+        # The checks use the same bits.
+        item = ChangeItem('_U  trunk/a.txt', 4)
+        self.assertTrue(item.is_update())
+        self.assertTrue(item.is_update_property())
+        self.assertFalse(item.is_update_content())
+        item = ChangeItem('A + trunk/a.txt', 4)
+        self.assertTrue(item.is_add())
+        self.assertTrue(item.is_copy())
+        self.assertFalse(item.is_delete())
+
+class TestChangeIndex(unittest.TestCase):
+    """Change Path Index Tests"""
+
+    def setUp(self):
+        self.index = ChangeIndex(ChangeItem.parse(
+            'U   trunk/b.txt\n'
+            'A   branches/x/\n'
+            'U   top.txt\n'
+            'U   trunk.txt\n'
+            'A   trunk/a/\n'
+            'U   tags/1.0/a.txt\n'
+            'U   trunk/a/c.txt\n'))
+
+    def test_01_under_prefix(self):
+        """Changes under a prefix, in listed order"""
+        self.assertEqual(
+            [item.path for item in self.index.get_under('trunk/')],
+            ['trunk/b.txt', 'trunk/a/', 'trunk/a/c.txt'])
+        self.assertEqual(
+            [item.path for item in self.index.get_under('trunk')],
+            ['trunk/b.txt', 'trunk.txt', 'trunk/a/', 'trunk/a/c.txt'])
+        self.assertEqual(self.index.get_under('vendor/'), [])
+
+    def test_02_top_folders(self):
+        """Top-level folders touched"""
+        self.assertEqual(self.index.get_top_folders(),
+                         ['branches/', 'tags/', 'trunk/'])
+        self.assertEqual(ChangeIndex([]).get_top_folders(), [])
+
 class TestFilterCommitList2(SmtpTestCase):
     """Post-Commit (SMTP) Tests"""
 
@@ -314,6 +639,60 @@ class TestFilterCommitList2(SmtpTestCase):
             p.stdout.read(), r'Now you did it',
             'Expected advisory message not returned')
 
+    def test_15_txn_handoff(self):
+        """Transaction change list reused after commit"""
+        # Define the hook configurations. The pre-commit hook reads
+        # the change list without blocking the commit.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>^nomatch$</PathRegex>
+              <SendError>Unexpected match.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+        self.writeConf('post-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>^fileA1\.txt$</PathRegex>
+              <SendError>Handed off ${Path}.</SendError>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Share the transaction data between the hooks.
+        self.addHookArgs('pre-commit', '--cachedir=cache')
+        self.addHookArgs('post-commit', '"$3"', '--cachedir=cache')
+
+        # Add a working copy change.
+        self.addWcFile('fileA1.txt')
+
+        # Commit the change.
+        p = self.commitWc()
+
+        # Verify that an error isn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the post-commit hook saw the change.
+        self.assertRegexpMatches(
+            p.stdout.read(), r'Handed off fileA1\.txt',
+            'Expected advisory message not returned')
+
+        # Verify that the post-commit hook took over the transaction
+        # data, and didn't ask svnlook for the change list again.
+        self.assertLogRegexp(
+            'post-commit', r'Adopted context of transaction',
+            'Transaction data not adopted by post-commit')
+        with open(self.getHookLog('post-commit')) as f:
+            self.assertNotRegexpMatches(
+                f.read(), r"Execute: \['svnlook', 'changed'",
+                'Change list fetched again by post-commit')
+
     def test_10_match_first(self):
         """Trigger only once"""
         # Define the message parameters.
@@ -419,7 +798,8 @@ class TestFilterCommitList2(SmtpTestCase):
 
 # Allow manual execution of tests.
 if __name__=='__main__':
-    for tclass in [TestFilterCommitList, TestFilterCommitList2]:
+    for tclass in [TestFilterCommitList, TestChangeItem,
+                   TestChangeIndex, TestFilterCommitList2]:
         suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
         unittest.TextTestRunner(verbosity=2).run(suite)
 
@@ -2,14 +2,15 @@
 ######################################################################
 # Test File Content Filter
 ######################################################################
-import os, re, sys, unittest
+import os, re, sys, tempfile, unittest
 
 # Prefer local modules.
 mylib = os.path.normpath(os.path.join(
         os.path.dirname(__file__), '..'))
 if os.path.isdir(mylib): sys.path.insert(0, mylib)
 
-from test.base import HookTestCase
+from test.base import HookTestCase, rmtree
+from svnhook.caches import ScanCache
 
 class TestFilterFileContent(HookTestCase):
     """File Content Filter Tests"""
@@ -233,9 +234,513 @@ class TestFilterFileContent(HookTestCase):
             p.stderr.read(), r'This is evil',
             'Expected error message not found')
 
+    def test_07_prefetch(self):
+        """Background content fetches"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList prefetch="4">
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent>
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add several files. Only one of them matches.
+        for index in range(1, 10):
+            self.addWcFile('fileA{0}.txt'.format(index),
+                           'Hello.\n' * index)
+        self.addWcFile('fileB1.txt', 'Boo.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message names the matching file.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileB1\.txt is scary',
+            'Expected error message not found')
+
+    def test_08_property_change_skip(self):
+        """Skip unchanged content of property change"""
+
+        # Commit a matching file, before the content is checked.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions />
+          ''')
+        self.addWcFile('fileA1.txt', 'Boo.\n')
+        p = self.commitWc()
+        self.assertEqual(p.returncode, 0, 'Initial commit failed')
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent>
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Only change a property of the file.
+        self.setWcProperty('someProp', 'someValue', 'fileA1.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that the unchanged content is ignored.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+    def test_09_property_change_full_scan(self):
+        """Scan unchanged content when requested"""
+
+        # Commit a matching file, before the content is checked.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions />
+          ''')
+        self.addWcFile('fileA1.txt', 'Boo.\n')
+        p = self.commitWc()
+        self.assertEqual(p.returncode, 0, 'Initial commit failed')
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent fullScan="true">
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Only change a property of the file.
+        self.setWcProperty('someProp', 'someValue', 'fileA1.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message names the matching file.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileA1\.txt is scary',
+            'Expected error message not found')
+
+    def test_10_max_bytes(self):
+        """Skip files over the size limit"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent maxBytes="100">
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a large and a small matching file.
+        self.addWcFile('fileA1.txt', 'Boo.\n' * 100)
+        self.addWcFile('fileA2.txt', 'Boo.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that only the small file is reported.
+        errstr = p.stderr.read()
+        self.assertRegexpMatches(
+            errstr, r'fileA2\.txt is scary',
+            'Expected error message not found')
+        self.assertNotRegexpMatches(
+            errstr, r'fileA1\.txt',
+            'Large file was scanned')
+
+    def test_11_skip_binary(self):
+        """Skip binary files"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent skipBinary="true">
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a binary matching file.
+        self.addWcFile('fileA1.dat', 'Boo.\x00\x01\x02')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that the binary file is ignored.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+    def test_12_scan_processes(self):
+        """Content scans in worker processes"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList scanProcesses="2">
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent>
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add several files. Only one of them matches.
+        for index in range(1, 10):
+            self.addWcFile('fileA{0}.txt'.format(index),
+                           'Hello.\n' * index)
+        self.addWcFile('fileB1.txt', 'Boo.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message names the matching file.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileB1\.txt is scary',
+            'Expected error message not found')
+
+    def test_13_reorder_filters(self):
+        """Reordered path and content checks"""
+
+        # Define the hook configuration. The path check should be
+        # moved ahead of the content check.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions reorderFilters="true">
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent>
+                <ContentRegex>Boo</ContentRegex>
+                <FilterPath>
+                  <PathRegex>B</PathRegex>
+                  <SendError>${Path} is scary.</SendError>
+                </FilterPath>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add files that only pass one of the checks, or both.
+        self.addWcFile('fileA1.txt', 'Boo.\n')
+        self.addWcFile('fileB1.txt', 'Hello.\n')
+        self.addWcFile('fileB2.txt', 'Boo.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message names the file that passed
+        # both checks.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileB2\.txt is scary',
+            'Expected error message not found')
+
+    def test_14_scan_cache(self):
+        """Cached content scan result"""
+
+        # Define the hook configuration. Keep the scan results.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent>
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+        self.addHookArgs('pre-commit', '--cachedir=cache')
+
+        # Add a matching file.
+        self.addWcFile('fileA1.txt', 'Boo.\n')
+
+        # Attempt to commit the change, twice. Only keep the hook log
+        # of the second attempt.
+        p = self.commitWc()
+        open(self.getHookLog('pre-commit'), 'w').close()
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message names the matching file.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileA1\.txt is scary',
+            'Expected error message not found')
+
+        # Verify that the cached result was used, without reading the
+        # content again.
+        self.assertLogRegexp(
+            'pre-commit', r'Using cached content scan result',
+            'Cached scan result not used')
+        with open(self.getHookLog('pre-commit')) as f:
+            self.assertNotRegexpMatches(
+                f.read(), r"Execute: \['svnlook', 'cat'",
+                'Content read again')
+
+    def test_15_copy_skip(self):
+        """Skip unchanged content of copy"""
+
+        # Commit a matching file, before the content is checked.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions />
+          ''')
+        self.addWcFile('fileA1.txt', 'Boo.\n')
+        p = self.commitWc()
+        self.assertEqual(p.returncode, 0, 'Initial commit failed')
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent>
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Copy the file, without changing it.
+        self.cpWcItem('fileA1.txt', 'fileA2.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that the unchanged content is ignored.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+        self.assertLogRegexp(
+            'pre-commit', r'Skipped unchanged copy content',
+            'Copy content not skipped')
+
+        # Copy the file again, and change the copy.
+        self.cpWcItem('fileA1.txt', 'fileA3.txt')
+        self.makeWcFile('fileA3.txt', 'Boo. Boo.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that the changed content is checked.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileA3\.txt is scary',
+            'Expected error message not found')
+
+    def test_16_skip_binary_trimmed(self):
+        """Trimmed text content with binary check"""
+
+        # Define the hook configuration. The expression only matches
+        # content without the trailing line break.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent skipBinary="true">
+                <ContentRegex>Boo\.\Z</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a text matching file.
+        self.addWcFile('fileA1.txt', 'Boo.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that the content is checked like any other.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileA1\.txt is scary',
+            'Expected error message not found')
+
+    def test_17_spanning_commit(self):
+        """Stored content keys without listing the repository"""
+
+        # Define the hook configuration. Keep the scan results.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileContent>
+                <ContentRegex>Boo</ContentRegex>
+                <SendError>${Path} is scary.</SendError>
+              </FilterFileContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+        self.addHookArgs('pre-commit', '--cachedir=cache')
+
+        # Add matching files to both top-level folders, so that the
+        # common folder of the changes is the repository root.
+        self.addWcFolder('trunk')
+        self.addWcFile('trunk/fileA1.txt', 'Boo.\n')
+        self.addWcFolder('branches')
+        self.addWcFile('branches/fileA2.txt', 'Boo.\n')
+
+        # Attempt to commit the change, twice. Only keep the hook log
+        # of the second attempt.
+        p = self.commitWc()
+        open(self.getHookLog('pre-commit'), 'w').close()
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the cached result was used, without listing any
+        # paths.
+        self.assertLogRegexp(
+            'pre-commit', r'Using cached content scan result',
+            'Cached scan result not used')
+        with open(self.getHookLog('pre-commit')) as f:
+            self.assertNotRegexpMatches(
+                f.read(), r"Execute: \['svnlook', 'tree'",
+                'Repository paths listed')
+
+class TestScanCache(unittest.TestCase):
+    """Content Scan Result Cache Tests"""
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.cachedir)
+
+    def test_01_read_through(self):
+        """Result kept between cache connections"""
+        cache = ScanCache(self.cachedir)
+        self.assertEqual(cache.get('abc'), None)
+        cache.put('abc', True)
+        cache.put('def', False)
+        cache.close()
+
+        cache = ScanCache(self.cachedir)
+        self.assertEqual(cache.get('abc'), True)
+        self.assertEqual(cache.get('def'), False)
+        cache.close()
+
+    def test_02_evict_by_bytes(self):
+        """Least recently used entries dropped on close"""
+        cache = ScanCache(self.cachedir)
+        cache.maxbytes = 3 * (10 + cache.entrybytes)
+        for index in range(5):
+            cache.put('key{0:07d}'.format(index), True)
+        cache.get('key0000000')
+        cache.close()
+
+        cache = ScanCache(self.cachedir)
+        self.assertEqual(cache.get('key0000000'), True)
+        self.assertEqual(cache.get('key0000001'), None)
+        self.assertEqual(cache.get('key0000002'), None)
+        self.assertEqual(cache.get('key0000004'), True)
+        cache.close()
+
+    def test_03_evict_period(self):
+        """Eviction checked at most once per period"""
+        cache = ScanCache(self.cachedir)
+        cache.put('key0000000', True)
+        cache.close()
+
+        # The limit is exceeded, but it was just checked.
+        cache = ScanCache(self.cachedir)
+        cache.maxbytes = 0
+        cache.put('key0000001', True)
+        cache.close()
+
+        cache = ScanCache(self.cachedir)
+        self.assertEqual(cache.get('key0000000'), True)
+        self.assertEqual(cache.get('key0000001'), True)
+        cache.close()
+
 # Allow manual execution of tests.
 if __name__=='__main__':
-    for tclass in [TestFilterFileContent]:
+    for tclass in [TestFilterFileContent, TestScanCache]:
         suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
         unittest.TextTestRunner(verbosity=2).run(suite)
 
@@ -114,6 +114,39 @@ class TestFilterPath(HookTestCase):
             'Success exit code not found:'\
                 ' exit code = {0}'.format(p.returncode))
 
+    def test_04_mismatch_sibling(self):
+        """Path mismatch followed by another action."""
+
+        # Define the hook configuration.
+        self.writeConf('pre-lock.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterPath>
+              <PathRegex>B1</PathRegex>
+              <SendError>Path not allowed.</SendError>
+            </FilterPath>
+            <SendError>Lock not allowed.</SendError>
+          </Actions>
+          ''')
+
+        # Call the script.
+        p = self.callHook(
+            'pre-lock', self.repopath, '/fileA1.txt',
+            self.username, 'All mine.', 0)
+        (stdoutdata, stderrdata) = p.communicate()
+        p.wait()
+
+        # Verify that the following action still ran.
+        self.assertRegexpMatches(
+            stderrdata, r'Lock not allowed',
+            'Expected error message not found')
+
+        # Verify a failure is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
 # Allow manual execution of tests.
 if __name__=='__main__':
     for tclass in [TestFilterPath]:
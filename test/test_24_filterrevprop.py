@@ -2,14 +2,15 @@
 ######################################################################
 # Test Revision Property Filter
 ######################################################################
-import os, re, sys, unittest, time
+import os, re, sys, tempfile, unittest, time
 
 # Prefer local modules.
 mylib = os.path.normpath(os.path.join(
         os.path.dirname(__file__), '..'))
 if os.path.isdir(mylib): sys.path.insert(0, mylib)
 
-from test.base import HookTestCase
+from test.base import HookTestCase, rmtree
+from svnhook.caches import RevisionCache
 
 class TestFilterRevProp(HookTestCase):
     """Pre-RevProp-Change Property Filter Tests"""
@@ -225,9 +226,111 @@ class TestFilterRevProp(HookTestCase):
             p.stderr.read(), r'(?s)^\s*$',
             'Unexpected error message returned')
 
+    def test_08_revision_cache(self):
+        """Cached revision data, but fresh properties"""
+
+        # Define the hook configuration. The log message must be the
+        # one set by the first property change. The post-revprop-change
+        # hook drops the cached one.
+        self.writeConf('pre-revprop-change.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>\.tmp$</PathRegex>
+              <SendError>Temporary files committed.</SendError>
+            </FilterCommitList>
+            <FilterLogMsg>
+              <LogMsgRegex>^Second$</LogMsgRegex>
+              <SendError>Log message is ${LogMsg}.</SendError>
+            </FilterLogMsg>
+          </Actions>
+          ''')
+        self.addHookArgs('pre-revprop-change', '--cachedir=cache')
+        self.addHookArgs('post-revprop-change', '--cachedir=cache')
+
+        # Change the log message twice.
+        p = self.setRevProperty(1, 'svn:log', 'Second')
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+        p = self.setRevProperty(1, 'svn:log', 'Third')
+
+        # Verify that the changed log message was seen.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Log message is Second\.',
+            'Expected error message not returned')
+
+        # Verify that the change list was still cached.
+        with open(self.getHookLog('pre-revprop-change')) as f:
+            logtext = f.read()
+        self.assertRegexpMatches(
+            logtext, r"Adopted cached data of revision 1: \['changes'\]",
+            'Revision cache not used')
+        self.assertEqual(
+            len(re.findall(r"Execute: \['svnlook', 'changed'", logtext)),
+            1, 'Change list not fetched exactly once')
+
+class TestRevisionCache(unittest.TestCase):
+    """Revision Cache Tests"""
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.cache = RevisionCache(self.cachedir)
+
+    def tearDown(self):
+        self.cache.close()
+        rmtree(self.cachedir)
+
+    def test_01_read_through(self):
+        """Revision data read back"""
+        data = {'changes': ['A   fileA1.txt'], 'author': 'user',
+                'logmsg': 'Fixed it.', 'logs': {False: 'r5 | user'}}
+        self.cache.put(5, data)
+        self.assertEqual(self.cache.get(5), data)
+        self.assertEqual(self.cache.get(6), {})
+
+    def test_02_insert_only(self):
+        """Cached entries kept as they are"""
+        self.cache.put(5, {'filesizes': {'fileA1.txt': 3}})
+        self.cache.put(5, {'filesizes': {'fileA1.txt': 3,
+                                         'fileA2.txt': 4},
+                           'properties': {}})
+        self.assertEqual(self.cache.get(5),
+                         {'filesizes': {'fileA1.txt': 3},
+                          'properties': {}})
+
+    def test_03_evict(self):
+        """Least recently used revisions dropped"""
+        self.cache.put(5, {'changes': ['A   fileA1.txt']})
+        self.cache.maxbytes = self.cache.db.execute(
+            'SELECT size FROM revisions').fetchone()[0]
+        time.sleep(0.01)
+        self.cache.put(6, {'changes': ['A   fileA2.txt']})
+        self.assertEqual(self.cache.get(5), {})
+        self.assertEqual(self.cache.get(6),
+                         {'changes': ['A   fileA2.txt']})
+
+    def test_04_drop_revprops(self):
+        """Revision property entries dropped"""
+        self.cache.put(5, {'changes': ['A   fileA1.txt'],
+                           'author': 'user', 'logmsg': 'Fixed it.',
+                           'logs': {False: 'r5 | user'}})
+        self.cache.put(6, {'logmsg': 'Other.'})
+        self.cache.drop_revprops(5)
+        self.assertEqual(self.cache.get(5),
+                         {'changes': ['A   fileA1.txt']})
+        self.cache.put(5, {'logmsg': 'Fixed it again.'})
+        self.assertEqual(self.cache.get(5)['logmsg'], 'Fixed it again.')
+        self.assertEqual(self.cache.get(6), {'logmsg': 'Other.'})
+
 # Allow manual execution of tests.
 if __name__=='__main__':
-    for tclass in [TestFilterRevProp]:
+    for tclass in [TestFilterRevProp, TestRevisionCache]:
         suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
         unittest.TextTestRunner(verbosity=2).run(suite)
 
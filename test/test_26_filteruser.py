@@ -3,6 +3,7 @@
 # Test User Filter
 ######################################################################
 import os, re, sys, unittest
+import xml.etree.ElementTree as ET
 
 # Prefer local modules.
 mylib = os.path.normpath(os.path.join(
@@ -10,6 +11,7 @@ mylib = os.path.normpath(os.path.join(
 if os.path.isdir(mylib): sys.path.insert(0, mylib)
 
 from test.base import HookTestCase
+from svnhook.filters import RegexTag
 
 class TestFilterUser(HookTestCase):
     """User Filter Tests"""
@@ -118,9 +120,218 @@ class TestFilterUser(HookTestCase):
             'Success exit code not found:'\
                 ' exit code = {0}'.format(p.returncode))
 
+    def test_04_literal_list(self):
+        """User not in a literal name list"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-lock.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex sense="false">^(user1|USER2|user3)$</UserRegex>
+              <SendError>Invalid lock user.</SendError>
+            </FilterUser>
+          </Actions>
+          ''')
+
+        # Apply the new lock. The name list is case-insensitive.
+        p = self.lockWcPath('fileA1.txt', user='user2')
+        stdoutdata, stderrdata = p.communicate()
+
+        # Verify that an error message wasn't produced.
+        self.assertRegexpMatches(
+            stderrdata, r'(?s)^\s*$',
+            'Unexpected error message found')
+
+        # Verify that an error wasn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+    def test_05_risky_regex(self):
+        """User regex with nested repeats"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-lock.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex seconds="5" onTimeout="log">^(x+)+y$</UserRegex>
+              <SendError>Invalid lock user.</SendError>
+            </FilterUser>
+          </Actions>
+          ''')
+
+        # Apply the new lock.
+        p = self.lockWcPath('fileA1.txt', user='user2')
+        stdoutdata, stderrdata = p.communicate()
+
+        # Verify that an error wasn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the expression was flagged.
+        self.assertLogRegexp(
+            'pre-lock', r'UserRegex may backtrack excessively',
+            'Expected warning not found in hook log')
+
+    def test_06_gated_lock_owner(self):
+        """Lock owner not fetched behind a mismatch"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-lock.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex>^nobody$</UserRegex>
+              <FilterLockOwner>
+                <SendError>Lock owner checked.</SendError>
+              </FilterLockOwner>
+            </FilterUser>
+          </Actions>
+          ''')
+
+        # Apply the new lock.
+        p = self.lockWcPath('fileA1.txt', user='user2')
+        stdoutdata, stderrdata = p.communicate()
+
+        # Verify that an error wasn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the lock wasn't looked up.
+        with open(self.getHookLog('pre-lock')) as f:
+            self.assertNotRegexpMatches(
+                f.read(), r"Execute: \['svnlook', 'lock'",
+                'Lock owner fetched for a skipped filter')
+
+    def test_07_shared_lock_owner(self):
+        """Lock owner fetched once for sibling filters"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-lock.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterLockOwner sense="false">
+              <SendError>Locked by ${Owner}.</SendError>
+            </FilterLockOwner>
+            <FilterLockOwner>
+              <SendError>Already locked by you.</SendError>
+            </FilterLockOwner>
+          </Actions>
+          ''')
+
+        # Apply the new lock.
+        p = self.lockWcPath('fileA1.txt', user='user2')
+        stdoutdata, stderrdata = p.communicate()
+
+        # Verify that an error wasn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the lock was only looked up once.
+        with open(self.getHookLog('pre-lock')) as f:
+            logtext = f.read()
+        self.assertEqual(
+            len(re.findall(r"Execute: \['svnlook', 'lock'", logtext)),
+            1, 'Lock owner not fetched exactly once')
+        self.assertRegexpMatches(
+            logtext, r'Statistics: .*fetches_avoided=1',
+            'Avoided fetch not counted')
+
+    def test_08_timeout_reject(self):
+        """User regex timed out and rejected"""
+
+        # Define the hook configuration. The expression takes
+        # exponential time to fail on a long run of x's.
+        self.writeConf('pre-lock.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex seconds="0.5">^(x+)+y$</UserRegex>
+              <SendError>Invalid lock user.</SendError>
+            </FilterUser>
+          </Actions>
+          ''')
+
+        # Apply the new lock.
+        p = self.lockWcPath('fileA1.txt', user='x' * 30)
+        stdoutdata, stderrdata = p.communicate()
+
+        # Verify that an internal error was indicated.
+        self.assertRegexpMatches(
+            stderrdata, r'Internal hook error',
+            'Expected error message not found')
+
+        # Verify that the time out was logged.
+        self.assertLogRegexp(
+            'pre-lock', r'Regular expression timed out',
+            'Expected error not found in hook log')
+
+    def test_09_timeout_accept(self):
+        """User regex timed out and accepted"""
+
+        # Define the hook configuration. Without the time limit, the
+        # user would fail to match, and the error would be sent.
+        self.writeConf('pre-lock.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterUser>
+              <UserRegex sense="false" seconds="0.5"
+                         onTimeout="accept">^(x+)+y$</UserRegex>
+              <SendError>Invalid lock user.</SendError>
+            </FilterUser>
+          </Actions>
+          ''')
+
+        # Apply the new lock.
+        p = self.lockWcPath('fileA1.txt', user='x' * 30)
+        stdoutdata, stderrdata = p.communicate()
+
+        # Verify that an error wasn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message wasn't sent.
+        self.assertNotRegexpMatches(
+            stderrdata, r'Invalid lock user',
+            'Unexpected error message found')
+
+class TestRegexTag(unittest.TestCase):
+    """Literal Expression Tests"""
+
+    def test_01_literals(self):
+        """Literal breakdown of expressions"""
+        self.assertEqual(RegexTag.get_literals(r'^(a|b\.c)$'),
+                         (True, True, ('a', 'b.c')))
+        self.assertEqual(RegexTag.get_literals(r'a\$'),
+                         (False, False, ('a$',)))
+        self.assertEqual(RegexTag.get_literals('^(a|b)$\n'), None)
+        self.assertEqual(RegexTag.get_literals('(a|b)\n'), None)
+        self.assertEqual(RegexTag.get_literals('a\tb'), None)
+
+    def test_02_trailing_line_break(self):
+        """Line break in the tag text left to the regex"""
+        for text in ['^(user1|user2)$&#10;', '(user1|user2)&#10;']:
+            tag = RegexTag(ET.fromstring(
+                    '<UserRegex>{0}</UserRegex>'.format(text)))
+            for user in ['user2', 'user2\n', 'user3\n']:
+                self.assertEqual(tag.search(user),
+                                 tag.regex.search(user) != None,
+                                 '{0!r} on {1!r}'.format(text, user))
+
 # Allow manual execution of tests.
 if __name__=='__main__':
-    for tclass in [TestFilterUser]:
+    for tclass in [TestFilterUser, TestRegexTag]:
         suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
         unittest.TextTestRunner(verbosity=2).run(suite)
 
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+######################################################################
+# Test Diff Content Filter
+######################################################################
+import os, re, sys, unittest
+
+# Prefer local modules.
+mylib = os.path.normpath(os.path.join(
+        os.path.dirname(__file__), '..'))
+if os.path.isdir(mylib): sys.path.insert(0, mylib)
+
+from test.base import HookTestCase
+
+class TestFilterDiffContent(HookTestCase):
+    """Diff Content Filter Tests"""
+
+    def setUp(self):
+        super(TestFilterDiffContent, self).setUp(
+            re.sub(r'^test_?(.+)\.[^\.]+$', r'\1',
+                   os.path.basename(__file__)))
+
+    def commitBaseline(self):
+        """Commit a file before the differences are checked."""
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions />
+          ''')
+        self.addWcFile('fileA1.txt', 'Line one.\nOld TODO.\nLine three.\n')
+        p = self.commitWc()
+        self.assertEqual(p.returncode, 0, 'Initial commit failed')
+
+    def test_01_no_regex(self):
+        """No regex tag"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList> <!-- Need PATH input. -->
+              <PathRegex>.+</PathRegex>
+              <FilterDiffContent>
+                <SendError>Not gonna happen.</SendError>
+              </FilterDiffContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a working copy change.
+        self.addWcFile('fileA1.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the proper error is indicated.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Internal hook error',
+            'Internal error message not returned')
+
+        # Verify that the detailed error is logged.
+        self.assertLogRegexp(
+            'pre-commit', r'\nValueError: Required tag missing',
+            'Expected error not found in hook log')
+
+    def test_02_added_match(self):
+        """Match in added line"""
+        self.commitBaseline()
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterDiffContent>
+                <ContentRegex>TODO\S*</ContentRegex>
+                <SendError>${Path}:${LineNumber}: ${MatchText}</SendError>
+              </FilterDiffContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a line to the file.
+        self.makeWcFile('fileA1.txt',
+                        'Line one.\nOld TODO.\nNew TODO!\nLine three.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message locates the added line.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileA1\.txt:3: TODO!',
+            'Expected error message not found')
+
+    def test_03_unchanged_mismatch(self):
+        """Ignore match in unchanged line"""
+        self.commitBaseline()
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterDiffContent>
+                <ContentRegex>TODO</ContentRegex>
+                <SendError>${Path}:${LineNumber}: ${MatchText}</SendError>
+              </FilterDiffContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Change a line that doesn't match.
+        self.makeWcFile('fileA1.txt',
+                        'Line one.\nOld TODO.\nLine 3.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that the commit succeeded.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+    def test_04_removed_match(self):
+        """Match in removed line"""
+        self.commitBaseline()
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterDiffContent lines="removed">
+                <ContentRegex>TODO</ContentRegex>
+                <SendError>Removed ${MatchText} at ${LineNumber}.</SendError>
+              </FilterDiffContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Remove the matching line.
+        self.makeWcFile('fileA1.txt', 'Line one.\nLine three.\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message locates the removed line.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Removed TODO at 2\.',
+            'Expected error message not found')
+
+    def test_05_false_mismatch(self):
+        """Negative match in added line"""
+        self.commitBaseline()
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterDiffContent>
+                <ContentRegex sense="false">\.$</ContentRegex>
+                <SendError>${LineNumber}: ${MatchText}</SendError>
+              </FilterDiffContent>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a line without a period.
+        self.makeWcFile('fileA1.txt',
+                        'Line one.\nOld TODO.\nLine three.\nFour\n')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the proper error is indicated.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'4: Four',
+            'Expected error message not found')
+
+# Allow manual execution of tests.
+if __name__=='__main__':
+    for tclass in [TestFilterDiffContent]:
+        suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
+        unittest.TextTestRunner(verbosity=2).run(suite)
+
+########################### end of file ##############################
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+######################################################################
+# Test File Size Filter
+######################################################################
+import os, re, sys, unittest
+
+# Prefer local modules.
+mylib = os.path.normpath(os.path.join(
+        os.path.dirname(__file__), '..'))
+if os.path.isdir(mylib): sys.path.insert(0, mylib)
+
+from test.base import HookTestCase
+
+class TestFilterFileSize(HookTestCase):
+    """File Size Filter Tests"""
+
+    def setUp(self):
+        super(TestFilterFileSize, self).setUp(
+            re.sub(r'^test_?(.+)\.[^\.]+$', r'\1',
+                   os.path.basename(__file__)))
+
+    def test_01_no_limit(self):
+        """No size limit attribute"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList> <!-- Need PATH input. -->
+              <PathRegex>.+</PathRegex>
+              <FilterFileSize>
+                <SendError>Not gonna happen.</SendError>
+              </FilterFileSize>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a working copy change.
+        self.addWcFile('fileA1.txt')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the proper error is indicated.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'Internal hook error',
+            'Internal error message not returned')
+
+        # Verify that the detailed error is logged.
+        self.assertLogRegexp(
+            'pre-commit', r'\nValueError: Required attribute missing',
+            'Expected error not found in hook log')
+
+    def test_02_large_match(self):
+        """Reject a large file"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileSize minBytes="100">
+                <SendError>${Path} has ${FileSize} bytes.</SendError>
+              </FilterFileSize>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a large file.
+        self.addWcFile('fileA1.txt', 'Hello.\n' * 20)
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error is indicated.
+        self.assertEqual(
+            p.returncode, 1,
+            'Error exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+        # Verify that the error message includes the size.
+        self.assertRegexpMatches(
+            p.stderr.read(), r'fileA1\.txt has 140 bytes\.',
+            'Expected error message not found')
+
+    def test_03_small_mismatch(self):
+        """Accept a small file"""
+
+        # Define the hook configuration.
+        self.writeConf('pre-commit.xml', '''\
+          <?xml version="1.0"?>
+          <Actions>
+            <FilterCommitList>
+              <PathRegex>.+</PathRegex>
+              <FilterFileSize minBytes="100">
+                <SendError>${Path} has ${FileSize} bytes.</SendError>
+              </FilterFileSize>
+            </FilterCommitList>
+          </Actions>
+          ''')
+
+        # Add a small file and a folder.
+        self.addWcFile('fileA1.txt', 'Hello.\n')
+        self.addWcFolder('folderA2')
+
+        # Attempt to commit the change.
+        p = self.commitWc()
+
+        # Verify that an error isn't indicated.
+        self.assertEqual(
+            p.returncode, 0,
+            'Success exit code not found:'\
+                ' exit code = {0}'.format(p.returncode))
+
+# Allow manual execution of tests.
+if __name__=='__main__':
+    for tclass in [TestFilterFileSize]:
+        suite = unittest.TestLoader().loadTestsFromTestCase(tclass)
+        unittest.TextTestRunner(verbosity=2).run(suite)
+
+########################### end of file ##############################